@@ -0,0 +1,93 @@
+import asyncio
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import httpx
+from fastapi import FastAPI
+from earthquake_exposure import api
+from earthquake_exposure.acquire import get_earthquake_data
+from benchmarks.mock_usgs import MockUSGSServer, make_synthetic_catalog
+
+# load test of /latest_quakes against a local stub of USGS
+# "before" is the old handler (download + iterrows on every request),
+# "after" is the cached service from api.py
+# run from the repo root: python -m benchmarks.bench_api
+
+N_REQUESTS = 200
+CONCURRENCY = 20
+
+def make_old_app(url):
+    old = FastAPI()
+
+    @old.get("/latest_quakes")
+    def get_latest(min_mag: float = 5.0):
+        gdf = get_earthquake_data(days_back=7, min_mag=min_mag, url=url)
+        if gdf.empty:
+            return {"count": 0, "quakes": []}
+        results = []
+        for _, row in gdf.iterrows():
+            results.append({
+                "place": row['place'],
+                "magnitude": row['mag'],
+                "depth_km": row.get('depth_km', 0),
+                "lat": row.geometry.y,
+                "lon": row.geometry.x
+            })
+        return {"count": len(results), "quakes": results}
+
+    return old
+
+async def load_test(app, n_requests=N_REQUESTS, concurrency=CONCURRENCY):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get("/latest_quakes", params={"min_mag": 5.0})
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n_requests)))
+        total = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), n_requests / total
+
+def main():
+    now = pd.Timestamp.now()
+    catalog = make_synthetic_catalog(2000, starttime=now - pd.Timedelta(days=6), endtime=now)
+
+    with MockUSGSServer(catalog, base_latency=0.15) as server:
+        before = asyncio.run(load_test(make_old_app(server.url), n_requests=40))
+
+        # the new service syncs a throwaway catalog and uses synthetic cities
+        rng = np.random.default_rng(0)
+        cities = gpd.GeoDataFrame(
+            {'name': [f'city_{i}' for i in range(1700)], 'country': 'Japan', 'population': 500000},
+            geometry=gpd.points_from_xy(rng.uniform(25, 180, 1700), rng.uniform(-10, 80, 1700)), crs='EPSG:4326'
+        )
+        tmp = tempfile.mkdtemp()
+        api.UPSTREAM_URL = server.url
+        api.CATALOG_PATH = os.path.join(tmp, 'catalog.sqlite')
+        api.EXPOSURE_STATE_PATH = os.path.join(tmp, 'exposure_state.parquet')
+        api.CITY_ARTIFACTS = os.path.join(tmp, 'city_index')
+        api.TILE_CACHE = os.path.join(tmp, 'tiles')
+        api.get_cities = lambda: cities
+        asyncio.run(api.refresh_catalog())
+        after = asyncio.run(load_test(api.app))
+        upstream_calls = len(server.requests)
+
+    print(f"{'':8} | {'p50':>9} | {'p99':>9} | {'req/s':>8}")
+    for name, (p50, p99, rps) in [("before", before), ("after", after)]:
+        print(f"{name:8} | {p50:7.1f}ms | {p99:7.1f}ms | {rps:8.1f}")
+    print(f"upstream requests in total: {upstream_calls}")
+
+if __name__ == "__main__":
+    main()
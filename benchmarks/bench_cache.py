@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+import numpy as np
+import geopandas as gpd
+import shapely
+from earthquake_exposure import acquire
+
+# loading the city and boundary caches: GeoJSON + filtering in pandas (the old
+# caches) vs GeoParquet with the filter pushed into the read
+# run from the repo root: python -m benchmarks.bench_cache
+
+def make_places(n, seed=0):
+    # about the size of Natural Earth populated places
+    rng = np.random.default_rng(seed)
+    return gpd.GeoDataFrame({
+        'NAME': [f'place_{i}' for i in range(n)],
+        'ADM0NAME': rng.choice(acquire.ASIAN_COUNTRIES, n),
+        'POP_MAX': rng.integers(100000, 20000000, n),
+    }, geometry=gpd.points_from_xy(rng.uniform(25, 180, n), rng.uniform(-10, 80, n)), crs='EPSG:4326')
+
+def make_countries(n, vertices=400, seed=0):
+    # wobbly polygons with a few hundred vertices each
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    shapes = []
+    for x, y in zip(rng.uniform(-170, 170, n), rng.uniform(-60, 70, n)):
+        r = rng.uniform(2, 8) * (1 + 0.2 * rng.standard_normal(vertices))
+        shapes.append(shapely.Polygon(np.column_stack([x + r * np.cos(angles), y + r * np.sin(angles)])))
+    names = (acquire.ASIAN_COUNTRIES * (n // len(acquire.ASIAN_COUNTRIES) + 1))[:n]
+    names = [name if i % 4 == 0 else f'Other {i}' for i, name in enumerate(names)]
+    return gpd.GeoDataFrame({'name': names}, geometry=shapes, crs='EPSG:4326')
+
+def best_of(func, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [
+            ("cities", make_places(7000), lambda gdf: gdf[gdf['POP_MAX'] >= 250000],
+             [("POP_MAX", ">=", 250000)]),
+            ("boundaries", make_countries(250), lambda gdf: gdf[gdf['name'].isin(acquire.ASIAN_COUNTRIES)],
+             [("name", "in", acquire.ASIAN_COUNTRIES)]),
+        ]
+        print(f"{'cache':>10} | {'GeoJSON':>9} | {'GeoParquet':>10} | speed-up")
+        for name, gdf, keep, filters in cases:
+            geojson = os.path.join(tmp, f"{name}.json")
+            parquet = os.path.join(tmp, f"{name}.parquet")
+            gdf.to_file(geojson, driver="GeoJSON")
+            acquire.write_geoparquet_cache(gdf, parquet, "bench")
+
+            old = best_of(lambda: keep(gpd.read_file(geojson)))
+            new = best_of(lambda: acquire.read_geoparquet_cache(parquet, "bench", filters))
+            assert len(keep(gdf)) == len(acquire.read_geoparquet_cache(parquet, "bench", filters))
+            print(f"{name:>10} | {old * 1000:7.1f}ms | {new * 1000:8.1f}ms | {old / new:6.1f}x")
+
+if __name__ == "__main__":
+    main()
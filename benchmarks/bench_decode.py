@@ -0,0 +1,39 @@
+import json
+import time
+import numpy as np
+import geopandas as gpd
+from earthquake_exposure import acquire
+from benchmarks.mock_usgs import make_synthetic_catalog, to_geojson
+
+# compares the old from_features + .apply decoding with decode_geojson_features
+# run from the repo root: python -m benchmarks.bench_decode
+
+def old_decode(content):
+    # what get_earthquake_data used to do with a response
+    data = json.loads(content)
+    gdf = gpd.GeoDataFrame.from_features(data["features"])
+    gdf.crs = "EPSG:4326"
+    gdf['depth_km'] = gdf.geometry.apply(lambda p: p.z if p.has_z else 10.0)
+    return gdf
+
+def best_of(func, content, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(content)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    print(f"orjson available: {acquire.orjson is not None}")
+    print(f"{'events':>8} | {'from_features':>14} | {'decoder':>9} | speed-up")
+    for n_events in [1000, 10000, 100000]:
+        catalog = make_synthetic_catalog(n_events)
+        content = json.dumps(to_geojson(catalog, np.arange(n_events))).encode()
+
+        old = best_of(old_decode, content)
+        new = best_of(acquire.decode_geojson_features, content)
+        print(f"{n_events:>8} | {old:13.3f}s | {new:8.3f}s | {old / new:6.1f}x")
+
+if __name__ == "__main__":
+    main()
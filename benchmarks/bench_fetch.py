@@ -0,0 +1,39 @@
+import time
+import requests
+from earthquake_exposure import acquire
+from benchmarks.mock_usgs import MockUSGSServer, make_synthetic_catalog
+
+# compares the old single requests.get against the chunked parallel download
+# run from the repo root: python -m benchmarks.bench_fetch
+
+def single_call(url, params):
+    # what get_earthquake_data used to do
+    response = requests.get(url, params=params)
+    if response.status_code != 200:
+        return None
+    return response.json()["features"]
+
+def main():
+    params = {"format": "geojson", "starttime": "2025-01-01", "endtime": "2025-12-31",
+              "minmagnitude": 4.0, **acquire.ASIA_BBOX}
+
+    print(f"{'events':>8} | {'single call':>18} | {'chunked (8 workers)':>20} | chunks")
+    for n_events in [5000, 15000, 60000]:
+        catalog = make_synthetic_catalog(n_events)
+        with MockUSGSServer(catalog) as server:
+            start = time.perf_counter()
+            features = single_call(server.url, params)
+            single_time = time.perf_counter() - start
+            single = f"{single_time:7.2f}s" if features is not None else "refused (>20000)"
+
+            server.requests.clear()
+            start = time.perf_counter()
+            features = acquire.fetch_earthquake_features(params, url=server.url, max_workers=8)
+            chunked_time = time.perf_counter() - start
+            n_chunks = sum(1 for path, _ in server.requests if path.endswith("/query"))
+
+        assert len(features) == n_events
+        print(f"{n_events:>8} | {single:>18} | {chunked_time:19.2f}s | {n_chunks}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import time
+import numpy as np
+from earthquake_exposure import gmpe
+
+# throughput of every ground motion model over 10M source-site pairs
+# run from the repo root: python -m benchmarks.bench_gmpe
+
+N_PAIRS = 10_000_000
+
+def best_of(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    rng = np.random.default_rng(0)
+    mags = rng.uniform(5.0, 8.0, N_PAIRS)
+    dists = rng.uniform(0, 1500, N_PAIRS)
+    depths = rng.choice([10.0, 35.0, 120.0, 400.0], N_PAIRS)
+    vs30 = rng.uniform(180, 1000, N_PAIRS)
+
+    print(f"{N_PAIRS} pairs, best of 3, million pairs per second in brackets")
+    print(f"{'model':>12} | {'float64':>15} | {'float32':>15} | {'float64 + vs30':>15}")
+    for name in gmpe.GMPES:
+        row = []
+        for dtype, site in [(np.float64, None), (np.float32, None), (np.float64, vs30)]:
+            elapsed = best_of(lambda: gmpe.calculate_pga(mags, dists, depths, vs30=site, gmpe=name, dtype=dtype))
+            row.append(f"{elapsed:6.2f}s ({N_PAIRS / elapsed / 1e6:4.0f})")
+        print(f"{name:>12} | " + " | ".join(row))
+
+if __name__ == "__main__":
+    main()
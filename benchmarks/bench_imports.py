@@ -0,0 +1,121 @@
+import os
+import subprocess
+import sys
+import time
+
+# how long `import earthquake_exposure.x` takes in a fresh interpreter, from
+# python -X importtime, and which heavy libraries it pulls in
+# tests/test_imports.py fails when a module loads a library it shouldn't (a
+# top-level import of geopandas in acquire, say) or takes far longer to start than
+# a bare interpreter (STARTUP_BUDGETS, generous so any machine passes), and with
+# EARTHQUAKE_IMPORT_BUDGETS=1 also when it goes over the tighter BUDGETS
+# both are relative to something measured on the same machine, so a slower CI
+# box doesn't fail them, only a module getting slower compared to its baseline
+# run from the repo root: python -m benchmarks.bench_imports
+
+HEAVY = ('geopandas', 'scipy', 'plotly', 'folium', 'requests', 'pyproj')
+
+# what the budgets are measured against
+REFERENCE = 'pandas'
+
+# module: (times the reference import, heavy libraries it may load)
+# the budgets are a bit over what they take here (acquire 1.1x pandas, the API
+# 2.0x, mostly pandas and fastapi), with every library loaded up front the API took 4.7x
+BUDGETS = {
+    'earthquake_exposure': (0.1, ()),
+    'earthquake_exposure.acquire': (1.5, ()),
+    'earthquake_exposure.catalog': (1.5, ()),
+    'earthquake_exposure.cli': (1.5, ()),
+    'earthquake_exposure.api': (3.0, ()),
+    'earthquake_exposure.viz': (2.0, ('plotly',)),
+}
+
+# module: times the wall clock of `python -c pass`, about 1.5x what they take here
+# (the API is 19x, acquire 11x), the API with every heavy library loaded up front is 31x
+# smaller slips are for the heavy library check and the tighter BUDGETS
+STARTUP_BUDGETS = {
+    'earthquake_exposure': 3,
+    'earthquake_exposure.acquire': 16,
+    'earthquake_exposure.catalog': 16,
+    'earthquake_exposure.cli': 16,
+    'earthquake_exposure.api': 27,
+    'earthquake_exposure.viz': 19,
+}
+
+def startup_seconds(code, repeat=3):
+    # best wall clock of a fresh interpreter running code, interpreter start included
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, env=env)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+def check_startup(budgets=STARTUP_BUDGETS, repeat=3):
+    # modules whose `import` takes longer than their budget times a bare interpreter
+    bare = startup_seconds("pass", repeat)
+    problems = []
+    for module, budget in budgets.items():
+        seconds = startup_seconds(f"import {module}", repeat)
+        if seconds > budget * bare:
+            problems.append(f"{module} starts in {seconds:.3f}s, {seconds / bare:.1f}x a bare interpreter, "
+                            f"budget {budget}x")
+    return problems
+
+def import_times(module):
+    # cumulative seconds of every module loaded while importing module
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, check=True,
+                         env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)})
+    times = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+def measure(module, repeat=3):
+    # best of repeat runs, and the heavy libraries that got imported
+    runs = [import_times(module) for _ in range(repeat)]
+    heavy = sorted({name for name in runs[0] if name.split('.')[0] in HEAVY and '.' not in name})
+    return min(run[module] for run in runs), heavy, runs[0]
+
+def check_budgets(budgets=BUDGETS, repeat=3, times=True):
+    # what is over budget, as messages, empty if everything is fine
+    # times=False only checks the heavy libraries
+    reference = measure(REFERENCE, repeat)[0] if times else None
+    problems = []
+    for module, (budget, allowed) in budgets.items():
+        seconds, heavy, _ = measure(module, repeat)
+        if times and seconds > budget * reference:
+            problems.append(f"{module} takes {seconds:.3f}s to import, {seconds / reference:.2f}x {REFERENCE}, "
+                            f"budget {budget:.2f}x")
+        extra = [name for name in heavy if name not in allowed]
+        if extra:
+            problems.append(f"{module} imports {', '.join(extra)}")
+    return problems
+
+def main():
+    reference = measure(REFERENCE)[0]
+    print(f"import {REFERENCE}: {reference * 1000:.0f}ms\n")
+    print(f"{'module':<30} | {'import':>8} | {'ratio':>6} | {'budget':>6} | heavy libraries")
+    for module, (budget, _) in BUDGETS.items():
+        seconds, heavy, times = measure(module)
+        print(f"{module:<30} | {seconds * 1000:6.0f}ms | {seconds / reference:5.2f}x | {budget:5.2f}x | "
+              f"{', '.join(heavy) or '-'}")
+    # where the time goes for the API, slowest top-level packages first
+    print("\nslowest packages under earthquake_exposure.api:")
+    _, _, times = measure('earthquake_exposure.api', repeat=1)
+    top = sorted(((s, name) for name, s in times.items() if '.' not in name), reverse=True)[:8]
+    for seconds, name in top:
+        print(f"  {name:<28} {seconds * 1000:6.0f}ms")
+    problems = check_startup() + check_budgets()
+    for problem in problems:
+        print("OVER BUDGET:", problem)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,86 @@
+import argparse
+import time
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import folium
+from earthquake_exposure import viz
+
+# folium map build time and HTML size: one CircleMarker per point with a
+# per-city exposure scan (the old map) vs the GeoJSON / cluster / heatmap layers
+# points are split evenly between quakes and cities
+# run from the repo root: python -m benchmarks.bench_map
+
+def make_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    n_quakes, n_cities = n // 2, n - n // 2
+    quakes = gpd.GeoDataFrame({
+        'mag': rng.uniform(5, 8, n_quakes).round(1),
+        'depth_km': rng.uniform(0, 300, n_quakes).round(1),
+        'place': [f'{i} km NE of Somewhere' for i in range(n_quakes)],
+        'time': rng.integers(1.6e12, 1.75e12, n_quakes),
+    }, geometry=gpd.points_from_xy(rng.uniform(60, 150, n_quakes), rng.uniform(-10, 50, n_quakes)), crs='EPSG:4326')
+    cities = gpd.GeoDataFrame({
+        'name': [f'city_{i}' for i in range(n_cities)],
+        'population': rng.integers(100000, 10000000, n_cities),
+    }, geometry=gpd.points_from_xy(rng.uniform(60, 150, n_cities), rng.uniform(-10, 50, n_cities)), crs='EPSG:4326')
+    exposure = pd.DataFrame({
+        'city_name': cities['name'],
+        'max_pga': rng.exponential(0.1, n_cities),
+        'num_earthquakes': rng.integers(0, 50, n_cities),
+    })
+    return cities, quakes, exposure
+
+def legacy_map(cities_gdf, eq_gdf, exposure_df):
+    # the map before the GeoJSON layers, kept here to compare against
+    m = folium.Map(location=[cities_gdf.geometry.y.mean(), cities_gdf.geometry.x.mean()], zoom_start=2,
+                   tiles='CartoDB positron')
+    for _, row in eq_gdf.iterrows():
+        folium.CircleMarker(
+            location=[row.geometry.y, row.geometry.x], radius=row['mag'], color='#FF4B4B', fill=True,
+            fill_color='#FF4B4B',
+            popup=folium.Popup(f"<b>Mag:</b> {row['mag']}<br>Depth: {row['depth_km']} km<br>{row['place']}",
+                               max_width=200)
+        ).add_to(m)
+    for _, row in cities_gdf.iterrows():
+        score_row = exposure_df[exposure_df['city_name'] == row['name']]
+        if not score_row.empty:
+            score = score_row.iloc[0]['max_pga']
+            color = 'blue' if score < 0.1 else 'orange' if score < 0.3 else 'red'
+            folium.CircleMarker(location=[row.geometry.y, row.geometry.x], radius=5 + (score * 50), color=color,
+                                fill=True, popup=f"{row['name']}: {score:.4f}g PGA").add_to(m)
+    return m
+
+def build(make_map):
+    # time to build the map and render its HTML, HTML size in MB
+    start = time.perf_counter()
+    html = make_map().get_root().render()
+    return time.perf_counter() - start, len(html.encode()) / 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-max', type=int, default=10000, help="skip the old map above this many points")
+    args = parser.parse_args()
+    # folium warns about the CartoDB tiles on every map
+    warnings.filterwarnings('ignore', message='CartoDB tiles')
+
+    print(f"{'points':>7} | {'map':>18} | {'build':>8} | {'HTML':>8}")
+    for n in args.sizes:
+        cities, quakes, exposure = make_points(n)
+        modes = [
+            ("old CircleMarkers", lambda: legacy_map(cities, quakes, exposure)),
+            ("GeoJSON", lambda: viz.generate_interactive_map(cities, quakes, exposure, max_markers=n)),
+            ("cluster", lambda: viz.generate_interactive_map(cities, quakes, exposure, max_markers=0)),
+            ("heatmap", lambda: viz.generate_interactive_map(cities, quakes, exposure, max_markers=0,
+                                                             large_mode='heatmap')),
+        ]
+        for name, make_map in modes:
+            if name.startswith("old") and n > args.legacy_max:
+                continue
+            seconds, mb = build(make_map)
+            print(f"{n:>7} | {name:>18} | {seconds:7.2f}s | {mb:6.2f}MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import argparse
+import os
+import time
+import numpy as np
+from earthquake_exposure.exposure import compute_exposure_table
+from earthquake_exposure.parallel import compute_exposure_parallel
+from benchmarks.synthetic import make_cities, make_quakes
+
+# serial batch exposure vs the process pool runner on a synthetic catalog
+# run from the repo root: python -m benchmarks.bench_parallel --quakes 1000000 --cities 50000
+# speed-up is only meaningful with as many free cores as the largest worker count
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quakes', type=int, default=1_000_000)
+    parser.add_argument('--cities', type=int, default=50_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    cities = make_cities(args.cities)
+    quakes = make_quakes(args.quakes)
+    print(f"{args.quakes} quakes x {args.cities} cities, {os.cpu_count()} cores")
+
+    start = time.perf_counter()
+    expected = compute_exposure_table(cities, quakes, metric='greatcircle')
+    serial = time.perf_counter() - start
+    print(f"{'serial':>10} | {serial:8.2f}s")
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        result = compute_exposure_parallel(cities, quakes, metric='greatcircle', max_workers=workers)
+        elapsed = time.perf_counter() - start
+        assert np.allclose(result['max_pga'], expected['max_pga'])
+        print(f"{workers:>3} workers | {elapsed:8.2f}s | {serial / elapsed:5.1f}x")
+
+if __name__ == "__main__":
+    main()
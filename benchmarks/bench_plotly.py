@@ -0,0 +1,41 @@
+import argparse
+import json
+import time
+import numpy as np
+from earthquake_exposure import viz
+from benchmarks.bench_cache import make_countries
+from benchmarks.bench_map import make_points
+
+# plotly map build time and figure json size, every quake drawn vs hexagon bins,
+# and full vs simplified boundaries
+# run from the repo root: python -m benchmarks.bench_plotly
+
+def build(make_figure):
+    start = time.perf_counter()
+    body = viz.figure_to_json(make_figure())
+    return time.perf_counter() - start, len(body) / 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    countries = make_countries(250, vertices=2000)
+    full = sum(len(json.dumps(g.__geo_interface__)) for g in countries.geometry) / 1e6
+    simplified = len(json.dumps(viz.simplify_boundaries(countries, zoom=2.5))) / 1e6
+    print(f"boundaries: {full:.2f}MB as GeoJSON, {simplified:.2f}MB simplified for zoom 2.5")
+
+    print(f"{'quakes':>8} | {'map':>12} | {'build':>8} | {'json':>8}")
+    for n in args.sizes:
+        cities, quakes, exposure = make_points(2 * n)
+        cities, exposure = cities.iloc[:5000], exposure.iloc[:5000]
+        cases = [
+            ("every quake", lambda: viz.generate_plotly_map(cities, quakes, exposure, countries, max_quake_points=np.inf)),
+            ("hexbin", lambda: viz.generate_plotly_map(cities, quakes, exposure, countries, max_quake_points=0)),
+        ]
+        for name, make_figure in cases:
+            seconds, mb = build(make_figure)
+            print(f"{n:>8} | {name:>12} | {seconds:7.2f}s | {mb:6.2f}MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import ast
+import os
+import tempfile
+import time
+import pandas as pd
+from earthquake_exposure.exposure import compute_exposure_table
+from earthquake_exposure.results import read_exposure_parquet, write_exposure_parquet
+from benchmarks.synthetic import make_cities, make_quakes
+
+# the exposure results as the notebook's CSV (top quakes as a python repr per
+# cell, read back with ast.literal_eval) vs the parquet pair from results.py
+# run from the repo root: python -m benchmarks.bench_results
+
+def read_csv(path):
+    results = pd.read_csv(path)
+    results['top_contributing_quakes'] = results['top_contributing_quakes'].map(ast.literal_eval)
+    return results
+
+def best(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+
+def main():
+    print(f"{'cities':>7} | {'csv':>8} | {'parquet':>8} | {'read csv':>9} | {'read parquet':>12} | {'one country':>11}")
+    for n_cities in [1700, 20000]:
+        exposure = compute_exposure_table(make_cities(n_cities), make_quakes(20000), metric='greatcircle')
+        with tempfile.TemporaryDirectory() as tmp:
+            csv = os.path.join(tmp, "results.csv")
+            exposure.to_csv(csv, index=False)
+            folder = os.path.join(tmp, "results")
+            write_exposure_parquet(exposure, folder)
+
+            csv_read = best(lambda: read_csv(csv))
+            parquet_read = best(lambda: read_exposure_parquet(folder))
+            country_read = best(lambda: read_exposure_parquet(folder, country='Japan'))
+            print(f"{n_cities:>7} | {os.path.getsize(csv) / 1e6:6.2f}MB | {folder_size(folder) / 1e6:6.2f}MB | "
+                  f"{csv_read * 1000:7.1f}ms | {parquet_read * 1000:10.1f}ms | {country_read * 1000:9.1f}ms")
+
+if __name__ == "__main__":
+    main()
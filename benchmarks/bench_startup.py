@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import tempfile
+from earthquake_exposure.artifacts import build_city_artifacts
+from benchmarks.synthetic import make_cities
+
+# cold start of the city index: reading the city GeoJSON and building the
+# tree vs opening the memory-mapped artifacts
+# every case runs in a fresh python process so nothing is warm in memory
+# run from the repo root: python -m benchmarks.bench_startup
+
+FROM_GEOJSON = """
+import time, geopandas as gpd
+from earthquake_exposure.impact import CityImpactIndex
+start = time.perf_counter()
+index = CityImpactIndex.from_frame(gpd.read_file({path!r}))
+index.affected_cities(139.7, 35.7, 7.0)
+print(time.perf_counter() - start)
+"""
+
+FROM_ARTIFACTS = """
+import time
+from earthquake_exposure.artifacts import load_city_artifacts
+from earthquake_exposure.impact import CityImpactIndex
+start = time.perf_counter()
+index = CityImpactIndex.from_artifacts(load_city_artifacts({path!r}))
+index.affected_cities(139.7, 35.7, 7.0)
+print(time.perf_counter() - start)
+"""
+
+def run(code):
+    # seconds reported by a fresh interpreter (imports not included)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)})
+    return float(out.stdout.strip().splitlines()[-1])
+
+def main():
+    print(f"{'cities':>8} | {'GeoJSON + tree':>14} | {'artifacts':>9}")
+    for n_cities in [1700, 50000]:
+        cities = make_cities(n_cities)
+        with tempfile.TemporaryDirectory() as tmp:
+            geojson = os.path.join(tmp, "cities.json")
+            cities.to_file(geojson, driver="GeoJSON")
+            build_city_artifacts(cities, os.path.join(tmp, "city_index"))
+
+            old = min(run(FROM_GEOJSON.format(path=geojson)) for _ in range(3))
+            new = min(run(FROM_ARTIFACTS.format(path=os.path.join(tmp, "city_index"))) for _ in range(3))
+        print(f"{n_cities:>8} | {old * 1000:12.1f}ms | {new * 1000:7.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import time
+import numpy as np
+from earthquake_exposure import tiles
+from benchmarks.synthetic import make_quakes
+
+# tile rendering: time per tile by zoom for both layers, a cache hit, and
+# precomputing the low zooms
+# run from the repo root: python -m benchmarks.bench_tiles
+
+def tiles_over(quakes, z, n=8, seed=0):
+    # tiles that have quakes on them at zoom z
+    u, v = tiles.lonlat_to_mercator(quakes.geometry.x.to_numpy(), quakes.geometry.y.to_numpy())
+    picks = np.random.default_rng(seed).choice(len(quakes), n)
+    return [(z, int(u[i] * 2 ** z), int(v[i] * 2 ** z)) for i in picks]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quakes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--zooms', type=int, nargs='+', default=[0, 3, 6, 9])
+    args = parser.parse_args()
+
+    print(f"{'quakes':>8} | {'layer':>8} | {'zoom':>4} | {'render':>9} | {'png':>7}")
+    for n in args.quakes:
+        quakes = make_quakes(n)
+        start = time.perf_counter()
+        renderer = tiles.TileRenderer(quakes)
+        print(f"{n:>8} | setup {(time.perf_counter() - start) * 1000:.0f}ms")
+        for layer in tiles.LAYERS:
+            for z in args.zooms:
+                times, sizes = [], []
+                for _, x, y in tiles_over(quakes, z, n=4):
+                    start = time.perf_counter()
+                    png = renderer.render(layer, z, x, y)
+                    times.append(time.perf_counter() - start)
+                    sizes.append(len(png))
+                print(f"{n:>8} | {layer:>8} | {z:>4} | {np.mean(times) * 1000:7.1f}ms | {np.mean(sizes) / 1000:5.1f}kB")
+
+        renderer.tile('hazard', 3, 6, 3)
+        start = time.perf_counter()
+        for _ in range(1000):
+            renderer.tile('hazard', 3, 6, 3)
+        print(f"{n:>8} | cache hit {(time.perf_counter() - start) * 1000:.1f}us")
+        start = time.perf_counter()
+        count = tiles.precompute_tiles(renderer, max_zoom=2)
+        print(f"{n:>8} | precompute zoom 0-2 ({count} tiles) {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
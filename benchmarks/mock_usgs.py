@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+
+# a local stand-in for the USGS FDSN event service with a synthetic catalog
+# it understands the query parameters acquire.py sends, answers /count and
+# refuses queries above max_allowed events like the real service does
+
+def make_synthetic_catalog(n_events, starttime="2025-01-01", endtime="2025-12-31", seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(starttime).value // 1_000_000
+    end = pd.Timestamp(endtime).value // 1_000_000
+    return {
+        'id': np.array([f"mock{i:08d}" for i in range(n_events)]),
+        'time': np.sort(rng.integers(start, end, n_events)),
+        'lon': rng.uniform(25, 180, n_events).round(4),
+        'lat': rng.uniform(-10, 80, n_events).round(4),
+        'depth': rng.choice([10.0, 35.0, 120.0, 400.0], n_events),
+        'mag': np.minimum(4.0 + rng.exponential(0.45, n_events), 8.5).round(1),
+    }
+
+def to_millis(value):
+    return pd.Timestamp(value).value // 1_000_000
+
+def select_events(catalog, params):
+    keep = np.ones(len(catalog['id']), dtype=bool)
+    if 'starttime' in params:
+        keep &= catalog['time'] >= to_millis(params['starttime'])
+    if 'endtime' in params:
+        keep &= catalog['time'] <= to_millis(params['endtime'])
+    if 'minmagnitude' in params:
+        keep &= catalog['mag'] >= float(params['minmagnitude'])
+    for key, column, op in [('minlatitude', 'lat', np.greater_equal), ('maxlatitude', 'lat', np.less_equal),
+                            ('minlongitude', 'lon', np.greater_equal), ('maxlongitude', 'lon', np.less_equal)]:
+        if key in params:
+            keep &= op(catalog[column], float(params[key]))
+    return np.flatnonzero(keep)
+
+def to_geojson(catalog, idx):
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"mag": float(catalog['mag'][i]), "place": f"Synthetic place {i}",
+                           "time": int(catalog['time'][i]), "updated": int(catalog['time'][i]),
+                           "status": "reviewed", "type": "earthquake", "magType": "mb"},
+            "geometry": {"type": "Point", "coordinates": [float(catalog['lon'][i]), float(catalog['lat'][i]),
+                                                          float(catalog['depth'][i])]},
+            "id": str(catalog['id'][i])
+        }
+        for i in idx.tolist()
+    ]
+    return {"type": "FeatureCollection", "metadata": {"count": len(features)}, "features": features}
+
+class MockUSGSServer:
+    # use as a context manager: with MockUSGSServer(catalog) as server: server.url
+    def __init__(self, catalog, max_allowed=20000, base_latency=0.02, per_event_latency=2e-6):
+        self.catalog = catalog
+        self.max_allowed = max_allowed
+        self.base_latency = base_latency
+        self.per_event_latency = per_event_latency
+        self.requests = []
+
+    def __enter__(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                mock.requests.append((url.path, params))
+                idx = select_events(mock.catalog, params)
+
+                if url.path.endswith("/count"):
+                    self.reply(200, {"count": len(idx), "maxAllowed": mock.max_allowed})
+                elif len(idx) > mock.max_allowed:
+                    self.reply(400, {"error": f"{len(idx)} matching events exceeds search limit of {mock.max_allowed}"})
+                else:
+                    # pretend the server needs time to build big answers
+                    time.sleep(mock.base_latency + mock.per_event_latency * len(idx))
+                    self.reply(200, to_geojson(mock.catalog, idx))
+
+            def reply(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/fdsnws/event/1/query"
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import threading
+import time
+import numpy as np
+from earthquake_exposure import acquire, metrics, preprocess, spatial_index, viz
+from earthquake_exposure.exposure import compute_exposure_table
+from benchmarks.synthetic import make_cities, make_geojson, make_quakes
+
+# times every stage of the pipeline on seeded synthetic data, fully offline
+# results (seconds and peak memory per stage and size) are written as json and
+# compared with a saved baseline, stages that got slower are flagged
+# run from the repo root:
+#   python -m benchmarks.suite                      # small and medium sizes
+#   python -m benchmarks.suite --save-baseline      # remember this run
+#   python -m benchmarks.suite --sizes large huge   # up to 10M events, needs a lot of memory
+# exits with 1 if anything is slower than the baseline
+
+# (events, cities) of every size
+SIZES = {
+    'small': (1_000, 100),
+    'medium': (100_000, 10_000),
+    'large': (1_000_000, 100_000),
+    'huge': (10_000_000, 100_000),
+}
+RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), "results")
+
+def rss_mb():
+    # resident memory of this process right now, peak so far where /proc isn't there
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+class PeakMemory:
+    # highest resident memory while the block runs, sampled from a thread
+    def __init__(self, interval=0.002):
+        self.interval = interval
+
+    def __enter__(self):
+        self.start = self.peak = rss_mb()
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, rss_mb())
+            time.sleep(self.interval)
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+class Inputs:
+    # the data of one size, made the first time a stage asks for it (not timed)
+    def __init__(self, n_events, n_cities, seed=0):
+        self.n_events, self.n_cities, self.seed = n_events, n_cities, seed
+        self.made = {}
+
+    def get(self, name):
+        if name not in self.made:
+            self.made[name] = getattr(self, f"make_{name}")()
+        return self.made[name]
+
+    def make_quakes(self):
+        return make_quakes(self.n_events, seed=self.seed)
+
+    def make_cities(self):
+        return make_cities(self.n_cities, seed=self.seed + 1)
+
+    def make_geojson(self):
+        return make_geojson(self.n_events, seed=self.seed)
+
+    def make_quakes_metric(self):
+        return preprocess.project_to_metric(self.get('quakes'))
+
+    def make_cities_metric(self):
+        return preprocess.project_to_metric(self.get('cities'))
+
+    def make_exposure(self):
+        return compute_exposure_table(self.get('cities'), self.get('quakes'), metric='greatcircle')
+
+def legacy_risk_profiles(inputs):
+    # one city at a time through metrics.calculate_city_risk_profile, like the notebook did
+    cities, quakes = inputs.get('cities_metric'), inputs.get('quakes_metric')
+    tree, coords = spatial_index.build_kdtree(quakes)
+    for _, city in cities.iterrows():
+        nearby = spatial_index.find_earthquakes_with_dynamic_radius(city.geometry, tree, coords, quakes)
+        metrics.calculate_city_risk_profile(city, nearby)
+
+def plotly_map(inputs):
+    fig = viz.generate_plotly_map(inputs.get('cities'), inputs.get('quakes'), inputs.get('exposure'))
+    return viz.figure_to_json(fig)
+
+# name, what it runs, the inputs it needs ready, and the largest (events, cities) it runs at
+# (the decode payload and the per-city loop get too big or too slow above that,
+# the map needs the exposure table, which is only computed up to 1M events)
+STAGES = [
+    ("acquire.decode_geojson_features", lambda d: acquire.decode_geojson_features(d.get('geojson')),
+     ['geojson'], (1_000_000, None)),
+    ("preprocess.project_to_metric", lambda d: preprocess.project_to_metric(d.get('quakes')),
+     ['quakes'], (None, None)),
+    ("spatial_index.build_kdtree", lambda d: spatial_index.build_kdtree(d.get('quakes_metric')),
+     ['quakes_metric'], (None, None)),
+    ("spatial_index.find_city_quake_pairs",
+     lambda d: spatial_index.find_city_quake_pairs(d.get('cities_metric'), d.get('quakes_metric')),
+     ['cities_metric', 'quakes_metric'], (1_000_000, None)),
+    ("metrics.calculate_city_risk_profile", legacy_risk_profiles,
+     ['cities_metric', 'quakes_metric'], (10_000, 1_000)),
+    ("exposure.compute_exposure_table",
+     lambda d: compute_exposure_table(d.get('cities'), d.get('quakes'), metric='greatcircle'),
+     ['cities', 'quakes'], (1_000_000, None)),
+    ("viz.generate_plotly_map", plotly_map, ['cities', 'quakes', 'exposure'], (1_000_000, None)),
+]
+
+def run_stage(func, inputs, repeat):
+    # best time of repeat runs (one run if it takes over a second) and the peak memory
+    # above what the process used before the stage
+    times, peaks = [], []
+    for _ in range(repeat):
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            func(inputs)
+            times.append(time.perf_counter() - start)
+        peaks.append(memory.peak - memory.start)
+        if times[-1] > 1:
+            break
+    return min(times), max(peaks)
+
+def run_suite(sizes, stages=None, repeat=3, seed=0):
+    results = []
+    for size in sizes:
+        n_events, n_cities = SIZES[size]
+        inputs = Inputs(n_events, n_cities, seed=seed)
+        for name, func, needs, (max_events, max_cities) in STAGES:
+            if stages and not any(name.startswith(stage) for stage in stages):
+                continue
+            result = {'stage': name, 'size': size, 'events': n_events, 'cities': n_cities}
+            if (max_events and n_events > max_events) or (max_cities and n_cities > max_cities):
+                result['skipped'] = "too large for this stage"
+            else:
+                for need in needs:
+                    inputs.get(need)
+                result['seconds'], result['peak_rss_mb'] = run_stage(func, inputs, repeat)
+            results.append(result)
+            print(format_result(result), flush=True)
+    return results
+
+def format_result(result):
+    where = f"{result['stage']:<38} {result['events']:>10,} events {result['cities']:>7,} cities"
+    if 'skipped' in result:
+        return f"{where}   skipped ({result['skipped']})"
+    return f"{where} {result['seconds']:9.3f}s {result['peak_rss_mb']:8.1f}MB"
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.01):
+    # stages slower than the baseline by more than tolerance (and min_seconds,
+    # so timer noise on tiny stages isn't flagged)
+    before = {(r['stage'], r['events'], r['cities']): r for r in baseline['results'] if 'seconds' in r}
+    slower = []
+    for result in results:
+        old = before.get((result['stage'], result['events'], result['cities']))
+        if old is None or 'seconds' not in result:
+            continue
+        result['baseline_seconds'] = old['seconds']
+        if result['seconds'] > old['seconds'] * (1 + tolerance) and result['seconds'] - old['seconds'] > min_seconds:
+            slower.append(result)
+    return slower
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['small', 'medium'])
+    parser.add_argument('--stages', nargs='+', help="only stages whose name starts with one of these")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join(RESULTS_FOLDER, "latest.json"))
+    parser.add_argument('--baseline', default=os.path.join(RESULTS_FOLDER, "baseline.json"))
+    parser.add_argument('--save-baseline', action='store_true', help="also save this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slow-down, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, stages=args.stages, repeat=args.repeat, seed=args.seed)
+    report = {'environment': environment(), 'seed': args.seed, 'results': results}
+
+    slower = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f), tolerance=args.tolerance)
+        report['regressions'] = [r['stage'] + f" ({r['size']})" for r in slower]
+        for result in slower:
+            print(f"SLOWER: {result['stage']} ({result['size']}) "
+                  f"{result['baseline_seconds']:.3f}s -> {result['seconds']:.3f}s")
+        if not slower:
+            print(f"no stage slower than {args.baseline} by more than {args.tolerance:.0%}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if slower else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
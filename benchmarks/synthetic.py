@@ -0,0 +1,33 @@
+import json
+import numpy as np
+import geopandas as gpd
+from benchmarks.mock_usgs import make_synthetic_catalog, to_geojson
+
+# seeded synthetic quakes and cities for the benchmarks, nothing is downloaded
+# the same sizes and seeds always give the same data
+
+def make_quakes(n_quakes, seed=0):
+    # a catalog in the shape acquire.get_earthquake_data returns
+    catalog = make_synthetic_catalog(n_quakes, seed=seed)
+    return gpd.GeoDataFrame({
+        'id': catalog['id'],
+        'mag': catalog['mag'],
+        'place': catalog['id'],
+        'time': catalog['time'],
+        'updated': catalog['time'],
+        'depth_km': catalog['depth'],
+    }, geometry=gpd.points_from_xy(catalog['lon'], catalog['lat']), crs='EPSG:4326')
+
+def make_cities(n_cities, seed=1):
+    # cities over the same area as the quakes, in the shape of load_asian_cities
+    rng = np.random.default_rng(seed)
+    return gpd.GeoDataFrame({
+        'name': [f'city_{i}' for i in range(n_cities)],
+        'country': rng.choice(['Japan', 'China', 'India', 'Indonesia'], n_cities),
+        'population': rng.integers(250000, 5000000, n_cities),
+    }, geometry=gpd.points_from_xy(rng.uniform(25, 180, n_cities), rng.uniform(-10, 80, n_cities)), crs='EPSG:4326')
+
+def make_geojson(n_quakes, seed=0):
+    # the raw bytes of a USGS GeoJSON response for the same catalog
+    catalog = make_synthetic_catalog(n_quakes, seed=seed)
+    return json.dumps(to_geojson(catalog, np.arange(n_quakes))).encode()
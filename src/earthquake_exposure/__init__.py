@@ -0,0 +1,17 @@
+import importlib
+
+# the submodules are loaded the first time they are used (PEP 562), so
+# `import earthquake_exposure` is instant and earthquake_exposure.viz only
+# brings in plotly and folium when a map is made
+SUBMODULES = [
+    'acquire', 'api', 'artifacts', 'catalog', 'cli', 'exposure', 'gmpe', 'impact', 'instrument', 'metrics',
+    'parallel', 'population', 'preprocess', 'results', 'rupture', 'simulation', 'spatial_index', 'tiles', 'viz',
+]
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + SUBMODULES)
@@ -1,10 +1,38 @@
-import requests
-import geopandas as gpd
 import pandas as pd
+import numpy as np
+import shapely
+import hashlib
+import json
 import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+from earthquake_exposure import instrument
+
+# geopandas and requests are imported in the functions that use them, the API
+# and the CLI import this module for its settings long before they fetch anything
+
+# orjson parses the USGS responses a lot faster, but plain json works too
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 CACHE_FOLDER = "../data"
 
+USGS_URL = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+
+# FDSN refuses queries that would return more events than this
+MAX_EVENTS_PER_QUERY = 20000
+
+# the part of the world we look at (FDSN parameter names)
+ASIA_BBOX = {
+    "minlatitude": -10,
+    "maxlatitude": 80,
+    "minlongitude": 25,
+    "maxlongitude": 180
+}
+
 # all the countries in Asia for filtering
 ASIAN_COUNTRIES = [
     'Afghanistan', 'Armenia', 'Azerbaijan', 'Bahrain', 'Bangladesh', 
@@ -18,10 +46,184 @@ ASIAN_COUNTRIES = [
     'Uzbekistan', 'Vietnam', 'Yemen', 'Russia'
 ]
 
-def get_earthquake_data(days_back=None, min_mag=5.0, start_date=None, end_date=None):
+# string properties we keep from every USGS feature (numbers are handled separately)
+TEXT_PROPERTIES = ['place', 'status', 'type', 'magType']
+
+def decode_geojson_features(content):
+    # turns a raw USGS GeoJSON response (bytes) straight into a GeoDataFrame
+    # one pass over the features per column, and all the points are made in a
+    # single shapely call instead of from_features + .apply per row
+    import geopandas as gpd
+    features = (orjson.loads(content) if orjson else json.loads(content))["features"]
+    n = len(features)
+
+    props = [f["properties"] for f in features]
+    coords = [f["geometry"]["coordinates"] for f in features]
+
+    columns = {
+        'id': np.array([f["id"] for f in features], dtype=object),
+        'mag': np.array([p.get("mag") for p in props], dtype=float),
+        'time': np.fromiter((p["time"] for p in props), dtype=np.int64, count=n),
+        'updated': np.fromiter((p.get("updated") or p["time"] for p in props), dtype=np.int64, count=n),
+        'sig': np.array([p.get("sig") for p in props], dtype=float),
+        'tsunami': np.fromiter((p.get("tsunami") or 0 for p in props), dtype=np.int8, count=n),
+    }
+    for name in TEXT_PROPERTIES:
+        columns[name] = np.array([p.get(name) for p in props], dtype=object)
+
+    lon = np.fromiter((c[0] for c in coords), dtype=float, count=n)
+    lat = np.fromiter((c[1] for c in coords), dtype=float, count=n)
+    # depth is the third coordinate, 10km if USGS didn't give one
+    depth = np.fromiter(
+        (c[2] if len(c) > 2 and c[2] is not None else 10.0 for c in coords),
+        dtype=float, count=n
+    )
+    columns['depth_km'] = depth
+
+    # drop our references to the parsed json before building the frame
+    del features, props, coords
+    return gpd.GeoDataFrame(columns, geometry=shapely.points(lon, lat, depth), crs="EPSG:4326")
+
+def make_session(max_retries=3, backoff=0.5, pool_size=8):
+    # one pooled session so the chunk requests reuse connections
+    # failed requests (timeouts, 429, 5xx) are retried with exponential backoff
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=["GET"]
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# a window is not split below this, a chunk that small is fetched whatever its count
+MIN_CHUNK_SECONDS = 60
+MIN_CHUNK_DEGREES = 0.01
+
+def utc_now():
+    # USGS times are UTC, so is our "now" (naive, like the times we send)
+    return pd.Timestamp.now(tz='UTC').tz_localize(None)
+
+def count_earthquakes(session, params, url=USGS_URL, timeout=30):
+    # asks the FDSN count endpoint (next to query) how many events a query would return
+    count_url = url.rsplit("/", 1)[0] + "/count"
+    response = session.get(count_url, params={**params, "format": "geojson"}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()["count"]
+
+def split_chunk(params):
+    # splits a query in two: by time while the window is longer than a day,
+    # then by longitude, then by time again down to MIN_CHUNK_SECONDS
+    # returns None when the window is as small as it gets
+    start = pd.Timestamp(params["starttime"])
+    end = pd.Timestamp(params["endtime"])
+    width = params["maxlongitude"] - params["minlongitude"]
+
+    def by_time():
+        middle = (start + (end - start) / 2).isoformat()
+        return [{**params, "endtime": middle}, {**params, "starttime": middle}]
+
+    if end - start > pd.Timedelta(days=1):
+        return by_time()
+    if width > MIN_CHUNK_DEGREES:
+        middle = (params["minlongitude"] + params["maxlongitude"]) / 2
+        return [{**params, "maxlongitude": middle}, {**params, "minlongitude": middle}]
+    if end - start > pd.Timedelta(seconds=MIN_CHUNK_SECONDS):
+        return by_time()
+    return None
+
+def plan_chunks(session, params, url=USGS_URL, max_events=MAX_EVENTS_PER_QUERY // 2, max_workers=8, timeout=30):
+    # splits the query until every chunk is below max_events according to the
+    # count endpoint (counts of each round are asked in parallel)
+    todo = [params]
+    chunks = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while todo:
+            counts = list(pool.map(lambda p: count_earthquakes(session, p, url, timeout), todo))
+            next_round = []
+            for chunk, count in zip(todo, counts):
+                halves = split_chunk(chunk) if count > max_events else None
+                if halves is not None:
+                    next_round.extend(halves)
+                elif count > max_events:
+                    # can't split any further, USGS may cut this one short
+                    print(f"Chunk {chunk['starttime']} - {chunk['endtime']} still has {count} events")
+                    chunks.append(chunk)
+                elif count > 0:
+                    chunks.append(chunk)
+            todo = next_round
+
+    return chunks
+
+def fetch_chunk(session, params, url=USGS_URL, timeout=60):
+    response = session.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    features = response.json()["features"]
+    instrument.count('usgs_requests')
+    instrument.count('bytes_fetched', len(response.content))
+    instrument.count('events_fetched', len(features))
+    return features
+
+def fetch_chunk_frame(session, params, url=USGS_URL, timeout=60):
+    # same as fetch_chunk but decodes the raw bytes straight into a frame
+    response = session.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    gdf = decode_geojson_features(response.content)
+    instrument.count('usgs_requests')
+    instrument.count('bytes_fetched', len(response.content))
+    instrument.count('events_fetched', len(gdf))
+    return gdf
+
+def fetch_in_chunks(params, fetch, url=USGS_URL, max_workers=8, timeout=60, max_retries=3,
+                    backoff=0.5, max_events=MAX_EVENTS_PER_QUERY // 2):
+    # plans the chunks for a possibly huge FDSN query and runs
+    # fetch(session, chunk_params, url, timeout) for all of them in parallel
+    params = dict(params)
+    if not params.get("endtime"):
+        params["endtime"] = utc_now().isoformat()
+
+    session = make_session(max_retries=max_retries, backoff=backoff, pool_size=max_workers)
+    try:
+        chunks = plan_chunks(session, params, url, max_events=max_events, max_workers=max_workers, timeout=timeout)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(lambda p: fetch(session, p, url, timeout), chunks))
+    finally:
+        session.close()
+
+@instrument.timed("acquire.fetch_earthquake_features")
+def fetch_earthquake_features(params, url=USGS_URL, **kwargs):
+    # downloads the query in chunks and merges the raw features, keeping one
+    # per event id (neighbouring chunks share their edge, so an event can show up twice)
+    features = {}
+    for chunk_features in fetch_in_chunks(params, fetch_chunk, url=url, **kwargs):
+        for feature in chunk_features:
+            features[feature["id"]] = feature
+    return list(features.values())
+
+def fetch_earthquake_frame(params, url=USGS_URL, **kwargs):
+    # same, but every chunk is decoded into a frame as soon as it arrives,
+    # so the parsed json never sits next to the result
+    frames = fetch_in_chunks(params, fetch_chunk_frame, url=url, **kwargs)
+    if not frames:
+        import geopandas as gpd
+        return gpd.GeoDataFrame()
+
+    gdf = pd.concat(frames, ignore_index=True)
+    return gdf.drop_duplicates(subset='id', keep='last').reset_index(drop=True)
+
+@instrument.timed("acquire.get_earthquake_data")
+def get_earthquake_data(days_back=None, min_mag=5.0, start_date=None, end_date=None,
+                        url=USGS_URL, max_workers=8, timeout=60):
     # gets earthquake data from USGS API for Asia
     # can use either days_back OR specific start_date/end_date
-    url = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+    # big windows are split into chunks and downloaded in parallel
     
     # set up date parameters
     if start_date and end_date:
@@ -31,98 +233,168 @@ def get_earthquake_data(days_back=None, min_mag=5.0, start_date=None, end_date=N
     else:
         # use days_back from today
         days = days_back if days_back else 365
-        starttime = (pd.Timestamp.now() - pd.Timedelta(days=days)).isoformat()
+        starttime = (utc_now() - pd.Timedelta(days=days)).isoformat()
         endtime = None
     
     params = {
         "format": "geojson",
         "starttime": starttime,
         "minmagnitude": min_mag,
-        "minlatitude": -10,
-        "maxlatitude": 80,
-        "minlongitude": 25,
-        "maxlongitude": 180
+        **ASIA_BBOX
     }
     
     if endtime:
         params["endtime"] = endtime
     
     try:
-        response = requests.get(url, params=params)
-        
-        if response.status_code == 200:
-            data = response.json()
-            gdf = gpd.GeoDataFrame.from_features(data["features"])
-            if not gdf.empty:
-                gdf.crs = "EPSG:4326"
-                
-                # depth is stored in the z coordinate of the geometry point
-                if 'geometry' in gdf.columns:
-                    gdf['depth_km'] = gdf.geometry.apply(lambda p: p.z if p.has_z else 10.0)
-                    
-            return gdf
-        else:
-            print("USGS error:", response.status_code)
-            return gpd.GeoDataFrame()
+        # depth_km comes from the z coordinate of every point (see decode_geojson_features)
+        return fetch_earthquake_frame(params, url=url, max_workers=max_workers, timeout=timeout)
             
     except Exception as e:
         print("Error:", e)
+        import geopandas as gpd
         return gpd.GeoDataFrame()
 
-def get_cities_data():
-    # downloads city data from Natural Earth
-    if not os.path.exists(CACHE_FOLDER):
-        os.makedirs(CACHE_FOLDER)
-        
-    local_path = os.path.join(CACHE_FOLDER, "ne_10m_populated_places.json")
-    
-    # check if we already downloaded it
-    if os.path.exists(local_path):
-        return gpd.read_file(local_path)
-    
-    # download if not cached
-    url = "https://d2ad6b4ur7yvpq.cloudfront.net/naturalearth-3.3.0/ne_10m_populated_places_simple.geojson"
+# bump this when what goes into the caches changes, older caches get rebuilt
+CACHE_VERSION = 1
+
+CITIES_URL = "https://d2ad6b4ur7yvpq.cloudfront.net/naturalearth-3.3.0/ne_10m_populated_places_simple.geojson"
+BOUNDARIES_URL = "https://raw.githubusercontent.com/martynafford/natural-earth-geojson/master/110m/cultural/ne_110m_admin_0_countries.json"
+
+def cache_fingerprint(source, **settings):
+    # what a cache was built from, a cache with another fingerprint is stale
+    key = json.dumps({"version": CACHE_VERSION, "source": source, **settings}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+# key of our own entry in the parquet schema metadata
+CACHE_ATTRS_KEY = b"earthquake_exposure_cache"
+
+def read_cache_attrs(path):
+    # what write_geoparquet_cache stored, only reads the parquet footer, not the data
     try:
-        print("Downloading cities...")
-        cities = gpd.read_file(url)
-        cities = cities[cities['pop_max'] > 100000].copy()
-        
-        # keep only Asian cities
-        if 'adm0name' in cities.columns:
-            cities = cities[cities['adm0name'].isin(ASIAN_COUNTRIES)].copy()
-        elif 'ADM0NAME' in cities.columns:
-            cities = cities[cities['ADM0NAME'].isin(ASIAN_COUNTRIES)].copy()
-        
-        # rename columns to be consistent
-        if 'pop_max' in cities.columns:
-            cities = cities.rename(columns={'pop_max': 'POP_MAX'})
-        if 'name' in cities.columns:
-            cities = cities.rename(columns={'name': 'NAME'})
-            
-        cities.to_file(local_path, driver="GeoJSON")
+        metadata = pq.read_schema(path).metadata or {}
+        return json.loads(metadata.get(CACHE_ATTRS_KEY, b"{}"))
+    except Exception:
+        return {}
+
+def write_geoparquet_cache(gdf, path, fingerprint):
+    # GeoParquet with the fingerprint in the file metadata, written to a temp
+    # file first so a reader never sees half a cache
+    # the table and the "geo" metadata are made with pyarrow here, so what ends
+    # up in the footer doesn't depend on the geopandas version
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    attrs = {
+        "cache_fingerprint": fingerprint,
+        "cache_version": CACHE_VERSION,
+        "cache_crs": gdf.crs.to_string() if gdf.crs is not None else None,
+    }
+    geo = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": {
+            "encoding": "WKB", "geometry_types": [],
+            "crs": gdf.crs.to_json_dict() if gdf.crs is not None else None,
+        }},
+    }
+    table = pa.Table.from_pandas(pd.DataFrame(gdf.drop(columns=gdf.geometry.name)), preserve_index=False)
+    table = table.append_column("geometry", pa.array(shapely.to_wkb(gdf.geometry.to_numpy()), pa.binary()))
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"geo": json.dumps(geo).encode(),
+        CACHE_ATTRS_KEY: json.dumps(attrs).encode(),
+    })
+    pq.write_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+def read_geoparquet_cache(path, fingerprint, filters=None):
+    # the cached frame with the filters applied while reading (row groups and
+    # rows that don't match are never decoded), or None if missing or stale
+    attrs = read_cache_attrs(path) if os.path.exists(path) else {}
+    if attrs.get("cache_fingerprint") != fingerprint:
+        return None
+    # decoding the WKB ourselves and taking the crs as a plain string is a lot
+    # quicker than gpd.read_parquet, which parses the full PROJJSON every time
+    import geopandas as gpd
+    df = pq.read_table(path, filters=filters).to_pandas()
+    geometry = shapely.from_wkb(df.pop("geometry").to_numpy())
+    gdf = gpd.GeoDataFrame(df, geometry=geometry, crs=attrs.get("cache_crs"))
+    gdf.attrs = {}
+    return gdf
+
+def get_cities_data(min_population=None, countries=ASIAN_COUNTRIES):
+    # downloads city data from Natural Earth, cached as GeoParquet
+    # the cache has the cities of every country, min_population and countries
+    # (None for all of them) are applied while reading it
+    import geopandas as gpd
+    local_path = os.path.join(CACHE_FOLDER, "ne_10m_populated_places.parquet")
+    fingerprint = cache_fingerprint(CITIES_URL, min_pop_max=100000)
+    filters = []
+    if min_population:
+        filters.append(("POP_MAX", ">=", min_population))
+    if countries is not None:
+        filters.append(("ADM0NAME", "in", list(countries)))
+
+    cities = read_geoparquet_cache(local_path, fingerprint, filters or None)
+    if cities is not None:
         return cities
-    except Exception as e:
-        print("Download failed:", e)
-        return gpd.GeoDataFrame()
 
+    # the GeoJSON cache from older versions is converted once instead of downloading again
+    legacy_path = os.path.join(CACHE_FOLDER, "ne_10m_populated_places.json")
+    if not os.path.exists(local_path) and os.path.exists(legacy_path):
+        cities = gpd.read_file(legacy_path)
+    else:
+        try:
+            print("Downloading cities...")
+            cities = gpd.read_file(CITIES_URL)
+            cities = cities[cities['pop_max'] > 100000].copy()
+        except Exception as e:
+            print("Download failed:", e)
+            return gpd.GeoDataFrame()
+
+    # rename columns to be consistent
+    if 'pop_max' in cities.columns:
+        cities = cities.rename(columns={'pop_max': 'POP_MAX'})
+    if 'name' in cities.columns:
+        cities = cities.rename(columns={'name': 'NAME'})
+    if 'adm0name' in cities.columns:
+        cities = cities.rename(columns={'adm0name': 'ADM0NAME'})
+
+    # grouped by country, so a read of a few countries skips most row groups
+    cities = cities.sort_values('ADM0NAME', kind='stable').reset_index(drop=True)
+    write_geoparquet_cache(cities, local_path, fingerprint)
+    if min_population:
+        cities = cities[cities['POP_MAX'] >= min_population]
+    if countries is not None:
+        cities = cities[cities['ADM0NAME'].isin(countries)]
+    return cities.copy()
+
+@instrument.timed("acquire.get_country_boundaries")
 def get_country_boundaries():
-    # get country shapes for the background of the map
+    # get country shapes for the background of the map, cached as GeoParquet
+    # with only the Asian countries read back
+    import geopandas as gpd
     try:
-        local_path = os.path.join(CACHE_FOLDER, "ne_110m_admin_0_countries.json")
-        if os.path.exists(local_path):
-            world = gpd.read_file(local_path)
+        local_path = os.path.join(CACHE_FOLDER, "ne_110m_admin_0_countries.parquet")
+        fingerprint = cache_fingerprint(BOUNDARIES_URL)
+        filters = [("name", "in", ASIAN_COUNTRIES)]
+
+        asia = read_geoparquet_cache(local_path, fingerprint, filters)
+        if asia is not None:
+            return asia
+
+        legacy_path = os.path.join(CACHE_FOLDER, "ne_110m_admin_0_countries.json")
+        if not os.path.exists(local_path) and os.path.exists(legacy_path):
+            world = gpd.read_file(legacy_path)
         else:
-            url = "https://raw.githubusercontent.com/martynafford/natural-earth-geojson/master/110m/cultural/ne_110m_admin_0_countries.json"
             print("Downloading country boundaries...")
-            world = gpd.read_file(url)
-            
-            # fix column names
-            if 'NAME' in world.columns and 'name' not in world.columns:
-                 world['name'] = world['NAME']
-            
-            if not os.path.exists(CACHE_FOLDER):
-                os.makedirs(CACHE_FOLDER)
-            world.to_file(local_path, driver="GeoJSON")
+            world = gpd.read_file(BOUNDARIES_URL)
+
+        # fix column names
+        if 'NAME' in world.columns and 'name' not in world.columns:
+            world['name'] = world['NAME']
+        write_geoparquet_cache(world, local_path, fingerprint)
 
         # filter just the Asian countries
         asia = world[world['name'].isin(ASIAN_COUNTRIES)].copy()
@@ -131,9 +403,10 @@ def get_country_boundaries():
         print("Could not load boundaries:", e)
         return gpd.GeoDataFrame()
 
+@instrument.timed("acquire.load_asian_cities")
 def load_asian_cities(min_population=250000):
-    # loads cities and filters by population size
-    cities = get_cities_data()
+    # loads cities and filters by population size (already while reading the cache)
+    cities = get_cities_data(min_population=min_population)
     
     if cities.empty:
         return cities
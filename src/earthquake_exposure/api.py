@@ -1,33 +1,429 @@
-from fastapi import FastAPI
+import asyncio
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 import uvicorn
-from earthquake_exposure.acquire import get_earthquake_data
+from earthquake_exposure import instrument
+from earthquake_exposure.acquire import load_asian_cities, get_country_boundaries, utc_now, USGS_URL, CACHE_FOLDER
+from earthquake_exposure.catalog import sync_catalog, query_catalog, open_catalog, get_meta, to_millis
 
-app = FastAPI()
+# exposure, impact, artifacts, viz and tiles (geopandas, scipy, plotly, folium)
+# are imported in the functions that use them, so a worker starts serving
+# without loading any of that, see benchmarks/bench_imports.py
+
+# the catalog is synced in the background and everything is served from memory,
+# handlers never call USGS or recompute PGA
+REFRESH_SECONDS = float(os.environ.get("EARTHQUAKE_REFRESH_SECONDS", 300))
+LOOKBACK_DAYS = 7
+CACHE_MIN_MAG = 4.5
+EXPOSURE_DAYS = 365
+EXPOSURE_MIN_MAG = 5.0
+UPSTREAM_URL = os.environ.get("EARTHQUAKE_USGS_URL", USGS_URL)
+CATALOG_PATH = os.environ.get("EARTHQUAKE_CATALOG", os.path.join(CACHE_FOLDER, "catalog.sqlite"))
+CITY_ARTIFACTS = os.environ.get("EARTHQUAKE_CITY_ARTIFACTS", os.path.join(CACHE_FOLDER, "city_index"))
+EXPOSURE_STATE_PATH = os.environ.get("EARTHQUAKE_EXPOSURE_STATE", os.path.join(CACHE_FOLDER, "exposure_state.parquet"))
+TILE_CACHE = os.environ.get("EARTHQUAKE_TILE_CACHE", os.path.join(CACHE_FOLDER, "tiles"))
+# tiles up to this zoom are rendered after every refresh, -1 renders them all on demand
+TILE_PRECOMPUTE_ZOOM = int(os.environ.get("EARTHQUAKE_TILE_PRECOMPUTE_ZOOM", 2))
+
+# stage timers and counters for /metrics while the app runs, off unless EARTHQUAKE_INSTRUMENT=1
+INSTRUMENT = os.environ.get("EARTHQUAKE_INSTRUMENT") == "1"
+
+class QuakeCache:
+    # the latest quakes as plain column arrays plus a version for ETags
+
+    def __init__(self):
+        self.columns = None
+        self.version = None
+        self.refreshed_at = None
+        # rendered json per magnitude filter, thrown away on every update
+        self.rendered = {}
+
+    def update(self, gdf):
+        # an empty frame (failed download, quiet week) may not even have the columns
+        if gdf.empty:
+            columns = {
+                "place": np.array([], dtype=object),
+                "magnitude": np.array([], dtype=float),
+                "depth_km": np.array([], dtype=float),
+                "lat": np.array([], dtype=float),
+                "lon": np.array([], dtype=float),
+            }
+        else:
+            columns = {
+                "place": gdf['place'].to_numpy(dtype=object),
+                "magnitude": gdf['mag'].to_numpy(dtype=float),
+                "depth_km": gdf['depth_km'].to_numpy(dtype=float) if 'depth_km' in gdf.columns else np.zeros(len(gdf)),
+                "lat": gdf.geometry.y.to_numpy(dtype=float),
+                "lon": gdf.geometry.x.to_numpy(dtype=float),
+            }
+        # the version only changes when what we serve changes
+        row_hashes = pd.util.hash_pandas_object(pd.DataFrame(columns), index=False)
+
+        self.columns = columns
+        self.version = hashlib.sha1(row_hashes.to_numpy().tobytes()).hexdigest()[:16]
+        self.refreshed_at = time.time()
+        self.rendered = {}
+
+    def select(self, min_mag):
+        # the response body for one magnitude filter, built from the columns
+        if self.columns is None:
+            return {"count": 0, "quakes": []}
+
+        keep = self.columns["magnitude"] >= min_mag
+        names = list(self.columns)
+        # json has no NaN, missing numbers (a quake without a depth) are null
+        values = [
+            np.where(np.isfinite(column[keep]), column[keep], None).tolist() if column.dtype.kind == 'f'
+            else column[keep].tolist()
+            for column in self.columns.values()
+        ]
+        quakes = [dict(zip(names, row)) for row in zip(*values)]
+        return {"count": len(quakes), "quakes": quakes}
+
+    def render(self, min_mag):
+        # select() as json bytes, remembered until the next update
+        if min_mag not in self.rendered:
+            if len(self.rendered) >= 64:
+                self.rendered.clear()
+            self.rendered[min_mag] = json.dumps(self.select(min_mag)).encode()
+        return self.rendered[min_mag]
+
+class ExposureSnapshot:
+    # one exposure table (one row per city, strongest shaking first) with
+    # lookups by name, country and category, so queries are a few array operations
+    # never changed after it is built, a request that holds one sees a consistent table
+
+    def __init__(self, table=None):
+        self.table = None
+        self.records = []
+        self.max_pga = np.array([])
+        self.by_name = {}
+        self.by_country = {}
+        self.by_category = {}
+        if table is None:
+            return
+
+        table = table.sort_values('max_pga', ascending=False, kind='stable').reset_index(drop=True)
+        records = table.to_dict('records')
+        for record in records:
+            # json has no infinity, cities without quakes get null
+            if not np.isfinite(record['closest_quake_distance']):
+                record['closest_quake_distance'] = None
+
+        self.by_name = table.groupby(table['city_name'].str.lower()).indices
+        self.by_country = table.groupby(table['country'].str.lower()).indices
+        self.by_category = table.groupby(table['risk_category'].str.upper()).indices
+        self.max_pga = table['max_pga'].to_numpy()
+        self.records = records
+        self.table = table
+
+    def summary(self, positions):
+        # list responses leave out the top quakes to stay small
+        return [
+            {k: v for k, v in self.records[i].items() if k != 'top_contributing_quakes'}
+            for i in positions
+        ]
+
+    def city(self, name):
+        return [self.records[i] for i in self.by_name.get(name.lower(), [])]
+
+    def query(self, country=None, category=None, min_pga=None, limit=100):
+        # unknown countries and categories match nothing (an int array, so it can still index)
+        nothing = np.empty(0, dtype=np.intp)
+        positions = np.arange(len(self.records))
+        if country is not None:
+            positions = np.intersect1d(positions, self.by_country.get(country.lower(), nothing))
+        if category is not None:
+            positions = np.intersect1d(positions, self.by_category.get(category.upper(), nothing))
+        if min_pga is not None:
+            positions = positions[self.max_pga[positions] >= min_pga]
+        return self.summary(positions[:limit].tolist())
+
+    def top(self, n):
+        return self.summary(range(min(n, len(self.records))))
+
+class ExposureIndex:
+    # the current ExposureSnapshot, a refresh builds a new one and swaps it in
+    # with a single assignment while the handlers keep reading the one they took
+
+    def __init__(self):
+        self.snapshot = ExposureSnapshot()
+
+    @property
+    def table(self):
+        return self.snapshot.table
+
+    def update(self, table):
+        self.snapshot = ExposureSnapshot(table)
+
+quake_cache = QuakeCache()
+exposure_index = ExposureIndex()
+# city-quake contributions behind exposure_index, updated with the events each sync changes
+exposure_state = None
+# the plotly map as figure json, built on the first /map request after every refresh
+map_figure = {}
+# map tiles of the exposure window, replaced after every refresh
+tile_renderer = None
+
+@lru_cache(maxsize=1)
+def get_city_artifacts():
+    # the prebuilt city index, built from the city list the first time and
+    # rebuilt whenever the city list no longer matches it
+    from earthquake_exposure.artifacts import build_city_artifacts, load_city_artifacts
+    cities = load_asian_cities()
+    if cities.empty:
+        # nothing to check against (offline without a cache), use what was built
+        return load_city_artifacts(CITY_ARTIFACTS)
+    artifacts = load_city_artifacts(CITY_ARTIFACTS, cities)
+    if artifacts is None:
+        build_city_artifacts(cities, CITY_ARTIFACTS)
+        artifacts = load_city_artifacts(CITY_ARTIFACTS)
+    return artifacts
+
+@lru_cache(maxsize=1)
+def get_cities():
+    artifacts = get_city_artifacts()
+    return artifacts.to_frame() if artifacts is not None else load_asian_cities()
+
+def sync_quakes():
+    # brings the local catalog up to date (only changed events are downloaded)
+    start = utc_now() - pd.Timedelta(days=EXPOSURE_DAYS)
+    return sync_catalog(CATALOG_PATH, starttime=start.isoformat(), min_mag=CACHE_MIN_MAG, url=UPSTREAM_URL)
+
+def fetch_latest_quakes():
+    start = utc_now() - pd.Timedelta(days=LOOKBACK_DAYS)
+    return query_catalog(CATALOG_PATH, starttime=start, min_mag=CACHE_MIN_MAG)
+
+def exposure_window_start():
+    return to_millis(utc_now() - pd.Timedelta(days=EXPOSURE_DAYS))
+
+def catalog_high_water():
+    conn = open_catalog(CATALOG_PATH)
+    try:
+        return get_meta(conn, 'high_water')
+    finally:
+        conn.close()
+
+def load_exposure_state():
+    # the saved state if it is as new as the catalog, otherwise built from the whole window
+    from earthquake_exposure.exposure import ExposureState
+    high_water = catalog_high_water()
+    if os.path.exists(EXPOSURE_STATE_PATH):
+        try:
+            state = ExposureState.load(EXPOSURE_STATE_PATH, get_cities())
+            if state.synced_to == high_water:
+                return state
+        except Exception as e:
+            print("Could not load exposure state:", e)
+
+    state = ExposureState(get_cities(), metric='greatcircle', min_mag=EXPOSURE_MIN_MAG)
+    state.apply_new_events(query_catalog(CATALOG_PATH, starttime=exposure_window_start(), min_mag=EXPOSURE_MIN_MAG))
+    state.synced_to = high_water
+    return state
+
+def compute_exposure(changes=None):
+    # only the events a sync changed are run against the cities, plus whatever
+    # aged out of the window
+    global exposure_state
+    if exposure_state is None:
+        exposure_state = load_exposure_state()
+    elif changes is not None:
+        changed = query_catalog(CATALOG_PATH, ids=changes['upserted_ids'])
+        changed = changed[changed['time'] >= exposure_window_start()]
+        exposure_state.apply_new_events(changed, deleted_ids=changes['deleted_ids'])
+        exposure_state.synced_to = catalog_high_water()
+
+    exposure_state.expire(exposure_window_start())
+    try:
+        exposure_state.save(EXPOSURE_STATE_PATH)
+    except Exception as e:
+        print("Could not save exposure state:", e)
+    return exposure_state.result()
+
+async def refresh_catalog():
+    # all the slow work runs in worker threads, so the event loop keeps serving
+    changes = await asyncio.to_thread(sync_quakes)
+
+    # a failed sync keeps serving what we have, an unchanged catalog needs no work
+    first = quake_cache.columns is None
+    if changes is None and not first:
+        return
+    if not first and not changes['upserted_ids'] and not changes['deleted_ids']:
+        return
+
+    quake_cache.update(await asyncio.to_thread(fetch_latest_quakes))
+    exposure_index.update(await asyncio.to_thread(compute_exposure, changes))
+    map_figure.clear()
+
+    global tile_renderer
+    tile_renderer = None
+    if TILE_PRECOMPUTE_ZOOM >= 0:
+        from earthquake_exposure.tiles import precompute_tiles
+        await asyncio.to_thread(precompute_tiles, get_tile_renderer(), TILE_PRECOMPUTE_ZOOM)
+
+async def refresh_loop():
+    while True:
+        try:
+            await refresh_catalog()
+        except Exception as e:
+            print("Refresh failed:", e)
+        await asyncio.sleep(REFRESH_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app):
+    # instrumenting starts with the app, importing api (tests, the cli) doesn't turn it on
+    if INSTRUMENT:
+        instrument.enable()
+    task = asyncio.create_task(refresh_loop())
+    yield
+    task.cancel()
+    if INSTRUMENT:
+        instrument.disable()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def time_requests(request, call_next):
+    # every request is a stage named after its route (not the raw path, so ids don't pile up)
+    if not instrument.is_enabled():
+        return await call_next(request)
+    peak = instrument.max_rss_mb()
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    name = f"http {request.method} {route.path if route is not None else 'unmatched'}"
+    instrument.record(name, time.perf_counter() - start, peak, instrument.max_rss_mb())
+    return response
+
+@lru_cache(maxsize=1)
+def get_boundaries():
+    return get_country_boundaries()
+
+def window_quakes():
+    return query_catalog(CATALOG_PATH, starttime=exposure_window_start(), min_mag=EXPOSURE_MIN_MAG)
+
+def render_map():
+    # the map of the exposure window, with quakes binned when there are many of them
+    from earthquake_exposure.viz import generate_plotly_map, figure_to_json
+    return figure_to_json(generate_plotly_map(get_cities(), window_quakes(), exposure_index.table, get_boundaries()))
+
+def get_tile_renderer():
+    # built from the exposure window on the first tile request after a refresh
+    global tile_renderer
+    if tile_renderer is None:
+        from earthquake_exposure.tiles import TileRenderer
+        tile_renderer = TileRenderer(window_quakes(), cache_folder=TILE_CACHE)
+    return tile_renderer
+
+@lru_cache(maxsize=1)
+def get_city_index():
+    # opened on the first /impact request and then kept for the life of the process
+    from earthquake_exposure.impact import CityImpactIndex
+    artifacts = get_city_artifacts()
+    if artifacts is not None:
+        return CityImpactIndex.from_artifacts(artifacts)
+    return CityImpactIndex.from_frame(get_cities())
 
 @app.get("/")
 def home():
     # just a welcome message
     return {"message": "Welcome to the Earthquake Exposure API!"}
 
+@app.get("/metrics")
+def get_metrics():
+    # stage times, counters and peak memory in the Prometheus text format
+    return Response(instrument.prometheus_text(), media_type="text/plain; version=0.0.4")
+
 @app.get("/latest_quakes")
-def get_latest(min_mag: float = 5.0):
-    # get recent earthquakes
-    gdf = get_earthquake_data(days_back=7, min_mag=min_mag)
-    
-    if gdf.empty:
-        return {"count": 0, "quakes": []}
-        
-    results = []
-    for _, row in gdf.iterrows():
-        results.append({
-            "place": row['place'],
-            "magnitude": row['mag'],
-            "depth_km": row.get('depth_km', 0),
-            "lat": row.geometry.y,
-            "lon": row.geometry.x
-        })
-        
-    return {"count": len(results), "quakes": results}
+async def get_latest(request: Request, min_mag: float = 5.0):
+    # recent earthquakes from the in-memory cache (refreshed in the background)
+    # filters below CACHE_MIN_MAG only return what the cache holds
+    etag = f'"{quake_cache.version}-{min_mag}"'
+    if quake_cache.version is not None and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    headers = {"ETag": etag} if quake_cache.version is not None else {}
+    return Response(quake_cache.render(min_mag), media_type="application/json", headers=headers)
+
+def require_exposure():
+    # the snapshot a request works on, taken once so a refresh can't swap it halfway
+    snapshot = exposure_index.snapshot
+    if snapshot.table is None:
+        raise HTTPException(status_code=503, detail="Exposure table is still being computed")
+    return snapshot
+
+@app.get("/map")
+async def get_map():
+    # the plotly figure json for plotly.js, rendered once per refresh
+    require_exposure()
+    if "body" not in map_figure:
+        map_figure["body"] = await asyncio.to_thread(render_map)
+    return Response(map_figure["body"], media_type="application/json")
+
+@app.get("/tiles/{layer}/{z}/{x}/{y}.png")
+async def get_tile(request: Request, layer: str, z: int, x: int, y: int):
+    # XYZ map tiles of quake density or PGA hazard over the exposure window
+    if quake_cache.version is None:
+        raise HTTPException(status_code=503, detail="Catalog is still being synced")
+    renderer = await asyncio.to_thread(get_tile_renderer)
+    etag = f'"{renderer.version}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    try:
+        png = await asyncio.to_thread(renderer.tile, layer, z, x, y)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(png, media_type="image/png", headers={"ETag": etag})
+
+@app.get("/cities/{name}/risk")
+def get_city_risk(name: str):
+    # the full risk profile (with top contributing quakes) of a city
+    cities = require_exposure().city(name)
+    if not cities:
+        raise HTTPException(status_code=404, detail=f"Unknown city: {name}")
+    return {"count": len(cities), "cities": cities}
+
+@app.get("/cities")
+def get_cities_risk(country: str = None, category: str = None, min_pga: float = None, limit: int = Query(100, ge=1)):
+    # cities filtered by country, risk category and minimum PGA, strongest first
+    cities = require_exposure().query(country=country, category=category, min_pga=min_pga, limit=limit)
+    return {"count": len(cities), "cities": cities}
+
+@app.get("/top")
+def get_top(n: int = Query(10, ge=1)):
+    # the n cities with the highest max PGA
+    cities = require_exposure().top(n)
+    return {"count": len(cities), "cities": cities}
+
+@app.get("/impact")
+def get_impact(lat: float, lon: float, mag: float, depth_km: float = 10.0, min_pga: float = 0.0):
+    # which cities would a quake at this spot shake, and how badly
+    affected = get_city_index().affected_cities(lon, lat, mag, depth_km)
+    affected = affected[affected['pga'] >= min_pga]
+
+    cities = [
+        {
+            "city": name,
+            "country": country,
+            "population": int(population),
+            "distance_km": round(float(dist), 1),
+            "pga": float(pga),
+            "risk_category": category
+        }
+        for name, country, population, dist, pga, category in zip(
+            affected['city_name'].tolist(), affected['country'].tolist(), affected['population'].tolist(),
+            affected['distance_km'].tolist(), affected['pga'].tolist(), affected['risk_category'].tolist()
+        )
+    ]
+    return {"count": len(cities), "cities": cities}
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
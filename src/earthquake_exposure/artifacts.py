@@ -0,0 +1,141 @@
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.feather as feather
+from scipy.spatial import cKDTree
+from earthquake_exposure import spatial_index
+from earthquake_exposure.exposure import city_fingerprint
+
+# prebuilt city index on disk, so a notebook or API process doesn't have to read
+# the city GeoJSON and build a tree every time it starts
+# numeric arrays are .npy files opened with mmap_mode='r' (several processes
+# share the same pages), names and countries are an uncompressed Arrow file
+# the cities are stored sorted by a lat/lon grid cell, so cities near each
+# other sit on the same pages and a tree query only touches a few of them
+# every build goes into its own folder (named by format version and a
+# fingerprint of the city list) and current.json points at the newest one
+
+FORMAT_VERSION = 1
+
+def grid_cells(lon, lat, cell_deg):
+    # grid row/column of every point, rows from the south pole, columns from 180W
+    n_rows = int(round(180 / cell_deg))
+    n_cols = int(round(360 / cell_deg))
+    rows = np.clip(np.floor((np.asarray(lat) + 90) / cell_deg).astype(np.int64), 0, n_rows - 1)
+    cols = np.floor((np.asarray(lon) + 180) / cell_deg).astype(np.int64) % n_cols
+    return rows, cols, n_rows, n_cols
+
+def build_city_artifacts(cities_gdf, folder, cell_deg=1.0):
+    # writes the index for these cities and points current.json at it
+    # returns the folder of this build
+    lon, lat = spatial_index.get_lonlat(cities_gdf)
+    rows, cols, _, n_cols = grid_cells(lon, lat, cell_deg)
+    cell = rows * n_cols + cols
+    order = np.argsort(cell, kind='stable')
+
+    arrays = {
+        'unit_xyz': spatial_index.lonlat_to_unit_vectors(lon[order], lat[order]),
+        'lon': lon[order],
+        'lat': lat[order],
+        'population': cities_gdf['population'].to_numpy(dtype=np.int64)[order],
+        'order': order.astype(np.int64),
+    }
+    if 'vs30' in cities_gdf.columns:
+        arrays['vs30'] = cities_gdf['vs30'].to_numpy(dtype=float)[order]
+
+    fingerprint = city_fingerprint(cities_gdf)
+    build = f"v{FORMAT_VERSION}-{fingerprint}"
+    build_folder = os.path.join(folder, build)
+    os.makedirs(build_folder, exist_ok=True)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(build_folder, f"{name}.npy"), np.ascontiguousarray(array))
+    country = cities_gdf['country'] if 'country' in cities_gdf.columns else pd.Series(['Unknown'] * len(cities_gdf))
+    attributes = pa.table({
+        'name': pa.array(cities_gdf['name'].astype(str).to_numpy()[order]),
+        'country': pa.array(country.astype(str).to_numpy()[order]),
+    })
+    feather.write_feather(attributes, os.path.join(build_folder, "attributes.arrow"), compression='uncompressed')
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'fingerprint': fingerprint,
+        'count': len(cities_gdf),
+        'cell_deg': cell_deg,
+        'created': time.time(),
+        'arrays': {name: {'dtype': array.dtype.str, 'shape': list(array.shape)} for name, array in arrays.items()},
+    }
+    with open(os.path.join(build_folder, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # swap the pointer in one step, processes that have the old build open keep using it
+    pointer = os.path.join(folder, "current.json")
+    with open(pointer + ".tmp", "w") as f:
+        json.dump({'build': build}, f)
+    os.replace(pointer + ".tmp", pointer)
+    return build_folder
+
+class CityArtifacts:
+    # a built city index opened from disk, nothing is read until it is used
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, "current.json")) as f:
+            self.folder = os.path.join(folder, json.load(f)['build'])
+        with open(os.path.join(self.folder, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"City index format {self.manifest['format_version']} is not {FORMAT_VERSION}, rebuild it")
+
+        self.arrays = {
+            name: np.load(os.path.join(self.folder, f"{name}.npy"), mmap_mode='r')
+            for name in self.manifest['arrays']
+        }
+        self.attributes = feather.read_table(os.path.join(self.folder, "attributes.arrow"), memory_map=True)
+        self._tree = None
+
+    def __len__(self):
+        return self.manifest['count']
+
+    @property
+    def names(self):
+        return self.attributes.column('name').to_numpy(zero_copy_only=False)
+
+    @property
+    def countries(self):
+        return self.attributes.column('country').to_numpy(zero_copy_only=False)
+
+    def kdtree(self):
+        # the tree is built on the mapped coordinates without copying them
+        if self._tree is None:
+            self._tree = cKDTree(self.arrays['unit_xyz'], copy_data=False)
+        return self._tree
+
+    def to_frame(self):
+        # the cities back as a GeoDataFrame in their original order
+        back = np.argsort(self.arrays['order'])
+        frame = {
+            'name': self.names[back],
+            'country': self.countries[back],
+            'population': np.asarray(self.arrays['population'])[back],
+        }
+        if 'vs30' in self.arrays:
+            frame['vs30'] = np.asarray(self.arrays['vs30'])[back]
+        return gpd.GeoDataFrame(
+            frame, geometry=gpd.points_from_xy(self.arrays['lon'][back], self.arrays['lat'][back]), crs='EPSG:4326'
+        )
+
+def load_city_artifacts(folder, cities_gdf=None):
+    # the current build in folder, or None if nothing was built there yet
+    # with cities_gdf also None if the build is of a different city list
+    # (exposure.city_fingerprint: count, names and positions), so it gets rebuilt
+    if not os.path.exists(os.path.join(folder, "current.json")):
+        return None
+    artifacts = CityArtifacts(folder)
+    if cities_gdf is not None and (artifacts.manifest['count'] != len(cities_gdf)
+                                   or artifacts.manifest['fingerprint'] != city_fingerprint(cities_gdf)):
+        return None
+    return artifacts
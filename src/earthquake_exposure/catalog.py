@@ -0,0 +1,298 @@
+import json
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+import shapely
+import pyarrow as pa
+import pyarrow.parquet as pq
+from earthquake_exposure.acquire import USGS_URL, ASIA_BBOX, fetch_earthquake_features, utc_now
+
+# local copy of the USGS catalog in a single SQLite file
+# one row per event (keyed by the USGS event id), with a month column so
+# time range queries only have to look at the months they touch
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    month TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    updated INTEGER NOT NULL,
+    mag REAL,
+    lon REAL NOT NULL,
+    lat REAL NOT NULL,
+    depth_km REAL,
+    place TEXT,
+    status TEXT,
+    type TEXT,
+    magType TEXT
+);
+CREATE INDEX IF NOT EXISTS events_month_time ON events (month, time);
+CREATE INDEX IF NOT EXISTS events_time_id ON events (time, id);
+CREATE INDEX IF NOT EXISTS events_mag ON events (mag);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+EVENT_COLUMNS = ['id', 'month', 'time', 'updated', 'mag', 'lon', 'lat', 'depth_km', 'place', 'status', 'type', 'magType']
+
+def open_catalog(db_path):
+    # opens (and creates if needed) the catalog database
+    folder = os.path.dirname(db_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_meta(conn, key, value):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, str(value))
+    )
+
+def to_millis(value):
+    # accepts "2025-01-01", a Timestamp or epoch milliseconds
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).value // 1_000_000)
+
+def millis_to_iso(ms):
+    return pd.Timestamp(int(ms), unit='ms').strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+
+def month_of(ms):
+    return pd.Timestamp(int(ms), unit='ms').strftime('%Y-%m')
+
+def feature_to_row(feature):
+    # one GeoJSON feature -> one row for the events table
+    props = feature['properties']
+    coords = feature['geometry']['coordinates']
+    depth = coords[2] if len(coords) > 2 and coords[2] is not None else 10.0
+    return (
+        feature['id'],
+        month_of(props['time']),
+        int(props['time']),
+        int(props.get('updated') or props['time']),
+        props.get('mag'),
+        coords[0],
+        coords[1],
+        depth,
+        props.get('place'),
+        props.get('status'),
+        props.get('type'),
+        props.get('magType')
+    )
+
+def upsert_features(conn, features):
+    # inserts new events, replaces revised ones and removes deleted ones
+    # an older revision never overwrites a newer one
+    live = [f for f in features if f['properties'].get('status') != 'deleted']
+    deleted = [f['id'] for f in features if f['properties'].get('status') == 'deleted']
+
+    update_cols = ', '.join(f"{c} = excluded.{c}" for c in EVENT_COLUMNS[1:])
+    conn.executemany(
+        f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}) VALUES ({', '.join('?' * len(EVENT_COLUMNS))}) "
+        f"ON CONFLICT(id) DO UPDATE SET {update_cols} WHERE excluded.updated >= events.updated",
+        [feature_to_row(f) for f in live]
+    )
+    conn.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in deleted])
+
+    return [f['id'] for f in live], deleted
+
+def covers(stored, starttime, min_mag, bbox):
+    # does a catalog synced with the stored settings hold every event these settings ask for
+    if to_millis(starttime) < to_millis(stored['starttime']) or min_mag < stored['min_mag']:
+        return False
+    return (bbox['minlatitude'] >= stored['bbox']['minlatitude'] and bbox['maxlatitude'] <= stored['bbox']['maxlatitude']
+            and bbox['minlongitude'] >= stored['bbox']['minlongitude']
+            and bbox['maxlongitude'] <= stored['bbox']['maxlongitude'])
+
+def sync_catalog(db_path, starttime=None, min_mag=None, bbox=None, url=USGS_URL, timeout=60, max_retries=3):
+    # brings the local catalog up to date with USGS
+    # the first call downloads the whole window, later calls only ask for events
+    # updated after the last sync (FDSN updatedafter) and upsert those
+    # the query settings (starttime, min_mag, bbox) are fixed at the first sync,
+    # settings left out (None) or inside the stored ones (a later start, a higher
+    # magnitude, a smaller box) keep them, anything wider downloads the catalog
+    # again with the new settings (the result has 'resynced': True)
+    conn = open_catalog(db_path)
+    try:
+        stored = get_meta(conn, 'settings')
+        stored = json.loads(stored) if stored is not None else None
+        resync = False
+        if stored is None:
+            settings = {
+                'starttime': starttime if starttime is not None else (utc_now() - pd.Timedelta(days=365)).isoformat(),
+                'min_mag': float(min_mag) if min_mag is not None else 5.0,
+                'bbox': dict(bbox or ASIA_BBOX),
+            }
+        else:
+            settings = stored
+            requested = (
+                starttime if starttime is not None else stored['starttime'],
+                float(min_mag) if min_mag is not None else stored['min_mag'],
+                dict(bbox) if bbox is not None else stored['bbox'],
+            )
+            if not covers(stored, *requested):
+                settings = dict(zip(['starttime', 'min_mag', 'bbox'], requested))
+                resync = True
+
+        old_ids = []
+        if resync:
+            # start over, the events that aren't in the new window count as deleted
+            old_ids = [row[0] for row in conn.execute("SELECT id FROM events")]
+            conn.execute("DELETE FROM events")
+            conn.execute("DELETE FROM meta WHERE key = 'high_water'")
+        high_water = get_meta(conn, 'high_water')
+        starttime, min_mag = settings['starttime'], settings['min_mag']
+
+        params = {
+            "format": "geojson",
+            "starttime": starttime,
+            "minmagnitude": min_mag,
+            "includedeleted": "true",
+            **settings['bbox']
+        }
+        if high_water is not None:
+            params["updatedafter"] = millis_to_iso(high_water)
+
+        try:
+            features = fetch_earthquake_features(params, url=url, timeout=timeout, max_retries=max_retries)
+        except Exception as e:
+            print("Catalog sync failed:", e)
+            conn.rollback()
+            return None
+
+        upserted, deleted = upsert_features(conn, features)
+        if resync:
+            kept = set(upserted)
+            deleted = sorted(set(deleted) | {event_id for event_id in old_ids if event_id not in kept})
+
+        if features:
+            newest = max(int(f['properties'].get('updated') or f['properties']['time']) for f in features)
+            high_water = max(newest, int(high_water)) if high_water is not None else newest
+            set_meta(conn, 'high_water', high_water)
+        set_meta(conn, 'settings', json.dumps(settings))
+        conn.commit()
+
+        return {
+            'resynced': resync,
+            'fetched': len(features),
+            'upserted_ids': upserted,
+            'deleted_ids': deleted,
+            'high_water': int(high_water) if high_water is not None else None
+        }
+    finally:
+        conn.close()
+
+def query_catalog(db_path, starttime=None, endtime=None, min_mag=None, bbox=None, ids=None):
+    # reads events from the local catalog into the same kind of frame that
+    # acquire.get_earthquake_data returns
+    # ids limits the result to those events (e.g. the ones a sync just changed)
+    start_ms = to_millis(starttime)
+    end_ms = to_millis(endtime)
+
+    where = []
+    args = []
+    if start_ms is not None:
+        # month filter first so the index skips whole months
+        where += ["month >= ?", "time >= ?"]
+        args += [month_of(start_ms), start_ms]
+    if end_ms is not None:
+        where += ["month <= ?", "time <= ?"]
+        args += [month_of(end_ms), end_ms]
+    if min_mag is not None:
+        where.append("mag >= ?")
+        args.append(min_mag)
+    if bbox is not None:
+        where += ["lat >= ?", "lat <= ?", "lon >= ?", "lon <= ?"]
+        args += [bbox['minlatitude'], bbox['maxlatitude'], bbox['minlongitude'], bbox['maxlongitude']]
+    if ids is not None:
+        ids = list(ids)
+        where.append("id IN (SELECT value FROM json_each(?))")
+        args.append(json.dumps(ids))
+
+    sql = "SELECT id, mag, place, time, updated, status, type, magType, lon, lat, depth_km FROM events"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY time"
+
+    conn = open_catalog(db_path)
+    try:
+        df = pd.read_sql_query(sql, conn, params=args)
+    finally:
+        conn.close()
+
+    return frame_from_columns(df)
+
+def frame_from_columns(df):
+    # plain lon/lat/depth_km columns -> GeoDataFrame with 3D points
+    # (geopandas only loads once a query returns something)
+    import geopandas as gpd
+    geometry = shapely.points(
+        df['lon'].to_numpy(dtype=float),
+        df['lat'].to_numpy(dtype=float),
+        df['depth_km'].to_numpy(dtype=float)
+    )
+    df = df.drop(columns=['lon', 'lat'])
+    return gpd.GeoDataFrame(df, geometry=geometry, crs="EPSG:4326")
+
+def iter_catalog_chunks(db_path, chunk_size=100_000, min_mag=None):
+    # reads the local catalog in time order, chunk_size events at a time
+    # (keyset paging on time and id, so every chunk is one range scan of events_time_id)
+    conn = open_catalog(db_path)
+    try:
+        last = (-1, "")
+        while True:
+            sql = ("SELECT id, mag, place, time, updated, status, type, magType, lon, lat, depth_km FROM events "
+                   "WHERE (time, id) > (?, ?)")
+            args = [last[0], last[1]]
+            if min_mag is not None:
+                sql += " AND mag >= ?"
+                args.append(min_mag)
+            sql += " ORDER BY time, id LIMIT ?"
+            args.append(chunk_size)
+
+            df = pd.read_sql_query(sql, conn, params=args)
+            if df.empty:
+                return
+            last = (int(df['time'].iloc[-1]), df['id'].iloc[-1])
+            yield frame_from_columns(df)
+    finally:
+        conn.close()
+
+# columns of the parquet catalog files
+PARQUET_COLUMNS = ['id', 'time', 'mag', 'lon', 'lat', 'depth_km', 'place']
+
+def write_catalog_parquet(earthquakes_gdf, path, row_group_size=100_000):
+    # stores quakes as a time-sorted parquet file, one row group per chunk,
+    # so iter_parquet_chunks can stream it back a row group at a time
+    if earthquakes_gdf.crs is not None and not earthquakes_gdf.crs.is_geographic:
+        earthquakes_gdf = earthquakes_gdf.to_crs("EPSG:4326")
+    earthquakes_gdf = earthquakes_gdf.sort_values('time', kind='stable')
+
+    df = pd.DataFrame({
+        'id': earthquakes_gdf['id'].to_numpy(),
+        'time': earthquakes_gdf['time'].to_numpy(dtype=np.int64),
+        'mag': earthquakes_gdf['mag'].to_numpy(dtype=float),
+        'lon': earthquakes_gdf.geometry.x.to_numpy(),
+        'lat': earthquakes_gdf.geometry.y.to_numpy(),
+        'depth_km': earthquakes_gdf['depth_km'].to_numpy(dtype=float),
+        'place': earthquakes_gdf['place'].to_numpy(),
+    })
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, row_group_size=row_group_size)
+
+def iter_parquet_chunks(path):
+    # yields the quakes of a parquet catalog one row group at a time
+    parquet_file = pq.ParquetFile(path)
+    for i in range(parquet_file.num_row_groups):
+        yield frame_from_columns(parquet_file.read_row_group(i, columns=PARQUET_COLUMNS).to_pandas())
@@ -0,0 +1,239 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+import pandas as pd
+import shapely
+from earthquake_exposure import acquire, instrument, preprocess
+from earthquake_exposure.gmpe import GMPES
+
+# the notebook without jupyter: earthquake-exposure run [--config run.json] [--gmpe ba2008 ...]
+# writes the results and summary_statistics.txt like the last cells of
+# notebooks/exploration.ipynb, figures only with --figures (viz is imported just then)
+# the results are a pair of parquet files in seismic_risk_results/ (see results.py),
+# or the notebook's seismic_risk_results.csv with output_format 'csv'
+# every stage is cached under cache_dir by a hash of its settings and of the
+# content of its inputs, so changing the GMPE only recomputes the exposure and
+# changing the CRS only reprojects and recomputes, the downloads are kept
+
+DEFAULT_CONFIG = {
+    'start_date': '2025-01-01',
+    'end_date': '2025-12-31',
+    'min_magnitude': 5.0,
+    'min_population': 250000,
+    'target_crs': 'EPSG:4087',
+    'gmpe': 'cb2008',
+    'max_radius_km': 1500,
+    'top_n': 5,
+    'output_dir': 'outputs',
+    'output_format': 'parquet',
+    'cache_dir': 'data/pipeline',
+    'figures': [],
+}
+
+FIGURES = ('plotly', 'folium')
+OUTPUT_FORMATS = ('parquet', 'csv')
+
+def frame_hash(gdf):
+    # hash of everything in a (geo)frame: the columns, the geometry and the crs
+    digest = hashlib.sha1()
+    columns = [name for name in gdf.columns if name != 'geometry']
+    digest.update(pd.util.hash_pandas_object(gdf[columns], index=False).to_numpy().tobytes())
+    digest.update(repr(columns).encode())
+    if 'geometry' in gdf.columns:
+        digest.update(b"".join(shapely.to_wkb(gdf.geometry.to_numpy())))
+        digest.update(str(gdf.crs).encode())
+    return digest.hexdigest()[:16]
+
+def stage_key(stage, settings, inputs=()):
+    key = json.dumps({'stage': stage, 'settings': settings, 'inputs': [frame_hash(gdf) for gdf in inputs]},
+                     sort_keys=True, default=str)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def cached_stage(cache_dir, stage, settings, inputs, compute, log, refresh=False):
+    # the output of compute(*inputs) from the cache if these settings and inputs
+    # were run before, geo frames are GeoParquet and the exposure table a pickle
+    # (its top_contributing_quakes are lists of dicts)
+    key = stage_key(stage, settings, inputs)
+    parquet = os.path.join(cache_dir, f"{stage}-{key}.parquet")
+    pickle = os.path.join(cache_dir, f"{stage}-{key}.pkl")
+
+    if not refresh:
+        cached = acquire.read_geoparquet_cache(parquet, key)
+        if cached is None and os.path.exists(pickle):
+            cached = pd.read_pickle(pickle)
+        if cached is not None:
+            log[stage] = 'cached'
+            return cached
+
+    result = compute(*inputs)
+    if len(result):
+        if hasattr(result, 'geometry'):
+            acquire.write_geoparquet_cache(result, parquet, key)
+        else:
+            os.makedirs(cache_dir, exist_ok=True)
+            result.to_pickle(pickle + ".tmp")
+            os.replace(pickle + ".tmp", pickle)
+    log[stage] = 'computed'
+    return result
+
+def run_pipeline(config, refresh=False):
+    # acquire -> preprocess -> index and metrics, returns the sorted exposure table,
+    # the raw quakes and cities, and which stages were computed or cached
+    # scipy comes in with the exposure code, not needed for --help or a bad config
+    from earthquake_exposure.exposure import compute_exposure_table
+    if config['gmpe'] not in GMPES:
+        raise ValueError(f"Unknown GMPE: {config['gmpe']} (available: {', '.join(GMPES)})")
+    cache_dir = config['cache_dir']
+    log = {}
+
+    quakes = cached_stage(
+        cache_dir, 'quakes',
+        {name: config[name] for name in ['start_date', 'end_date', 'min_magnitude']}, (),
+        lambda: acquire.get_earthquake_data(start_date=config['start_date'], end_date=config['end_date'],
+                                            min_mag=config['min_magnitude']),
+        log, refresh=refresh,
+    )
+    cities = cached_stage(
+        cache_dir, 'cities', {'min_population': config['min_population']}, (),
+        lambda: acquire.load_asian_cities(min_population=config['min_population']),
+        log, refresh=refresh,
+    )
+    if quakes.empty or cities.empty:
+        return None, quakes, cities, log
+
+    quakes_metric = cached_stage(
+        cache_dir, 'quakes_metric', {'target_crs': config['target_crs']}, (quakes,),
+        lambda gdf: preprocess.clean_earthquake_data(preprocess.project_to_metric(gdf, config['target_crs'])),
+        log,
+    )
+    cities_metric = cached_stage(
+        cache_dir, 'cities_metric', {'target_crs': config['target_crs']}, (cities,),
+        lambda gdf: preprocess.project_to_metric(gdf, config['target_crs']),
+        log,
+    )
+    # the KD-tree and the felt-radius pairs are built inside compute_exposure_table
+    results = cached_stage(
+        cache_dir, 'exposure', {name: config[name] for name in ['gmpe', 'max_radius_km', 'top_n']},
+        (cities_metric, quakes_metric),
+        lambda c, q: compute_exposure_table(c, q, max_radius_km=config['max_radius_km'], top_n=config['top_n'],
+                                            gmpe=config['gmpe'])
+        .sort_values('max_pga', ascending=False).reset_index(drop=True),
+        log,
+    )
+    return results, quakes, cities, log
+
+def write_results(results, output_dir, output_format):
+    if output_format == 'csv':
+        results.to_csv(os.path.join(output_dir, "seismic_risk_results.csv"), index=False)
+    elif output_format == 'parquet':
+        from earthquake_exposure.results import write_exposure_parquet
+        write_exposure_parquet(results, os.path.join(output_dir, "seismic_risk_results"))
+    else:
+        raise ValueError(f"Unknown output format '{output_format}', use one of {', '.join(OUTPUT_FORMATS)}")
+
+def write_summary(path, results, quakes, config):
+    # same layout as the summary the notebook writes
+    with open(path, 'w') as f:
+        f.write("-" * 50 + "\n")
+        f.write("SEISMIC RISK ANALYSIS - SUMMARY STATISTICS\n")
+        f.write("-" * 50 + "\n\n")
+        f.write(f"Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n")
+        f.write(f"Time Period: {config['start_date']} to {config['end_date']}\n\n")
+        f.write(f"Total Cities Analyzed: {len(results)}\n")
+        f.write(f"Total Earthquakes: {len(quakes)}\n\n")
+        f.write("Risk Category Distribution:\n")
+        f.write(results['risk_category'].value_counts().to_string())
+        f.write("\n\nTop 10 Highest Risk Cities:\n")
+        f.write(results[['city_name', 'country', 'max_pga', 'risk_category']].head(10).to_string(index=False))
+
+def write_figures(figures, results, quakes, cities, output_dir):
+    # plotting libraries are only loaded here
+    if not figures:
+        return []
+    from earthquake_exposure import viz
+    written = []
+    if 'plotly' in figures:
+        path = os.path.join(output_dir, "interactive_risk_map.html")
+        viz.generate_plotly_map(cities, quakes, results, boundaries_gdf=acquire.get_country_boundaries()).write_html(path)
+        written.append(path)
+    if 'folium' in figures:
+        path = os.path.join(output_dir, "risk_map.html")
+        viz.generate_interactive_map(cities, quakes, results).save(path)
+        written.append(path)
+    return written
+
+def load_config(path=None, **overrides):
+    config = dict(DEFAULT_CONFIG)
+    if path:
+        with open(path) as f:
+            config.update(json.load(f))
+    config.update({name: value for name, value in overrides.items() if value is not None})
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown config keys: {', '.join(sorted(unknown))}")
+    return config
+
+def run(args):
+    config = load_config(
+        args.config, start_date=args.start_date, end_date=args.end_date, min_magnitude=args.min_magnitude,
+        min_population=args.min_population, target_crs=args.crs, gmpe=args.gmpe, max_radius_km=args.max_radius_km,
+        output_dir=args.output_dir, output_format=args.format, cache_dir=args.cache_dir, figures=args.figures,
+    )
+    if args.report:
+        instrument.reset()
+        instrument.enable()
+
+    results, quakes, cities, log = run_pipeline(config, refresh=args.refresh)
+    for stage, how in log.items():
+        print(f"{stage}: {how}")
+    if results is None:
+        print("No earthquakes or cities to work with, nothing written")
+        return 1
+
+    os.makedirs(config['output_dir'], exist_ok=True)
+    write_results(results, config['output_dir'], config['output_format'])
+    write_summary(os.path.join(config['output_dir'], "summary_statistics.txt"), results, quakes, config)
+    print(f"Wrote {len(results)} cities to {config['output_dir']}")
+    for path in write_figures(config['figures'], results, quakes, cities, config['output_dir']):
+        print(f"Wrote {path}")
+
+    if args.report:
+        instrument.write_report(args.report)
+        instrument.disable()
+    return 0
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="earthquake-exposure")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="fetch, compute and write the exposure results")
+    run_parser.add_argument('--config', help="JSON file with any of: " + ", ".join(DEFAULT_CONFIG))
+    run_parser.add_argument('--start-date')
+    run_parser.add_argument('--end-date')
+    run_parser.add_argument('--min-magnitude', type=float)
+    run_parser.add_argument('--min-population', type=int)
+    run_parser.add_argument('--crs', help="metric CRS the distances are measured in")
+    run_parser.add_argument('--gmpe', choices=list(GMPES))
+    run_parser.add_argument('--max-radius-km', type=float)
+    run_parser.add_argument('--output-dir')
+    run_parser.add_argument('--format', choices=OUTPUT_FORMATS, help="parquet (default) or the notebook's csv")
+    run_parser.add_argument('--cache-dir')
+    run_parser.add_argument('--figures', nargs='*', choices=FIGURES)
+    run_parser.add_argument('--refresh', action='store_true', help="download the quakes and cities again")
+    run_parser.add_argument('--report', help="write stage timings and counters (see instrument.py) to this JSON file")
+    run_parser.set_defaults(func=run)
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except ValueError as e:
+        print("Error:", e, file=sys.stderr)
+        return 2
+
+if __name__ == "__main__":
+    raise SystemExit(main())
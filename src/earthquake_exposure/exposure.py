@@ -0,0 +1,418 @@
+import hashlib
+import heapq
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy.spatial import cKDTree
+from earthquake_exposure import instrument, metrics, rupture, spatial_index
+from earthquake_exposure.gmpe import calculate_pga, DEFAULT_GMPE
+
+# columns of the exposure table, same as the dicts from calculate_city_risk_profile
+EXPOSURE_COLUMNS = [
+    'city_name', 'country', 'population', 'max_pga', 'risk_category',
+    'risk_description', 'num_earthquakes', 'num_shallow_quakes',
+    'max_magnitude', 'closest_quake_distance', 'top_contributing_quakes'
+]
+
+def get_quake_arrays(earthquakes_gdf):
+    # pulls the columns we need out of the earthquake frame as plain numpy arrays
+    n = len(earthquakes_gdf)
+
+    if 'mag' in earthquakes_gdf.columns:
+        mags = earthquakes_gdf['mag'].to_numpy(dtype=float)
+    else:
+        mags = np.full(n, 5.0)
+
+    # depth can come from the column or from the z coordinate, otherwise assume 10km
+    if 'depth_km' in earthquakes_gdf.columns:
+        depths = earthquakes_gdf['depth_km'].to_numpy(dtype=float)
+    elif n and earthquakes_gdf.geometry.has_z.all():
+        depths = earthquakes_gdf.geometry.z.to_numpy(dtype=float)
+    else:
+        depths = np.full(n, 10.0)
+
+    def column_or(name, default):
+        if name in earthquakes_gdf.columns:
+            return earthquakes_gdf[name].to_numpy(dtype=object)
+        return np.full(n, default, dtype=object)
+
+    return {
+        'id': column_or('id', 'unknown'),
+        'mag': mags,
+        'depth': depths,
+        'place': column_or('place', 'Unknown location'),
+        'time': column_or('time', 0)
+    }
+
+def get_city_vs30(cities_gdf):
+    # Vs30 (m/s) of every city if the frame has a vs30 column, otherwise the models assume rock
+    if 'vs30' in cities_gdf.columns:
+        return cities_gdf['vs30'].to_numpy(dtype=float)
+    return None
+
+def calculate_pair_pga(quakes, city_idx, quake_idx, dist_km, vs30=None, gmpe=DEFAULT_GMPE, source_depth=None):
+    # PGA of every city-quake pair with the ground motion model called gmpe (see gmpe.GMPES)
+    # source_depth replaces the hypocentre depth per pair (top of rupture for finite faults)
+    site = vs30[city_idx] if vs30 is not None else None
+    if source_depth is None:
+        source_depth = quakes['depth'][quake_idx]
+    return calculate_pga(quakes['mag'][quake_idx], dist_km, source_depth, vs30=site, gmpe=gmpe)
+
+def summarize_pairs(n_cities, city_idx, quake_idx, dist_km, pga, quakes, top_n=5):
+    # reduces flat city-quake pair arrays to one row of stats per city
+    mags = quakes['mag'][quake_idx]
+    depths = quakes['depth'][quake_idx]
+
+    num_quakes = np.bincount(city_idx, minlength=n_cities)
+    num_shallow = np.bincount(city_idx, weights=depths < 70, minlength=n_cities).astype(int)
+
+    max_pga = np.zeros(n_cities)
+    max_mag = np.zeros(n_cities)
+    min_dist = np.full(n_cities, np.inf)
+    top_quakes = [[] for _ in range(n_cities)]
+
+    if len(city_idx) == 0:
+        return _summary_dict(max_pga, num_quakes, num_shallow, max_mag, min_dist, top_quakes)
+
+    # sort by city, then biggest PGA first (ties keep catalog order like sorted() does)
+    order = np.lexsort((quake_idx, -pga, city_idx))
+    sorted_city = city_idx[order]
+    starts = np.flatnonzero(np.r_[True, sorted_city[1:] != sorted_city[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    hit = sorted_city[starts]
+
+    # first pair of every group is the max PGA because of the sort
+    max_pga[hit] = pga[order][starts]
+    max_mag[hit] = np.maximum.reduceat(mags[order], starts)
+    min_dist[hit] = np.minimum.reduceat(dist_km[order], starts)
+
+    # the top quakes are the first few pairs of every group
+    rank = np.arange(len(order)) - np.repeat(starts, ends - starts)
+    top = order[rank < top_n]
+    top_starts = np.flatnonzero(rank[rank < top_n] == 0)
+    top_ends = np.r_[top_starts[1:], len(top)]
+
+    # build all the dicts in one go from plain lists, then hand out slices per city
+    top_quake_idx = quake_idx[top]
+    records = [
+        {
+            'id': eq_id, 'magnitude': mag, 'depth': depth, 'depth_type': depth_type,
+            'horizontal_distance': dist, 'pga': value, 'place': place, 'time': time
+        }
+        for eq_id, mag, depth, depth_type, dist, value, place, time in zip(
+            quakes['id'][top_quake_idx].tolist(),
+            mags[top].tolist(),
+            depths[top].tolist(),
+            metrics.get_depth_types(depths[top]).tolist(),
+            dist_km[top].tolist(),
+            pga[top].tolist(),
+            quakes['place'][top_quake_idx].tolist(),
+            quakes['time'][top_quake_idx].tolist()
+        )
+    ]
+    for city, start, end in zip(hit.tolist(), top_starts.tolist(), top_ends.tolist()):
+        top_quakes[city] = records[start:end]
+
+    return _summary_dict(max_pga, num_quakes, num_shallow, max_mag, min_dist, top_quakes)
+
+def _summary_dict(max_pga, num_quakes, num_shallow, max_mag, min_dist, top_quakes):
+    return {
+        'max_pga': max_pga,
+        'num_earthquakes': num_quakes,
+        'num_shallow_quakes': num_shallow,
+        'max_magnitude': max_mag,
+        'closest_quake_distance': min_dist,
+        'top_contributing_quakes': top_quakes
+    }
+
+def build_exposure_table(cities_gdf, summary):
+    # turns the per-city stats into the same table the notebook loop produces
+    categories, descriptions = metrics.assign_risk_categories(summary['max_pga'])
+
+    # cities without any quake get their own description
+    no_quakes = summary['num_earthquakes'] == 0
+    descriptions = np.where(no_quakes, 'No significant shaking predicted', descriptions)
+
+    if 'country' in cities_gdf.columns:
+        country = cities_gdf['country'].to_numpy()
+    else:
+        country = 'Unknown'
+
+    table = pd.DataFrame({
+        'city_name': cities_gdf['name'].to_numpy(),
+        'country': country,
+        'population': cities_gdf['population'].to_numpy(),
+        'max_pga': summary['max_pga'],
+        'risk_category': categories,
+        'risk_description': descriptions,
+        'num_earthquakes': summary['num_earthquakes'],
+        'num_shallow_quakes': summary['num_shallow_quakes'],
+        'max_magnitude': summary['max_magnitude'],
+        'closest_quake_distance': summary['closest_quake_distance'],
+        'top_contributing_quakes': summary['top_contributing_quakes']
+    })
+    return table[EXPOSURE_COLUMNS]
+
+@instrument.timed("exposure.compute_exposure_table")
+def compute_exposure_table(cities_gdf, earthquakes_gdf, max_radius_km=1500, top_n=5, metric='planar', gmpe=DEFAULT_GMPE,
+                           finite_fault=False, fault_traces=None):
+    # batch version of the notebook loop: every city against every quake with numpy
+    # with metric='planar' both frames have to be in the same metric CRS (see
+    # preprocess.project_to_metric), with metric='greatcircle' lat/lon frames are fine
+    # finite_fault=True measures big quakes to their rupture instead of the epicentre
+    # (see rupture.find_rupture_pairs), distances are then Rjb for those quakes
+    source_depth = None
+    if finite_fault:
+        city_idx, quake_idx, dist_km, source_depth = rupture.find_rupture_pairs(
+            cities_gdf, earthquakes_gdf, max_radius_km=max_radius_km, metric=metric, fault_traces=fault_traces
+        )
+    else:
+        city_idx, quake_idx, dist_km = spatial_index.find_city_quake_pairs(
+            cities_gdf, earthquakes_gdf, max_radius_km=max_radius_km, metric=metric
+        )
+
+    quakes = get_quake_arrays(earthquakes_gdf)
+    pga = calculate_pair_pga(quakes, city_idx, quake_idx, dist_km, get_city_vs30(cities_gdf), gmpe, source_depth)
+
+    summary = summarize_pairs(len(cities_gdf), city_idx, quake_idx, dist_km, pga, quakes, top_n=top_n)
+    return build_exposure_table(cities_gdf, summary)
+
+class ExposureAccumulator:
+    # running per-city stats that batches of quakes are folded into one at a time
+    # the city tree is built once, so memory only depends on the batch size and
+    # not on the size of the whole catalog
+    # batches should come in catalog order so ties in the top quakes match the batch run
+
+    def __init__(self, cities_gdf, max_radius_km=1500, top_n=5, metric='planar', gmpe=DEFAULT_GMPE):
+        self.cities_gdf = cities_gdf
+        self.max_radius_km = max_radius_km
+        self.top_n = top_n
+        self.metric = metric
+        self.gmpe = gmpe
+        self.vs30 = get_city_vs30(cities_gdf)
+
+        self.city_coords = spatial_index.get_index_coords(cities_gdf, metric)
+        self.city_tree = cKDTree(self.city_coords)
+
+        n = len(cities_gdf)
+        self.max_pga = np.zeros(n)
+        self.num_earthquakes = np.zeros(n, dtype=np.int64)
+        self.num_shallow_quakes = np.zeros(n, dtype=np.int64)
+        self.max_magnitude = np.zeros(n)
+        self.closest_quake_distance = np.full(n, np.inf)
+        # min-heaps of (pga, -batch, -rank, record), so the weakest quake is popped first
+        self.top = [[] for _ in range(n)]
+        self.num_batches = 0
+        self.num_quakes_seen = 0
+
+    def add(self, earthquakes_gdf):
+        # folds one batch of quakes into the running stats
+        if len(earthquakes_gdf) == 0:
+            return
+        if self.metric == 'planar' and earthquakes_gdf.crs != self.cities_gdf.crs:
+            earthquakes_gdf = earthquakes_gdf.to_crs(self.cities_gdf.crs)
+
+        quakes = get_quake_arrays(earthquakes_gdf)
+        city_idx, quake_idx, dist_km = spatial_index.query_felt_pairs(
+            self.city_tree, self.city_coords,
+            spatial_index.get_index_coords(earthquakes_gdf, self.metric), quakes['mag'],
+            max_radius_km=self.max_radius_km, metric=self.metric
+        )
+        pga = calculate_pair_pga(quakes, city_idx, quake_idx, dist_km, self.vs30, self.gmpe)
+        batch = summarize_pairs(len(self.cities_gdf), city_idx, quake_idx, dist_km, pga, quakes, top_n=self.top_n)
+
+        np.maximum(self.max_pga, batch['max_pga'], out=self.max_pga)
+        np.maximum(self.max_magnitude, batch['max_magnitude'], out=self.max_magnitude)
+        np.minimum(self.closest_quake_distance, batch['closest_quake_distance'], out=self.closest_quake_distance)
+        self.num_earthquakes += batch['num_earthquakes']
+        self.num_shallow_quakes += batch['num_shallow_quakes']
+
+        # only the cities this batch touched need their top list merged
+        for city in np.flatnonzero(batch['num_earthquakes']).tolist():
+            heap = self.top[city]
+            for rank, record in enumerate(batch['top_contributing_quakes'][city]):
+                entry = (record['pga'], -self.num_batches, -rank, record)
+                if len(heap) < self.top_n:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+
+        self.num_batches += 1
+        self.num_quakes_seen += len(earthquakes_gdf)
+
+    def result(self):
+        # the exposure table for everything added so far
+        top_quakes = [[entry[3] for entry in sorted(heap, reverse=True)] for heap in self.top]
+        summary = _summary_dict(
+            self.max_pga, self.num_earthquakes, self.num_shallow_quakes,
+            self.max_magnitude, self.closest_quake_distance, top_quakes
+        )
+        return build_exposure_table(self.cities_gdf, summary)
+
+@instrument.timed("exposure.compute_exposure_streaming")
+def compute_exposure_streaming(cities_gdf, earthquake_batches, max_radius_km=1500, top_n=5, metric='planar',
+                               gmpe=DEFAULT_GMPE):
+    # same result as compute_exposure_table, but the quakes come in as an
+    # iterable of frames (e.g. catalog.iter_parquet_chunks) and are never all in memory
+    accumulator = ExposureAccumulator(cities_gdf, max_radius_km=max_radius_km, top_n=top_n, metric=metric, gmpe=gmpe)
+    for batch in earthquake_batches:
+        accumulator.add(batch)
+    return accumulator.result()
+
+class ExposureState:
+    # the exposure table kept up to date event by event instead of recomputed
+    # every city-quake pair inside the felt radius is stored, so a revised or
+    # deleted event can be taken out again and only the cities it touched
+    # (old or new location) get their stats recomputed
+
+    CONTRIBUTION_COLUMNS = ['city', 'event_id', 'magnitude', 'depth', 'dist_km', 'pga', 'place', 'time']
+
+    def __init__(self, cities_gdf, max_radius_km=1500, top_n=5, metric='planar', min_mag=None, gmpe=DEFAULT_GMPE):
+        self.cities_gdf = cities_gdf
+        self.max_radius_km = max_radius_km
+        self.top_n = top_n
+        self.metric = metric
+        self.min_mag = min_mag
+        self.gmpe = gmpe
+        self.vs30 = get_city_vs30(cities_gdf)
+        # free-form marker of what the state is up to date with (e.g. the catalog
+        # high water mark), stored with it so a stale saved state can be spotted
+        self.synced_to = None
+
+        self.city_coords = spatial_index.get_index_coords(cities_gdf, metric)
+        self.city_tree = cKDTree(self.city_coords)
+
+        self.contributions = pd.DataFrame({
+            'city': np.array([], dtype=np.intp),
+            'event_id': np.array([], dtype=object),
+            'magnitude': np.array([], dtype=float),
+            'depth': np.array([], dtype=float),
+            'dist_km': np.array([], dtype=float),
+            'pga': np.array([], dtype=float),
+            'place': np.array([], dtype=object),
+            'time': np.array([], dtype=object),
+        })
+        self.summary = summarize_pairs(
+            len(cities_gdf), np.array([], dtype=np.intp), np.array([], dtype=np.intp),
+            np.array([]), np.array([]), {'mag': np.array([]), 'depth': np.array([])}, top_n=top_n
+        )
+
+    def find_contributions(self, events_gdf):
+        # the pairs of these events, as rows for the contributions table
+        if self.metric == 'planar' and events_gdf.crs != self.cities_gdf.crs:
+            events_gdf = events_gdf.to_crs(self.cities_gdf.crs)
+
+        quakes = get_quake_arrays(events_gdf)
+        city_idx, quake_idx, dist_km = spatial_index.query_felt_pairs(
+            self.city_tree, self.city_coords,
+            spatial_index.get_index_coords(events_gdf, self.metric), quakes['mag'],
+            max_radius_km=self.max_radius_km, metric=self.metric
+        )
+        return pd.DataFrame({
+            'city': city_idx,
+            'event_id': quakes['id'][quake_idx],
+            'magnitude': quakes['mag'][quake_idx],
+            'depth': quakes['depth'][quake_idx],
+            'dist_km': dist_km,
+            'pga': calculate_pair_pga(quakes, city_idx, quake_idx, dist_km, self.vs30, self.gmpe),
+            'place': quakes['place'][quake_idx],
+            'time': quakes['time'][quake_idx],
+        })
+
+    def apply_new_events(self, events_gdf, deleted_ids=()):
+        # adds new events, replaces revised ones (same id) and removes deleted ones
+        # (rows with status 'deleted' or ids in deleted_ids), returns the affected cities
+        events_gdf = events_gdf.reset_index(drop=True)
+        ids = set(events_gdf['id']) | set(deleted_ids) if len(events_gdf) else set(deleted_ids)
+
+        live = events_gdf
+        if 'status' in live.columns:
+            live = live[live['status'] != 'deleted']
+        if self.min_mag is not None and len(live):
+            # a revision below the threshold counts as a removal
+            live = live[live['mag'] >= self.min_mag]
+
+        old = self.contributions['event_id'].isin(ids)
+        new_rows = self.find_contributions(live) if len(live) else self.contributions.iloc[:0]
+        affected = np.union1d(self.contributions.loc[old, 'city'].to_numpy(), new_rows['city'].to_numpy())
+
+        self.contributions = pd.concat([self.contributions[~old], new_rows], ignore_index=True)
+        self.refresh_cities(affected)
+        return affected
+
+    def expire(self, before):
+        # drops events older than `before` (same units as the time column),
+        # for exposure over a moving window
+        old = self.contributions['time'].to_numpy() < before
+        affected = np.unique(self.contributions.loc[old, 'city'].to_numpy())
+        self.contributions = self.contributions[~old].reset_index(drop=True)
+        self.refresh_cities(affected)
+        return affected
+
+    def refresh_cities(self, cities):
+        # recomputes the stats of some cities from their stored contributions
+        if len(cities) == 0:
+            return
+        rows = self.contributions[self.contributions['city'].isin(cities)]
+        # catalog order (time, then id) breaks ties between equal PGAs like the batch run
+        rows = rows.sort_values(['time', 'event_id'], kind='stable')
+
+        quakes = {
+            'id': rows['event_id'].to_numpy(dtype=object),
+            'mag': rows['magnitude'].to_numpy(dtype=float),
+            'depth': rows['depth'].to_numpy(dtype=float),
+            'place': rows['place'].to_numpy(dtype=object),
+            'time': rows['time'].to_numpy(dtype=object),
+        }
+        partial = summarize_pairs(
+            len(self.cities_gdf), rows['city'].to_numpy(dtype=np.intp), np.arange(len(rows)),
+            rows['dist_km'].to_numpy(dtype=float), rows['pga'].to_numpy(dtype=float), quakes, top_n=self.top_n
+        )
+        for name, values in partial.items():
+            if name == 'top_contributing_quakes':
+                for city in cities:
+                    self.summary[name][city] = values[city]
+            else:
+                self.summary[name][cities] = values[cities]
+
+    def result(self):
+        return build_exposure_table(self.cities_gdf, self.summary)
+
+    def save(self, path):
+        # stores the contributions as parquet, the cities themselves are not stored
+        # but a fingerprint of them is, so load() can tell they still match
+        table = pa.Table.from_pandas(self.contributions, preserve_index=False)
+        settings = {
+            'max_radius_km': self.max_radius_km, 'top_n': self.top_n, 'metric': self.metric,
+            'min_mag': self.min_mag, 'gmpe': self.gmpe, 'cities': city_fingerprint(self.cities_gdf), 'synced_to': self.synced_to
+        }
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'exposure_state': json.dumps(settings)})
+        pq.write_table(table, path)
+
+    @classmethod
+    def load(cls, path, cities_gdf):
+        table = pq.read_table(path)
+        settings = json.loads(table.schema.metadata[b'exposure_state'])
+        if settings.pop('cities') != city_fingerprint(cities_gdf):
+            raise ValueError("Saved exposure state was computed for a different city list")
+
+        synced_to = settings.pop('synced_to', None)
+        state = cls(cities_gdf, **settings)
+        state.synced_to = synced_to
+        contributions = table.to_pandas()
+        contributions['event_id'] = contributions['event_id'].astype(object)
+        contributions['time'] = contributions['time'].astype(object)
+        state.contributions = contributions
+        state.refresh_cities(np.unique(contributions['city'].to_numpy()))
+        return state
+
+def city_fingerprint(cities_gdf):
+    # short hash of the city count, names and lon/lat in order (to 1e-6 degrees,
+    # so a round trip through a projection doesn't change it)
+    lon, lat = spatial_index.get_lonlat(cities_gdf)
+    digest = hashlib.sha1(str(len(cities_gdf)).encode())
+    digest.update("\n".join(cities_gdf['name'].astype(str)).encode())
+    digest.update(np.round(np.column_stack([lon, lat]).astype(float), 6).tobytes())
+    return digest.hexdigest()[:16]
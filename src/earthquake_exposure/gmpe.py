@@ -0,0 +1,127 @@
+import numpy as np
+from earthquake_exposure.metrics import calculate_pga_gmpe
+
+# ground motion models (GMPEs) that can be picked by name
+# every model takes arrays of magnitude, horizontal distance (km), depth (km) and
+# optionally Vs30 (m/s) and returns PGA in g, evaluated in the dtype asked for
+# (float32 halves the memory of big pair arrays and is a bit faster)
+# the standard deviations are in natural log units: tau is between events
+# (inter-event), phi is within an event (intra-event)
+
+def _as_arrays(dtype, *values):
+    return [None if v is None else np.asarray(v, dtype=dtype) for v in values]
+
+def cb2008_simplified(magnitude, distance_km, depth_km, vs30=None, dtype=np.float64):
+    # the simplified Campbell-Bozorgnia (2008) formula from metrics.calculate_pga_gmpe
+    # it has no site term, so vs30 is ignored
+    magnitude, distance_km, depth_km = _as_arrays(dtype, magnitude, distance_km, depth_km)
+    return calculate_pga_gmpe(magnitude, distance_km, depth_km)
+
+# Boore & Atkinson (2008) PGA coefficients, unspecified fault type
+BA08 = {
+    'e1': -0.53804, 'e5': 0.28805, 'e6': -0.10164, 'e7': 0.0, 'mh': 6.75,
+    'c1': -0.66050, 'c2': 0.11970, 'c3': -0.01151, 'h': 1.35, 'mref': 4.5, 'rref': 1.0,
+    'blin': -0.360, 'b1': -0.640, 'b2': -0.14, 'vref': 760.0, 'v1': 180.0, 'v2': 300.0,
+    'a1': 0.03, 'a2': 0.09, 'pga_low': 0.06,
+}
+
+def _ba08_rock(magnitude, distance_km):
+    # ln PGA on the reference rock (Vs30 = 760), the magnitude and distance terms
+    c = BA08
+    r = np.sqrt(distance_km ** 2 + c['h'] ** 2)
+    dm = magnitude - c['mh']
+    f_m = np.where(dm <= 0, c['e1'] + c['e5'] * dm + c['e6'] * dm ** 2, c['e1'] + c['e7'] * dm)
+    f_d = (c['c1'] + c['c2'] * (magnitude - c['mref'])) * np.log(r / c['rref']) + c['c3'] * (r - c['rref'])
+    return f_m + f_d
+
+def _ba08_site(vs30, pga4nl):
+    # linear plus nonlinear site amplification (ln units)
+    c = BA08
+    f_lin = c['blin'] * np.log(vs30 / c['vref'])
+
+    bnl = np.where(
+        vs30 <= c['v1'], c['b1'],
+        np.where(
+            vs30 <= c['v2'], (c['b1'] - c['b2']) * np.log(vs30 / c['v2']) / np.log(c['v1'] / c['v2']) + c['b2'],
+            np.where(vs30 < c['vref'], c['b2'] * np.log(vs30 / c['vref']) / np.log(c['v2'] / c['vref']), 0.0)
+        )
+    )
+    dx = np.log(c['a2'] / c['a1'])
+    dy = bnl * np.log(c['a2'] / c['pga_low'])
+    cc = (3 * dy - bnl * dx) / dx ** 2
+    dd = -(2 * dy - bnl * dx) / dx ** 3
+    x = np.log(np.maximum(pga4nl, c['a1']) / c['a1'])
+
+    f_nl = np.where(
+        pga4nl <= c['a1'], bnl * np.log(c['pga_low'] / 0.1),
+        np.where(
+            pga4nl <= c['a2'], bnl * np.log(c['pga_low'] / 0.1) + cc * x ** 2 + dd * x ** 3,
+            bnl * np.log(pga4nl / 0.1)
+        )
+    )
+    return f_lin + f_nl
+
+def boore_atkinson_2008(magnitude, distance_km, depth_km, vs30=None, dtype=np.float64):
+    # Boore & Atkinson (2008) NGA model for shallow crustal quakes
+    # distance is Joyner-Boore, for point sources that is just the horizontal distance
+    # so depth is not used; without vs30 the site is taken as rock (760 m/s)
+    magnitude, distance_km, vs30 = _as_arrays(dtype, magnitude, distance_km, vs30)
+    ln_rock = _ba08_rock(magnitude, distance_km)
+    if vs30 is None:
+        return np.exp(ln_rock)
+    return np.exp(ln_rock + _ba08_site(vs30, np.exp(ln_rock)))
+
+def youngs_1997(magnitude, distance_km, depth_km, vs30=None, dtype=np.float64):
+    # Youngs et al. (1997) for subduction zone quakes, with rupture distance taken as
+    # the hypocentral distance; events deeper than 50 km count as intraslab,
+    # shallower ones as interface; vs30 below 360 m/s uses the soil coefficients
+    magnitude, distance_km, depth_km, vs30 = _as_arrays(dtype, magnitude, distance_km, depth_km, vs30)
+    r_rup = np.sqrt(distance_km ** 2 + depth_km ** 2)
+    z_t = (depth_km > 50).astype(r_rup.dtype)
+
+    ln_rock = (0.2418 + 1.414 * magnitude - 2.552 * np.log(r_rup + 1.7818 * np.exp(0.554 * magnitude))
+               + 0.00607 * depth_km + 0.3846 * z_t)
+    if vs30 is None:
+        return np.exp(ln_rock)
+
+    ln_soil = (-0.6687 + 1.438 * magnitude - 2.329 * np.log(r_rup + 1.097 * np.exp(0.617 * magnitude))
+               + 0.00648 * depth_km + 0.3643 * z_t)
+    return np.exp(np.where(vs30 < 360, ln_soil, ln_rock))
+
+def cb2008_sigma(magnitude):
+    # Campbell & Bozorgnia (2008) PGA values
+    magnitude = np.asarray(magnitude, dtype=float)
+    return np.full(magnitude.shape, 0.219), np.full(magnitude.shape, 0.478)
+
+def ba2008_sigma(magnitude):
+    # Boore & Atkinson (2008) PGA, unspecified fault type
+    magnitude = np.asarray(magnitude, dtype=float)
+    return np.full(magnitude.shape, 0.265), np.full(magnitude.shape, 0.502)
+
+def youngs1997_sigma(magnitude):
+    # the paper only gives a total sigma (1.45 - 0.1 M, fixed above M8), it is
+    # split into tau and phi with the same ratio as Boore & Atkinson (2008)
+    total = 1.45 - 0.1 * np.minimum(np.asarray(magnitude, dtype=float), 8.0)
+    share = 0.265 / np.hypot(0.265, 0.502)
+    return total * share, total * np.sqrt(1 - share ** 2)
+
+GMPES = {
+    'cb2008': {'pga': cb2008_simplified, 'sigma': cb2008_sigma},
+    'ba2008': {'pga': boore_atkinson_2008, 'sigma': ba2008_sigma},
+    'youngs1997': {'pga': youngs_1997, 'sigma': youngs1997_sigma},
+}
+
+DEFAULT_GMPE = 'cb2008'
+
+def get_gmpe(name):
+    if name not in GMPES:
+        raise ValueError(f"Unknown GMPE: {name} (available: {', '.join(GMPES)})")
+    return GMPES[name]
+
+def calculate_pga(magnitude, distance_km, depth_km, vs30=None, gmpe=DEFAULT_GMPE, dtype=np.float64):
+    # PGA in g from the model called gmpe
+    return get_gmpe(gmpe)['pga'](magnitude, distance_km, depth_km, vs30=vs30, dtype=dtype)
+
+def get_sigma(magnitude, gmpe=DEFAULT_GMPE):
+    # (tau, phi) in ln units for every magnitude
+    return get_gmpe(gmpe)['sigma'](magnitude)
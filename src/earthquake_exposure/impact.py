@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+from earthquake_exposure import metrics, spatial_index
+from earthquake_exposure.gmpe import calculate_pga, DEFAULT_GMPE
+from earthquake_exposure.exposure import get_city_vs30
+
+class CityImpactIndex:
+    # a long-lived index over the cities for "which cities does this new quake hit"
+    # everything about the cities is built once, so a query is one tree lookup plus
+    # a few numpy operations on the cities in range
+
+    def __init__(self, names, countries, population, coords, vs30=None, tree=None, crs=None,
+                 metric='greatcircle', max_radius_km=1500, gmpe=DEFAULT_GMPE):
+        # the city arrays in tree order, coords in the space of the metric (unit
+        # vectors, or x/y in crs for planar), the tree is built on coords if not given
+        # from_frame and from_artifacts are the usual ways in
+        self.metric = metric
+        self.max_radius_km = max_radius_km
+        self.gmpe = gmpe
+        self.names = names
+        self.countries = countries
+        self.population = population
+        self.vs30 = vs30
+        self.coords = coords
+        self.tree = tree if tree is not None else cKDTree(coords)
+
+        # in planar mode events come in as lon/lat, so keep a transformer around
+        self.transformer = None
+        if metric == 'planar':
+            self.transformer = Transformer.from_crs('EPSG:4326', crs, always_xy=True)
+
+    @classmethod
+    def from_frame(cls, cities_gdf, metric='greatcircle', max_radius_km=1500, gmpe=DEFAULT_GMPE):
+        if 'country' in cities_gdf.columns:
+            countries = cities_gdf['country'].to_numpy()
+        else:
+            countries = np.full(len(cities_gdf), 'Unknown', dtype=object)
+        return cls(
+            cities_gdf['name'].to_numpy(), countries, cities_gdf['population'].to_numpy(),
+            spatial_index.get_index_coords(cities_gdf, metric), vs30=get_city_vs30(cities_gdf), crs=cities_gdf.crs,
+            metric=metric, max_radius_km=max_radius_km, gmpe=gmpe,
+        )
+
+    @classmethod
+    def from_artifacts(cls, city_artifacts, max_radius_km=1500, gmpe=DEFAULT_GMPE):
+        # great-circle index straight from a prebuilt artifacts.CityArtifacts,
+        # the coordinates stay memory-mapped and nothing is reprojected
+        return cls(
+            city_artifacts.names, city_artifacts.countries, city_artifacts.arrays['population'],
+            city_artifacts.arrays['unit_xyz'], vs30=city_artifacts.arrays.get('vs30'), tree=city_artifacts.kdtree(),
+            metric='greatcircle', max_radius_km=max_radius_km, gmpe=gmpe,
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def event_coords(self, lon, lat):
+        # lon/lat arrays -> coordinates in the same space as the city tree
+        if self.metric == 'greatcircle':
+            return spatial_index.lonlat_to_unit_vectors(lon, lat)
+        x, y = self.transformer.transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        return np.column_stack([np.atleast_1d(x), np.atleast_1d(y)])
+
+    def affected_cities_batch(self, lon, lat, mag, depth_km=10.0, event_id=None):
+        # all cities inside the felt radius of each event, with PGA and risk category
+        # returns one row per affected city and event, strongest shaking first
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        mag = np.broadcast_to(np.asarray(mag, dtype=float), lon.shape)
+        depth = np.broadcast_to(np.asarray(depth_km, dtype=float), lon.shape)
+        if event_id is None:
+            event_id = np.arange(len(lon))
+        event_id = np.broadcast_to(np.asarray(event_id, dtype=object), lon.shape)
+
+        city_idx, event_idx, dist_km = spatial_index.query_felt_pairs(
+            self.tree, self.coords, self.event_coords(lon, lat), mag,
+            max_radius_km=self.max_radius_km, metric=self.metric, counter='impact_pairs'
+        )
+        site = self.vs30[city_idx] if self.vs30 is not None else None
+        pga = calculate_pga(mag[event_idx], dist_km, depth[event_idx], vs30=site, gmpe=self.gmpe)
+        categories, descriptions = metrics.assign_risk_categories(pga)
+
+        result = pd.DataFrame({
+            'event_id': event_id[event_idx],
+            'city_name': self.names[city_idx],
+            'country': self.countries[city_idx],
+            'population': self.population[city_idx],
+            'distance_km': dist_km,
+            'pga': pga,
+            'risk_category': categories,
+            'risk_description': descriptions
+        })
+        return result.sort_values('pga', ascending=False, kind='stable').reset_index(drop=True)
+
+    def affected_cities(self, lon, lat, mag, depth_km=10.0):
+        # same for a single event
+        result = self.affected_cities_batch(lon, lat, mag, depth_km)
+        return result.drop(columns='event_id')
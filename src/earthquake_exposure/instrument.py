@@ -0,0 +1,131 @@
+import functools
+import json
+import resource
+import sys
+import threading
+import time
+
+# timers, counters and memory high-water marks for the pipeline
+# only the stage-level entry points are timed (@timed on get_earthquake_data,
+# compute_exposure_table, generate_plotly_map, ...), never the scalar helpers that
+# run once per row, and nothing is recorded until enable() is called
+# find_city_quake_pairs is the one stage that also runs inside another
+# (compute_exposure_table), its time is part of both
+
+_enabled = False
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_started = time.time()
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    global _started
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _started = time.time()
+
+def max_rss_mb():
+    # the process high-water mark (ru_maxrss is in KB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+def record(name, seconds, peak_before, peak_after):
+    with _lock:
+        stage = _stages.get(name)
+        if stage is None:
+            stage = _stages[name] = {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'raised_peak_mb': 0.0}
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+        stage['max_seconds'] = max(stage['max_seconds'], seconds)
+        # how much the process high-water mark went up while this stage ran
+        stage['raised_peak_mb'] += peak_after - peak_before
+
+class stage:
+    # times a block: with instrument.stage("exposure.update"): ...
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _enabled:
+            self.peak = max_rss_mb()
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if _enabled and hasattr(self, 'start'):
+            record(self.name, time.perf_counter() - self.start, self.peak, max_rss_mb())
+
+def count(name, value=1):
+    # adds value to a counter (events fetched, candidate pairs, ...)
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + int(value)
+
+def timed(name):
+    # decorator that records every call of the function as a stage
+    def wrap(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            peak = max_rss_mb()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start, peak, max_rss_mb())
+        return wrapper
+    return wrap
+
+def report():
+    # everything recorded since the last reset, slowest stages first
+    with _lock:
+        stages = [{'stage': name, **values} for name, values in _stages.items()]
+        counters = dict(_counters)
+    stages.sort(key=lambda s: s['seconds'], reverse=True)
+    return {
+        'started': _started,
+        'elapsed_seconds': time.time() - _started,
+        'max_rss_mb': max_rss_mb(),
+        'stages': stages,
+        'counters': counters,
+    }
+
+def write_report(path):
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=2)
+
+def prometheus_text(prefix="earthquake_exposure"):
+    # the report in the Prometheus text format
+    current = report()
+    lines = [
+        f"# HELP {prefix}_stage_seconds_total Time spent in each pipeline stage.",
+        f"# TYPE {prefix}_stage_seconds_total counter",
+    ]
+    lines += [f'{prefix}_stage_seconds_total{{stage="{s["stage"]}"}} {s["seconds"]:.6f}' for s in current['stages']]
+    lines += [
+        f"# HELP {prefix}_stage_calls_total Calls of each pipeline stage.",
+        f"# TYPE {prefix}_stage_calls_total counter",
+    ]
+    lines += [f'{prefix}_stage_calls_total{{stage="{s["stage"]}"}} {s["calls"]}' for s in current['stages']]
+    for name, value in sorted(current['counters'].items()):
+        lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {value}"]
+    lines += [
+        f"# HELP {prefix}_max_rss_bytes Peak resident memory of the process.",
+        f"# TYPE {prefix}_max_rss_bytes gauge",
+        f"{prefix}_max_rss_bytes {int(current['max_rss_mb'] * 1e6)}",
+    ]
+    return "\n".join(lines) + "\n"
@@ -1,6 +1,17 @@
 import pandas as pd
 import numpy as np
 
+# lower PGA bound of each risk category (same numbers as calculate_city_risk_profile)
+RISK_THRESHOLDS = np.array([0.02, 0.1, 0.3, 0.5])
+RISK_CATEGORIES = np.array(['MINIMAL', 'LOW', 'MODERATE', 'HIGH', 'CRITICAL'])
+RISK_DESCRIPTIONS = np.array([
+    'Not felt or weak shaking',
+    'Felt by some, no damage',
+    'Felt widely, slight damage',
+    'Moderate to heavy damage',
+    'Severe potential damage'
+])
+
 def calculate_pga_gmpe(magnitude, distance_km, depth_km):
     # ok so this is the PGA formula from Campbell-Bozorgnia (2008)
     # basically it tells us how much the ground shakes
@@ -126,3 +137,14 @@ def calculate_city_risk_profile(city, nearby_earthquakes):
         'closest_quake_distance': min_dist,
         'top_contributing_quakes': top_quakes[:5]  # just keep the top 5
     }
+
+def assign_risk_categories(max_pga):
+    # categorizes a whole array of PGA values at once
+    # searchsorted tells us how many thresholds each value is above
+    levels = np.searchsorted(RISK_THRESHOLDS, np.asarray(max_pga, dtype=float), side='right')
+    return RISK_CATEGORIES[levels], RISK_DESCRIPTIONS[levels]
+
+def get_depth_types(depths):
+    # SHALLOW / INTERMEDIATE / DEEP labels for an array of depths
+    levels = np.searchsorted([70, 300], np.asarray(depths, dtype=float), side='right')
+    return np.array(['SHALLOW', 'INTERMEDIATE', 'DEEP'])[levels]
@@ -0,0 +1,148 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from scipy.spatial import cKDTree
+from earthquake_exposure import spatial_index
+from earthquake_exposure.gmpe import calculate_pga, DEFAULT_GMPE
+from earthquake_exposure.exposure import get_quake_arrays, get_city_vs30, summarize_pairs, build_exposure_table
+
+# runs the exposure calculation over blocks of cities in a process pool
+# the quake arrays (coordinates, magnitude, depth) are copied once into shared
+# memory, workers attach to them when they start and only get a block of city
+# coordinates per task, so no GeoDataFrame is ever pickled
+
+# the per-worker view of the shared quake arrays, filled in by _attach_worker
+_shared = {}
+
+def share_arrays(arrays):
+    # copies a dict of numpy arrays into one shared memory block
+    # returns the block and the layout (offset, shape, dtype) needed to attach to it
+    layout = {}
+    size = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        layout[name] = (size, array.shape, array.dtype.str)
+        size += (array.nbytes + 63) // 64 * 64
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for name, view in attach_arrays(shm, layout).items():
+        view[...] = arrays[name]
+    return shm, layout
+
+def attach_arrays(shm, layout):
+    # numpy views on a shared memory block, nothing is copied
+    return {
+        name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        for name, (offset, shape, dtype) in layout.items()
+    }
+
+def _attach_worker(shm_name, layout):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared['shm'] = shm
+    _shared['arrays'] = attach_arrays(shm, layout)
+    # stands in for ids/places/times in the worker, the parent swaps the real ones in
+    _shared['positions'] = np.arange(len(_shared['arrays']['mag']))
+
+def _exposure_block(city_coords, city_vs30, settings):
+    # stats for one block of cities against the shared quakes
+    arrays = _shared['arrays']
+    eq_coords, mags, depths = arrays['coords'], arrays['mag'], arrays['depth']
+    max_radius_km = settings['max_radius_km']
+    metric = settings['metric']
+
+    # only quakes inside the block's bounding box grown by the max radius can reach it
+    if metric == 'greatcircle':
+        reach = spatial_index.km_to_chord(max_radius_km)
+    else:
+        reach = max_radius_km * 1000
+    near = np.all((eq_coords >= city_coords.min(axis=0) - reach) & (eq_coords <= city_coords.max(axis=0) + reach), axis=1)
+    if settings['min_mag'] is not None:
+        near &= mags >= settings['min_mag']
+    near = np.flatnonzero(near)
+
+    # the block tree is small, rebuilding it per task is cheaper than shipping it
+    city_idx, quake_idx, dist_km = spatial_index.query_felt_pairs(
+        cKDTree(city_coords), city_coords, eq_coords[near], mags[near],
+        max_radius_km=max_radius_km, metric=metric
+    )
+    quake_idx = near[quake_idx]
+    site = city_vs30[city_idx] if city_vs30 is not None else None
+    pga = calculate_pga(mags[quake_idx], dist_km, depths[quake_idx], vs30=site, gmpe=settings['gmpe'])
+
+    positions = _shared['positions']
+    quakes = {'mag': mags, 'depth': depths, 'id': positions, 'place': positions, 'time': positions}
+    return summarize_pairs(len(city_coords), city_idx, quake_idx, dist_km, pga, quakes, top_n=settings['top_n'])
+
+def run_scenarios(cities_gdf, earthquakes_gdf, scenarios, top_n=5, metric='planar', max_workers=None, n_blocks=None):
+    # one exposure table per scenario, every (scenario, city block) pair is a task
+    # a scenario is a dict with max_radius_km (default 1500), min_mag (default all quakes)
+    # and/or gmpe (a name from gmpe.GMPES)
+    if metric == 'planar' and earthquakes_gdf.crs != cities_gdf.crs:
+        earthquakes_gdf = earthquakes_gdf.to_crs(cities_gdf.crs)
+
+    quakes = get_quake_arrays(earthquakes_gdf)
+    city_coords = spatial_index.get_index_coords(cities_gdf, metric)
+    vs30 = get_city_vs30(cities_gdf)
+    max_workers = max_workers or os.cpu_count() or 1
+    blocks = spatial_index.partition_cities(spatial_index.get_point_coords(cities_gdf), n_blocks or 4 * max_workers)
+
+    shm, layout = share_arrays({
+        'coords': spatial_index.get_index_coords(earthquakes_gdf, metric),
+        'mag': quakes['mag'],
+        'depth': quakes['depth'],
+    })
+    try:
+        with ProcessPoolExecutor(max_workers, initializer=_attach_worker, initargs=(shm.name, layout)) as pool:
+            futures = []
+            for scenario in scenarios:
+                settings = {
+                    'max_radius_km': scenario.get('max_radius_km', 1500),
+                    'min_mag': scenario.get('min_mag'),
+                    'gmpe': scenario.get('gmpe', DEFAULT_GMPE),
+                    'metric': metric,
+                    'top_n': top_n,
+                }
+                futures.append([
+                    pool.submit(_exposure_block, city_coords[block], vs30[block] if vs30 is not None else None, settings)
+                    for block in blocks
+                ])
+
+            return [merge_blocks(cities_gdf, blocks, [f.result() for f in block_futures], quakes)
+                    for block_futures in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+def merge_blocks(cities_gdf, blocks, summaries, quakes):
+    # puts the block results back in city order and swaps the quake positions
+    # in the top quakes for the real ids, places and times
+    n = len(cities_gdf)
+    merged = {
+        'max_pga': np.zeros(n),
+        'num_earthquakes': np.zeros(n, dtype=np.int64),
+        'num_shallow_quakes': np.zeros(n, dtype=np.int64),
+        'max_magnitude': np.zeros(n),
+        'closest_quake_distance': np.full(n, np.inf),
+        'top_contributing_quakes': [[] for _ in range(n)]
+    }
+    ids, places, times = quakes['id'], quakes['place'], quakes['time']
+
+    for block, summary in zip(blocks, summaries):
+        for name in ['max_pga', 'num_earthquakes', 'num_shallow_quakes', 'max_magnitude', 'closest_quake_distance']:
+            merged[name][block] = summary[name]
+        for city, records in zip(block.tolist(), summary['top_contributing_quakes']):
+            for record in records:
+                i = record['id']
+                record['id'], record['place'], record['time'] = ids[i], places[i], times[i]
+            merged['top_contributing_quakes'][city] = records
+
+    return build_exposure_table(cities_gdf, merged)
+
+def compute_exposure_parallel(cities_gdf, earthquakes_gdf, max_radius_km=1500, top_n=5, metric='planar',
+                              gmpe=DEFAULT_GMPE, max_workers=None, n_blocks=None):
+    # same result as exposure.compute_exposure_table, spread over processes
+    return run_scenarios(
+        cities_gdf, earthquakes_gdf, [{'max_radius_km': max_radius_km, 'gmpe': gmpe}], top_n=top_n, metric=metric,
+        max_workers=max_workers, n_blocks=n_blocks
+    )[0]
@@ -0,0 +1,171 @@
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from scipy.spatial import cKDTree
+from earthquake_exposure import metrics, spatial_index
+from earthquake_exposure.gmpe import calculate_pga, DEFAULT_GMPE
+from earthquake_exposure.exposure import get_quake_arrays
+
+# cities as areas instead of points: population lives on a lon/lat grid of cells,
+# PGA is worked out for every cell and we count how many people end up above
+# each risk threshold, per city and per country
+# cells are a plain DataFrame with lon, lat and population columns (plus vs30 if known)
+
+# categories we count people for, with the lower PGA bound of each
+EXPOSED_CATEGORIES = list(zip(metrics.RISK_CATEGORIES[1:], metrics.RISK_THRESHOLDS))
+
+def exposed_column(category):
+    return f'people_{category.lower()}'
+
+def make_synthetic_population_grid(cities_gdf, cell_deg=0.05, seed=0):
+    # spreads every city's population over nearby cells with a gaussian, bigger
+    # cities spreading further; cells are snapped to one global lattice so
+    # neighbouring cities add up in the same cells
+    lon, lat = spatial_index.get_lonlat(cities_gdf)
+    population = cities_gdf['population'].to_numpy(dtype=float)
+    rng = np.random.default_rng(seed)
+
+    frames = []
+    for x, y, people in zip(lon, lat, population):
+        spread_km = 3 + 4 * np.sqrt(people / 1e6)
+        half = int(np.ceil(3 * spread_km / (111.0 * cell_deg)))
+        offsets = np.arange(-half, half + 1)
+        cell_lon = (np.round(x / cell_deg) + offsets)[None, :] * cell_deg
+        cell_lat = (np.round(y / cell_deg) + offsets)[:, None] * cell_deg
+        cell_lon, cell_lat = np.broadcast_arrays(cell_lon, cell_lat)
+
+        km_x = (cell_lon - x) * 111.0 * np.cos(np.radians(y))
+        km_y = (cell_lat - y) * 111.0
+        weights = np.exp(-(km_x ** 2 + km_y ** 2) / (2 * spread_km ** 2)) * rng.uniform(0.5, 1.5, cell_lon.shape)
+        frames.append(pd.DataFrame({
+            'lon': cell_lon.ravel(), 'lat': cell_lat.ravel(),
+            'population': (people * weights / weights.sum()).ravel()
+        }))
+
+    cells = pd.concat(frames, ignore_index=True)
+    cells[['lon', 'lat']] = cells[['lon', 'lat']].round(6)
+    return cells.groupby(['lon', 'lat'], as_index=False)['population'].sum()
+
+def load_population_grid(path):
+    # a local grid (e.g. exported from WorldPop or GHS-POP) as parquet or csv
+    # with one row per cell and lon, lat, population columns
+    if os.path.splitext(path)[1] == '.parquet':
+        cells = pd.read_parquet(path)
+    else:
+        cells = pd.read_csv(path)
+    return cells[cells['population'] > 0].reset_index(drop=True)
+
+def assign_cells(cells, cities_gdf, city_areas=None, city_radius_km=30, countries=None):
+    # which city (row of the output table) and country every cell belongs to
+    # cities are the polygons in city_areas (needs name and country columns) if
+    # given, otherwise every cell within city_radius_km goes to its nearest city
+    # countries come from country polygons (name column) if given, otherwise a
+    # cell takes the country of its nearest city
+    cell_xyz = spatial_index.lonlat_to_unit_vectors(cells['lon'].to_numpy(), cells['lat'].to_numpy())
+    city_lon, city_lat = spatial_index.get_lonlat(cities_gdf)
+    city_xyz = spatial_index.lonlat_to_unit_vectors(city_lon, city_lat)
+    dist, nearest = cKDTree(city_xyz).query(cell_xyz)
+
+    if city_areas is not None:
+        owners = city_areas[['name', 'country']].reset_index(drop=True)
+        owner = _polygon_index(cells, city_areas)
+    else:
+        owners = pd.DataFrame({'name': cities_gdf['name'].to_numpy(), 'country': get_countries(cities_gdf)})
+        owner = np.where(dist <= spatial_index.km_to_chord(city_radius_km), nearest, -1)
+
+    if countries is not None:
+        in_country = _polygon_index(cells, countries)
+        country = np.where(in_country >= 0, countries['name'].to_numpy(dtype=object)[in_country], 'Unknown')
+    else:
+        country = get_countries(cities_gdf)[nearest]
+    return owner, owners, country
+
+def _polygon_index(cells, polygons):
+    # position of the polygon every cell falls in, -1 outside all of them
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(cells['lon'], cells['lat']), crs='EPSG:4326')
+    polygons = polygons.reset_index(drop=True)
+    if polygons.crs is not None and polygons.crs != points.crs:
+        polygons = polygons.to_crs(points.crs)
+    joined = gpd.sjoin(points, polygons[['geometry']], predicate='within', how='left')
+    joined = joined[~joined.index.duplicated(keep='first')]
+    return joined['index_right'].fillna(-1).to_numpy(dtype=np.int64)
+
+def get_countries(cities_gdf):
+    if 'country' in cities_gdf.columns:
+        return cities_gdf['country'].to_numpy(dtype=object)
+    return np.full(len(cities_gdf), 'Unknown', dtype=object)
+
+def compute_cell_pga(cells, earthquakes_gdf, max_radius_km=1500, gmpe=DEFAULT_GMPE, tile_size=50_000,
+                     quake_chunk=2000):
+    # max PGA over all quakes for every cell
+    # cells are cut into compact tiles with their own KD-tree, every tile only
+    # looks at quakes that can reach its bounding box, and those go through in
+    # chunks of quake_chunk, so memory stays bounded whatever the grid size
+    cell_xyz = spatial_index.lonlat_to_unit_vectors(cells['lon'].to_numpy(), cells['lat'].to_numpy())
+    vs30 = cells['vs30'].to_numpy(dtype=float) if 'vs30' in cells.columns else None
+    max_pga = np.zeros(len(cells))
+
+    quakes = get_quake_arrays(earthquakes_gdf)
+    eq_lon, eq_lat = spatial_index.get_lonlat(earthquakes_gdf)
+    eq_xyz = spatial_index.lonlat_to_unit_vectors(eq_lon, eq_lat)
+    reach = spatial_index.km_to_chord(max_radius_km)
+
+    n_tiles = max(int(np.ceil(len(cells) / tile_size)), 1)
+    for tile in spatial_index.partition_cities(cells[['lon', 'lat']].to_numpy(), n_tiles):
+        tile_xyz = cell_xyz[tile]
+        tree = cKDTree(tile_xyz)
+        near = np.all((eq_xyz >= tile_xyz.min(axis=0) - reach) & (eq_xyz <= tile_xyz.max(axis=0) + reach), axis=1)
+        near = np.flatnonzero(near)
+
+        for start in range(0, len(near), quake_chunk):
+            chunk = near[start:start + quake_chunk]
+            cell_idx, quake_idx, dist_km = spatial_index.query_felt_pairs(
+                tree, tile_xyz, eq_xyz[chunk], quakes['mag'][chunk], max_radius_km=max_radius_km, metric='greatcircle',
+                counter=None
+            )
+            quake_idx = chunk[quake_idx]
+            site = vs30[tile][cell_idx] if vs30 is not None else None
+            pga = calculate_pga(quakes['mag'][quake_idx], dist_km, quakes['depth'][quake_idx], vs30=site, gmpe=gmpe)
+            np.maximum.at(max_pga, tile[cell_idx], pga)
+
+    return max_pga
+
+def summarize_population(group, population, max_pga, names):
+    # population-weighted stats per group (city or country position, -1 = none)
+    keep = group >= 0
+    group, population, max_pga = group[keep], population[keep], max_pga[keep]
+    n = len(names)
+
+    table = pd.DataFrame({'population': np.bincount(group, weights=population, minlength=n)})
+    for category, threshold in EXPOSED_CATEGORIES:
+        table[exposed_column(category)] = np.bincount(group, weights=population * (max_pga >= threshold), minlength=n)
+    weighted = np.bincount(group, weights=population * max_pga, minlength=n)
+    table['mean_pga'] = np.divide(weighted, table['population'], out=np.zeros(n), where=table['population'] > 0)
+    peak = np.zeros(n)
+    np.maximum.at(peak, group, max_pga)
+    table['max_pga'] = peak
+    return table
+
+def compute_population_exposure(cells, cities_gdf, earthquakes_gdf, max_radius_km=1500, gmpe=DEFAULT_GMPE,
+                                city_areas=None, city_radius_km=30, countries=None, tile_size=50_000,
+                                quake_chunk=2000):
+    # people exposed above each risk threshold, per city and per country
+    # returns (city table, country table), population columns are people, PGA in g
+    max_pga = compute_cell_pga(cells, earthquakes_gdf, max_radius_km=max_radius_km, gmpe=gmpe,
+                               tile_size=tile_size, quake_chunk=quake_chunk)
+    population = cells['population'].to_numpy(dtype=float)
+    owner, owners, country = assign_cells(cells, cities_gdf, city_areas=city_areas,
+                                          city_radius_km=city_radius_km, countries=countries)
+
+    city_table = pd.concat([
+        owners.rename(columns={'name': 'city_name'}),
+        summarize_population(owner, population, max_pga, owners['name'])
+    ], axis=1)
+
+    country_names, country_idx = np.unique(country.astype(str), return_inverse=True)
+    country_table = pd.concat([
+        pd.DataFrame({'country': country_names}),
+        summarize_population(country_idx, population, max_pga, country_names)
+    ], axis=1)
+    return city_table, country_table.sort_values(exposed_column('LOW'), ascending=False, ignore_index=True)
@@ -1,5 +1,6 @@
-import geopandas as gpd
+from earthquake_exposure import instrument
 
+@instrument.timed("preprocess.project_to_metric")
 def project_to_metric(gdf, target_crs='EPSG:4087'):
     # Convert to a projection that measures distances in meters
     # EPSG:4087 is World Equidistant Cylindrical which works well for Asia
@@ -8,6 +9,7 @@ def project_to_metric(gdf, target_crs='EPSG:4087'):
         
     return gdf.to_crs(target_crs)
 
+@instrument.timed("preprocess.clean_earthquake_data")
 def clean_earthquake_data(gdf):
     # Remove rows with missing data
     gdf = gdf[gdf.geometry.notnull()].copy()
@@ -0,0 +1,138 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from earthquake_exposure import instrument
+from earthquake_exposure.exposure import EXPOSURE_COLUMNS
+
+# the exposure table as two parquet files instead of a CSV with a python repr
+# of the top quakes in every cell:
+#   cities.parquet         one row per city, city_id is its row
+#   contributions.parquet  the top contributing quakes, one row per city and
+#                          quake, keyed by city_id and the USGS event id
+# floats are float32 (a PGA doesn't need 16 digits), repeated strings
+# (country, category, depth type, event ids, places) are dictionary encoded
+# cities are written grouped by country and contributions by city, so reading
+# one country or category only decodes the row groups that have it
+
+FORMAT_VERSION = 1
+# rank is int16, top_n in the thousands is fine
+MAX_RANK = np.iinfo(np.int16).max
+CITIES_FILE = "cities.parquet"
+CONTRIBUTIONS_FILE = "contributions.parquet"
+
+def dictionary(values):
+    # missing values (None, NaN) stay null instead of becoming "None"/"nan"
+    return pa.array(np.asarray(values, dtype=object), type=pa.string(), from_pandas=True).dictionary_encode()
+
+def cities_table(exposure_df):
+    return pa.table({
+        'city_id': pa.array(np.arange(len(exposure_df)), pa.int32()),
+        'city_name': pa.array(exposure_df['city_name'].astype(str).to_numpy()),
+        'country': dictionary(exposure_df['country']),
+        'population': pa.array(exposure_df['population'].to_numpy(dtype=np.int64)),
+        'max_pga': pa.array(exposure_df['max_pga'].to_numpy(dtype=np.float32)),
+        'risk_category': dictionary(exposure_df['risk_category']),
+        'risk_description': dictionary(exposure_df['risk_description']),
+        'num_earthquakes': pa.array(exposure_df['num_earthquakes'].to_numpy(dtype=np.int32)),
+        'num_shallow_quakes': pa.array(exposure_df['num_shallow_quakes'].to_numpy(dtype=np.int32)),
+        'max_magnitude': pa.array(exposure_df['max_magnitude'].to_numpy(dtype=np.float32)),
+        'closest_quake_distance': pa.array(exposure_df['closest_quake_distance'].to_numpy(dtype=np.float32)),
+    })
+
+def contributions_table(exposure_df):
+    # top_contributing_quakes flattened, rank 0 is the quake with the highest PGA
+    top = exposure_df['top_contributing_quakes'].tolist()
+    lengths = np.array([len(quakes) for quakes in top], dtype=np.int64)
+    if len(lengths) and lengths.max() > MAX_RANK + 1:
+        raise ValueError(f"At most {MAX_RANK + 1} contributing quakes per city can be written, got {lengths.max()}")
+    records = [record for quakes in top for record in quakes]
+
+    def column(name, dtype):
+        return np.array([record[name] for record in records], dtype=dtype)
+
+    return pa.table({
+        'city_id': pa.array(np.repeat(np.arange(len(top)), lengths), pa.int32()),
+        'rank': pa.array(np.arange(len(records)) - np.repeat(np.cumsum(lengths) - lengths, lengths), pa.int16()),
+        'event_id': dictionary(column('id', object)),
+        'magnitude': pa.array(column('magnitude', np.float32)),
+        'depth': pa.array(column('depth', np.float32)),
+        'depth_type': dictionary(column('depth_type', object)),
+        'horizontal_distance': pa.array(column('horizontal_distance', np.float32)),
+        'pga': pa.array(column('pga', np.float32)),
+        'place': dictionary(column('place', object)),
+        'time': pa.array(column('time', np.int64)),
+    })
+
+@instrument.timed("results.write_exposure_parquet")
+def write_exposure_parquet(exposure_df, folder, row_group_size=10_000):
+    # writes cities.parquet and contributions.parquet into folder, returns their paths
+    # the cities are reordered by country first (city_id follows the new order)
+    exposure_df = exposure_df.sort_values('country', kind='stable').reset_index(drop=True)
+    os.makedirs(folder, exist_ok=True)
+    metadata = {b'exposure_format': str(FORMAT_VERSION).encode()}
+
+    paths = []
+    for name, table in [(CITIES_FILE, cities_table(exposure_df)), (CONTRIBUTIONS_FILE, contributions_table(exposure_df))]:
+        path = os.path.join(folder, name)
+        table = table.replace_schema_metadata(metadata)
+        pq.write_table(table, path + ".tmp", row_group_size=row_group_size, compression='zstd')
+        os.replace(path + ".tmp", path)
+        paths.append(path)
+    return paths
+
+@instrument.timed("results.read_exposure_parquet")
+def read_exposure_parquet(folder, country=None, category=None, contributions=True):
+    # the cities (and their contributing quakes) of one or more countries and/or
+    # risk categories, the filters are pushed down into the parquet reader
+    # returns (cities, contributions), contributions is None with contributions=False
+    filters = []
+    if country is not None:
+        filters.append(('country', 'in', [country] if isinstance(country, str) else list(country)))
+    if category is not None:
+        filters.append(('risk_category', 'in', [category] if isinstance(category, str) else list(category)))
+
+    cities = pq.read_table(os.path.join(folder, CITIES_FILE), filters=filters or None).to_pandas()
+    if not contributions:
+        return cities, None
+
+    path = os.path.join(folder, CONTRIBUTIONS_FILE)
+    if filters:
+        # city ids are contiguous per country, a range lets the row group stats skip the rest
+        ids = cities['city_id'].to_numpy()
+        if len(ids) == 0:
+            return cities, pq.read_schema(path).empty_table().to_pandas()
+        quake_filters = [('city_id', '>=', int(ids.min())), ('city_id', '<=', int(ids.max())),
+                         ('city_id', 'in', ids.tolist())]
+        quakes = pq.read_table(path, filters=quake_filters).to_pandas()
+    else:
+        quakes = pq.read_table(path).to_pandas()
+    return cities, quakes
+
+def to_exposure_table(cities, contributions):
+    # back to the exposure table shape (top_contributing_quakes as lists of dicts),
+    # for code that still wants that
+    table = cities.copy()
+    for name in ['country', 'risk_category', 'risk_description']:
+        table[name] = table[name].astype(object)
+
+    records = pd.DataFrame({
+        'id': contributions['event_id'].astype(object),
+        'magnitude': contributions['magnitude'].astype(float),
+        'depth': contributions['depth'].astype(float),
+        'depth_type': contributions['depth_type'].astype(object),
+        'horizontal_distance': contributions['horizontal_distance'].astype(float),
+        'pga': contributions['pga'].astype(float),
+        'place': contributions['place'].astype(object),
+        'time': contributions['time'],
+    })
+    order = np.lexsort((contributions['rank'].to_numpy(), contributions['city_id'].to_numpy()))
+    records = records.iloc[order].to_dict('records')
+    city_ids = contributions['city_id'].to_numpy()[order]
+
+    by_city = {}
+    for city_id, record in zip(city_ids.tolist(), records):
+        by_city.setdefault(city_id, []).append(record)
+    table['top_contributing_quakes'] = [by_city.get(city_id, []) for city_id in table['city_id'].tolist()]
+    return table[EXPOSURE_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,166 @@
+import itertools
+import numpy as np
+from scipy.spatial import cKDTree
+from earthquake_exposure import instrument, spatial_index
+
+# finite-fault distances for big quakes
+# a M7.7 ruptures a fault a few hundred km long, so a city 100 km from the
+# epicentre can be a few km from the fault; treating it as a point puts the
+# shaking far too low. Quakes from min_rupture_mag up get a vertical line
+# source centred on the epicentre (or the fault trace given for them) and the
+# distance to the city becomes the distance to that line (Rjb), with the top of
+# the rupture as the depth (so the GMPEs that add depth work with Rrup).
+# Smaller quakes stay points and go through the usual spatial_index path.
+# Ruptures are measured with the same metric as the points: on the sphere
+# (local azimuthal equidistant km around the epicentre) for 'greatcircle', in
+# the projected CRS of the frames for 'planar', so a city's distance to a big
+# quake and to a small one at the same place agree either way.
+
+MIN_RUPTURE_MAG = 6.5
+
+def rupture_length_km(magnitude):
+    # Wells & Coppersmith (1994) subsurface rupture length, all slip types
+    return 10 ** (-2.44 + 0.59 * np.asarray(magnitude, dtype=float))
+
+def rupture_width_km(magnitude):
+    # Wells & Coppersmith (1994) downdip rupture width, all slip types
+    return 10 ** (-1.01 + 0.32 * np.asarray(magnitude, dtype=float))
+
+def top_of_rupture_km(magnitude, depth_km):
+    # the hypocentre is taken as the middle of a vertical rupture
+    return np.maximum(np.asarray(depth_km, dtype=float) - rupture_width_km(magnitude) / 2, 0.0)
+
+def distance_and_azimuth(lon0, lat0, lon, lat):
+    # great-circle distance (km) and azimuth (radians from north) from lon0/lat0 to lon/lat
+    lon0, lat0, lon, lat = (np.radians(np.asarray(v, dtype=float)) for v in (lon0, lat0, lon, lat))
+    dlon = lon - lon0
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat) * np.sin(dlon / 2) ** 2
+    dist = 2 * spatial_index.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    azimuth = np.arctan2(np.sin(dlon) * np.cos(lat), np.cos(lat0) * np.sin(lat) - np.sin(lat0) * np.cos(lat) * np.cos(dlon))
+    return dist, azimuth
+
+def to_local_km(lon0, lat0, lon, lat):
+    # azimuthal equidistant x/y (km) around lon0/lat0, lines through the centre stay straight
+    dist, azimuth = distance_and_azimuth(lon0, lat0, lon, lat)
+    return dist * np.sin(azimuth), dist * np.cos(azimuth)
+
+def point_segment_distance(px, py, ax, ay, bx, by):
+    # distance from points p to segments a-b, all arrays broadcast together
+    dx, dy = bx - ax, by - ay
+    length2 = dx ** 2 + dy ** 2
+    t = np.where(length2 > 0, ((px - ax) * dx + (py - ay) * dy) / np.where(length2 > 0, length2, 1), 0.0)
+    t = np.clip(t, 0, 1)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+def trace_distance(city_x, city_y, trace_x, trace_y):
+    # distance from cities to a polyline given by its vertices, min over its segments
+    dist = point_segment_distance(
+        city_x[:, None], city_y[:, None], trace_x[None, :-1], trace_y[None, :-1], trace_x[None, 1:], trace_y[None, 1:]
+    )
+    return dist.min(axis=1)
+
+def get_trace_vertices(trace):
+    # a shapely LineString or a sequence of (lon, lat) -> lon and lat arrays
+    coords = np.asarray(trace.coords if hasattr(trace, 'coords') else trace, dtype=float)
+    return coords[:, 0], coords[:, 1]
+
+def to_planar_km(lon, lat, crs):
+    # lon/lat (a fault trace) into the projected CRS of the frames, in km
+    from pyproj import Transformer
+    x, y = Transformer.from_crs('EPSG:4326', crs, always_xy=True).transform(lon, lat)
+    return np.asarray(x, dtype=float) / 1000, np.asarray(y, dtype=float) / 1000
+
+def find_rupture_pairs(cities_gdf, earthquakes_gdf, max_radius_km=1500, metric='planar',
+                       min_rupture_mag=MIN_RUPTURE_MAG, fault_traces=None):
+    # like spatial_index.find_city_quake_pairs, but quakes from min_rupture_mag up
+    # are measured to their rupture instead of their epicentre
+    # returns city position, quake position, distance in km (Rjb for ruptures) and
+    # the source depth to use in the GMPE (top of rupture for ruptures, else the hypocentre)
+    # the orientation of a rupture comes from fault_traces ({event id: LineString or
+    # [(lon, lat), ...]}), then from a strike column (degrees); without either the
+    # closest any orientation could get is used, i.e. the epicentral distance minus
+    # half the rupture length
+    # metric='planar' measures in the projected CRS (strikes are taken as bearings
+    # in it, right for north-up projections like the default EPSG:4087)
+    mags = spatial_index.get_magnitudes(earthquakes_gdf)
+    depths = earthquakes_gdf['depth_km'].to_numpy(dtype=float) if 'depth_km' in earthquakes_gdf.columns \
+        else np.full(len(earthquakes_gdf), 10.0)
+    fault_traces = fault_traces or {}
+    ids = earthquakes_gdf['id'].to_numpy(dtype=object) if 'id' in earthquakes_gdf.columns \
+        else np.full(len(earthquakes_gdf), None, dtype=object)
+
+    large = mags >= min_rupture_mag
+    if fault_traces:
+        large |= np.isin(ids, list(fault_traces))
+    points = np.flatnonzero(~large)
+    ruptures = np.flatnonzero(large)
+
+    # the many small quakes take the point source path
+    city_idx, point_idx, dist_km = spatial_index.find_city_quake_pairs(
+        cities_gdf, earthquakes_gdf.iloc[points], max_radius_km=max_radius_km, metric=metric
+    )
+    pairs = [(city_idx, points[point_idx], dist_km, depths[points[point_idx]])]
+
+    if len(ruptures):
+        rupture_gdf = earthquakes_gdf.iloc[ruptures]
+        eq_lon, eq_lat = spatial_index.get_lonlat(rupture_gdf)
+        mags, depths = mags[ruptures], depths[ruptures]
+        lengths = rupture_length_km(mags)
+        strikes = earthquakes_gdf['strike'].to_numpy(dtype=float)[ruptures] if 'strike' in earthquakes_gdf.columns \
+            else np.full(len(ruptures), np.nan)
+
+        if metric == 'planar':
+            city_xy = spatial_index.get_index_coords(cities_gdf, metric) / 1000
+            eq_xy = spatial_index.get_index_coords(rupture_gdf, metric) / 1000
+        else:
+            city_lon, city_lat = spatial_index.get_lonlat(cities_gdf)
+
+        traces = {}
+        for i, event_id in enumerate(ids[ruptures]):
+            if event_id in fault_traces:
+                trace_lon, trace_lat = get_trace_vertices(fault_traces[event_id])
+                if metric == 'planar':
+                    trace_x, trace_y = to_planar_km(trace_lon, trace_lat, cities_gdf.crs)
+                    trace_x, trace_y = trace_x - eq_xy[i, 0], trace_y - eq_xy[i, 1]
+                else:
+                    trace_x, trace_y = to_local_km(eq_lon[i], eq_lat[i], trace_lon, trace_lat)
+                traces[i] = (trace_x, trace_y)
+                lengths[i] = 2 * np.hypot(trace_x, trace_y).max()
+
+        # candidate cities: the felt radius grown by half the rupture length, so a
+        # city near the end of a long rupture is still found
+        felt_km = np.minimum(spatial_index.get_magnitude_based_radii(mags), max_radius_km)
+        if metric == 'planar':
+            hits = cKDTree(city_xy).query_ball_point(eq_xy, r=felt_km + lengths / 2)
+        else:
+            hits = cKDTree(spatial_index.lonlat_to_unit_vectors(city_lon, city_lat)).query_ball_point(
+                spatial_index.lonlat_to_unit_vectors(eq_lon, eq_lat), r=spatial_index.km_to_chord(felt_km + lengths / 2)
+            )
+        # flatten the list-per-rupture result like query_felt_pairs does
+        counts = np.fromiter((len(h) for h in hits), dtype=np.intp, count=len(hits))
+        rup_idx = np.repeat(np.arange(len(ruptures)), counts)
+        cand_city = np.fromiter(itertools.chain.from_iterable(hits), dtype=np.intp, count=counts.sum())
+
+        if metric == 'planar':
+            x, y = (city_xy[cand_city] - eq_xy[rup_idx]).T
+        else:
+            x, y = to_local_km(eq_lon[rup_idx], eq_lat[rup_idx], city_lon[cand_city], city_lat[cand_city])
+        half = lengths[rup_idx] / 2
+        strike = np.radians(strikes[rup_idx])
+        end_x, end_y = half * np.sin(strike), half * np.cos(strike)
+        rjb = np.where(
+            np.isnan(strike),
+            np.maximum(np.hypot(x, y) - half, 0.0),
+            point_segment_distance(x, y, -end_x, -end_y, end_x, end_y)
+        )
+        for i, (trace_x, trace_y) in traces.items():
+            rows = rup_idx == i
+            rjb[rows] = trace_distance(x[rows], y[rows], trace_x, trace_y)
+
+        keep = rjb <= felt_km[rup_idx]
+        instrument.count('pairs_candidate', len(keep))
+        instrument.count('pairs_kept', keep.sum())
+        rup_idx, cand_city, rjb = rup_idx[keep], cand_city[keep], rjb[keep]
+        pairs.append((cand_city, ruptures[rup_idx], rjb, top_of_rupture_km(mags[rup_idx], depths[rup_idx])))
+
+    return tuple(np.concatenate(parts) for parts in zip(*pairs))
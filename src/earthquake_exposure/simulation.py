@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+from earthquake_exposure import metrics, spatial_index
+from earthquake_exposure.gmpe import calculate_pga, get_sigma, DEFAULT_GMPE
+from earthquake_exposure.exposure import get_quake_arrays, get_city_vs30
+
+# Monte-Carlo version of the exposure table: instead of the median PGA only,
+# every simulation draws the GMPE scatter for all quakes and we count how often
+# the strongest shaking at a city goes over each threshold
+# ln PGA = ln median + tau * eta (one per quake, shared by every city, so
+# cities shaken by the same quake are correlated) + phi * eps (one per pair)
+
+def exceedance_columns(thresholds):
+    return [f'p_exceed_{t:g}g' for t in thresholds]
+
+def simulate_exceedance(cities_gdf, earthquakes_gdf, thresholds=metrics.RISK_THRESHOLDS, n_sims=1000,
+                        chunk_size=100_000, sims_per_block=100, seed=0, max_epsilon=4.0,
+                        max_radius_km=1500, metric='planar', gmpe=DEFAULT_GMPE):
+    # per city P(max PGA over all quakes > threshold), one column per threshold
+    # pairs are processed chunk_size at a time and simulations sims_per_block at a time,
+    # so the working arrays are float32 blocks of sims_per_block columns:
+    # chunk_size rows for the pair draws, one row per quake for eta and one per
+    # city for the running max, memory grows with the quakes and cities but not
+    # with the number of pairs (the pair arrays themselves are a few floats per pair)
+    # the same seed and sims_per_block give the same numbers for any chunk_size
+    # epsilons are truncated at max_epsilon, so pairs that can't reach the lowest
+    # threshold even at +max_epsilon are dropped before sampling
+    thresholds = np.asarray(thresholds, dtype=float)
+    n_cities = len(cities_gdf)
+
+    city_idx, quake_idx, dist_km = spatial_index.find_city_quake_pairs(
+        cities_gdf, earthquakes_gdf, max_radius_km=max_radius_km, metric=metric
+    )
+    quakes = get_quake_arrays(earthquakes_gdf)
+    vs30 = get_city_vs30(cities_gdf)
+    site = vs30[city_idx] if vs30 is not None else None
+
+    median = calculate_pga(quakes['mag'][quake_idx], dist_km, quakes['depth'][quake_idx], vs30=site, gmpe=gmpe)
+    tau, phi = get_sigma(quakes['mag'], gmpe=gmpe)
+
+    ln_thresholds = np.log(thresholds).astype(np.float32)
+    reachable = np.log(median) + max_epsilon * (tau[quake_idx] + phi[quake_idx]) > ln_thresholds.min()
+
+    # pairs sorted by city, so the max per city in a chunk is a reduceat over runs
+    order = np.flatnonzero(reachable)
+    order = order[np.argsort(city_idx[order], kind='stable')]
+    city_idx, quake_idx = city_idx[order], quake_idx[order]
+    ln_median = np.log(median[order]).astype(np.float32)
+    pair_phi = phi[quake_idx].astype(np.float32)
+    pair_tau = tau[quake_idx].astype(np.float32)
+
+    counts = np.zeros((n_cities, len(thresholds)), dtype=np.int64)
+    for block_start in range(0, n_sims, sims_per_block):
+        n_block = min(sims_per_block, n_sims - block_start)
+        rng = np.random.default_rng([seed, block_start])
+        # everything is (pairs or quakes, sims), so the gathers below copy whole rows
+        # and the stream doesn't depend on how pairs are chunked
+        eta = np.clip(rng.standard_normal((len(quakes['mag']), n_block), dtype=np.float32), -max_epsilon, max_epsilon)
+        max_ln = np.full((n_cities, n_block), -np.inf, dtype=np.float32)
+
+        for start in range(0, len(city_idx), chunk_size):
+            end = min(start + chunk_size, len(city_idx))
+            ln_pga = rng.standard_normal((end - start, n_block), dtype=np.float32)
+            np.clip(ln_pga, -max_epsilon, max_epsilon, out=ln_pga)
+            ln_pga *= pair_phi[start:end, None]
+            ln_pga += pair_tau[start:end, None] * eta[quake_idx[start:end]]
+            ln_pga += ln_median[start:end, None]
+
+            chunk_city = city_idx[start:end]
+            runs = np.flatnonzero(np.r_[True, chunk_city[1:] != chunk_city[:-1]])
+            run_city = chunk_city[runs]
+            max_ln[run_city] = np.maximum(max_ln[run_city], np.maximum.reduceat(ln_pga, runs, axis=0))
+
+        # one threshold at a time, a (cities, sims, thresholds) mask would be the biggest array here
+        for t, ln_threshold in enumerate(ln_thresholds):
+            counts[:, t] += (max_ln > ln_threshold).sum(axis=1)
+
+    if 'country' in cities_gdf.columns:
+        country = cities_gdf['country'].to_numpy()
+    else:
+        country = 'Unknown'
+
+    table = pd.DataFrame({
+        'city_name': cities_gdf['name'].to_numpy(),
+        'country': country,
+        'population': cities_gdf['population'].to_numpy(),
+    })
+    probabilities = pd.DataFrame(counts / max(n_sims, 1), columns=exceedance_columns(thresholds))
+    return pd.concat([table, probabilities], axis=1)
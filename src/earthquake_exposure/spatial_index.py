@@ -1,6 +1,10 @@
+import itertools
 import numpy as np
 from scipy.spatial import cKDTree
-import geopandas as gpd
+from earthquake_exposure import instrument
+
+# mean earth radius, used for great-circle distances
+EARTH_RADIUS_KM = 6371.0088
 
 def build_kdtree(earthquakes_gdf):
     # builds a KD-tree so we can search for nearby earthquakes super fast
@@ -61,6 +65,7 @@ def find_earthquakes_with_dynamic_radius(city_point, kdtree, earthquake_coords,
     # first get all earthquakes within max radius
     radius_meters = max_radius_km * 1000
     indices = kdtree.query_ball_point([city_point.x, city_point.y], r=radius_meters)
+    instrument.count('pairs_candidate', len(indices))
     
     if not indices:
         return []
@@ -95,4 +100,130 @@ def find_earthquakes_with_dynamic_radius(city_point, kdtree, earthquake_coords,
             eq_dict['dist_km'] = dist_km
             nearby_quakes.append(eq_dict)
         
+    instrument.count('pairs_kept', len(nearby_quakes))
     return nearby_quakes
+
+def get_magnitude_based_radii(magnitudes):
+    # same as get_magnitude_based_radius but for a whole array of magnitudes
+    radii = 10 ** (0.5 * np.asarray(magnitudes, dtype=float) - 0.5)
+    return np.clip(radii, 50, 1500)
+
+def get_point_coords(gdf):
+    # x/y of every point as an (n, 2) array, without building python tuples
+    return np.column_stack([gdf.geometry.x.to_numpy(), gdf.geometry.y.to_numpy()])
+
+def lonlat_to_unit_vectors(lon, lat):
+    # turns lon/lat in degrees into 3D points on a unit sphere (ECEF directions)
+    # straight-line distance between these points only depends on the angle between
+    # them, so it has no distortion near the poles and no break at 180 degrees
+    lon = np.radians(np.asarray(lon, dtype=float))
+    lat = np.radians(np.asarray(lat, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+def km_to_chord(distance_km):
+    # great-circle distance on the earth -> straight-line distance on the unit sphere
+    angle = np.minimum(np.asarray(distance_km, dtype=float) / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(angle / 2)
+
+def chord_to_km(chord):
+    # the other way around
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=float) / 2, 0, 1))
+
+def get_lonlat(gdf):
+    # lon and lat arrays of every point, only reprojecting if the frame isn't lat/lon already
+    if gdf.crs is not None and not gdf.crs.is_geographic:
+        gdf = gdf.to_crs('EPSG:4326')
+    return gdf.geometry.x.to_numpy(), gdf.geometry.y.to_numpy()
+
+def get_unit_vectors(gdf):
+    # unit vectors for every point
+    return lonlat_to_unit_vectors(*get_lonlat(gdf))
+
+def build_greatcircle_kdtree(earthquakes_gdf):
+    # same idea as build_kdtree but on unit vectors, so radius queries are true
+    # great-circle distances (use km_to_chord for the radius)
+    coords = get_unit_vectors(earthquakes_gdf)
+    tree = cKDTree(coords)
+    return tree, coords
+
+def get_index_coords(gdf, metric='planar'):
+    # the coordinates a tree is built on for the given metric
+    if metric == 'greatcircle':
+        return get_unit_vectors(gdf)
+    if metric == 'planar':
+        return get_point_coords(gdf)
+    raise ValueError(f"Unknown metric: {metric}")
+
+def partition_cities(xy, n_blocks):
+    # splits the cities into compact tiles (strips by x, then by y inside each
+    # strip), so every block only has to look at the quakes around it
+    # returns a list of position arrays
+    n_strips = max(int(np.ceil(np.sqrt(n_blocks))), 1)
+    blocks = []
+    for strip in np.array_split(np.argsort(xy[:, 0], kind='stable'), n_strips):
+        strip = strip[np.argsort(xy[strip, 1], kind='stable')]
+        blocks += np.array_split(strip, n_strips)
+    return [block for block in blocks if len(block)]
+
+def get_magnitudes(earthquakes_gdf):
+    if 'mag' in earthquakes_gdf.columns:
+        return earthquakes_gdf['mag'].to_numpy(dtype=float)
+    return np.full(len(earthquakes_gdf), 5.0)
+
+def query_felt_pairs(city_tree, city_coords, eq_coords, mags, max_radius_km=1500, metric='planar', counter='pairs'):
+    # finds the cities inside the felt radius of every quake, using a city tree
+    # that was built already (so it can be reused for many batches of quakes)
+    # returns three flat arrays: city position, earthquake position, distance in km
+    # the pairs found are added to the '<counter>_kept' counter, None for callers
+    # whose points aren't cities (tile samples, population cells) so they don't mix in
+    empty = (np.array([], dtype=np.intp), np.array([], dtype=np.intp), np.array([], dtype=float))
+    if len(city_coords) == 0 or len(eq_coords) == 0:
+        return empty
+
+    # every quake gets its own felt radius (capped at max_radius_km), so one
+    # query of the city tree with an array of radii only returns pairs we keep
+    radii_km = np.minimum(get_magnitude_based_radii(mags), max_radius_km)
+    radii_km = np.where(np.isnan(radii_km), -1.0, radii_km)  # unknown magnitude never matches
+
+    if metric == 'greatcircle':
+        radii = np.where(radii_km < 0, -1.0, km_to_chord(radii_km))
+    else:
+        radii = radii_km * 1000
+
+    hits = city_tree.query_ball_point(eq_coords, r=radii)
+
+    # flatten the list-per-quake result into pair arrays
+    lengths = np.fromiter((len(h) for h in hits), dtype=np.intp, count=len(hits))
+    # the tree query already uses every quake's own felt radius, there are no candidates
+    # to filter out (unlike find_earthquakes_with_dynamic_radius), only kept pairs
+    if counter is not None:
+        instrument.count(f'{counter}_kept', lengths.sum())
+    if lengths.sum() == 0:
+        return empty
+    eq_idx = np.repeat(np.arange(len(hits)), lengths)
+    city_idx = np.fromiter(itertools.chain.from_iterable(hits), dtype=np.intp, count=lengths.sum())
+
+    diff = city_coords[city_idx] - eq_coords[eq_idx]
+    dist = np.sqrt((diff ** 2).sum(axis=1))
+    if metric == 'greatcircle':
+        dist_km = chord_to_km(dist)
+    else:
+        dist_km = dist / 1000.0
+
+    return city_idx, eq_idx, dist_km
+
+@instrument.timed("spatial_index.find_city_quake_pairs")
+def find_city_quake_pairs(cities_gdf, earthquakes_gdf, max_radius_km=1500, metric='planar'):
+    # finds every city-earthquake pair in one go instead of looping over cities
+    # returns three flat arrays: city position, earthquake position, distance in km
+    # metric='planar' uses the projected x/y in metres (frames must share a metric CRS)
+    # metric='greatcircle' uses unit vectors, so lat/lon frames work without projecting
+    city_coords = get_index_coords(cities_gdf, metric)
+    eq_coords = get_index_coords(earthquakes_gdf, metric)
+    city_tree = cKDTree(city_coords)
+
+    return query_felt_pairs(
+        city_tree, city_coords, eq_coords, get_magnitudes(earthquakes_gdf),
+        max_radius_km=max_radius_km, metric=metric
+    )
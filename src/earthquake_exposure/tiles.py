@@ -0,0 +1,273 @@
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy.ndimage import gaussian_filter
+from scipy.spatial import cKDTree
+from earthquake_exposure import metrics, spatial_index
+from earthquake_exposure.gmpe import calculate_pga, DEFAULT_GMPE
+from earthquake_exposure.exposure import get_quake_arrays
+
+# XYZ map tiles (web mercator, 256 px PNGs) of the catalog, so a map only
+# downloads the tiles it shows however many quakes there are
+# two layers: 'density' (quakes per pixel, smoothed) and 'hazard' (the max
+# median PGA of all quakes at every pixel, from the GMPE)
+# tiles are rendered on demand and kept in memory (LRU) and on disk, both keyed
+# by a version of the catalog, so a new catalog never serves old tiles
+# tile() is called from several threads (the API serves tiles with to_thread)
+
+TILE_SIZE = 256
+MAX_ZOOM = 18
+LAYERS = ('density', 'hazard')
+
+# hazard is worked out on a lattice every HAZARD_STEP pixels and interpolated
+# in between, PGA changes slowly so this looks the same and is 16x less work
+HAZARD_STEP = 4
+# pixels under the lowest risk threshold are left transparent
+HAZARD_MIN_PGA = metrics.RISK_THRESHOLDS[0]
+# other versions in the disk cache are deleted once nobody has started a renderer
+# for them this long, workers sharing the folder may still be serving them until then
+PRUNE_AFTER_SECONDS = 3600
+HAZARD_MAX_PGA = 1.0
+# smoothing of the density layer in pixels, and the quakes per pixel that get the darkest color
+DENSITY_SIGMA = 2.0
+DENSITY_SATURATION = 20.0
+
+# yellow to dark red, like the YlOrRd colorscale of the plotly map
+COLOR_STOPS = np.array([
+    [255, 255, 178, 110],
+    [254, 204, 92, 140],
+    [253, 141, 60, 170],
+    [240, 59, 32, 200],
+    [189, 0, 38, 230],
+], dtype=float)
+COLOR_LUT = np.stack([
+    np.interp(np.linspace(0, 1, 256), np.linspace(0, 1, len(COLOR_STOPS)), COLOR_STOPS[:, i]) for i in range(4)
+], axis=1).astype(np.uint8)
+
+def lonlat_to_mercator(lon, lat):
+    # web mercator position as fractions of the world (0-1), y going down from the north
+    lat = np.clip(np.asarray(lat, dtype=float), -85.05112878, 85.05112878)
+    u = (np.asarray(lon, dtype=float) + 180) / 360
+    v = (1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2
+    return u, v
+
+def mercator_to_lonlat(u, v):
+    return np.asarray(u) * 360 - 180, np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(v)))))
+
+def check_tile(layer, z, x, y):
+    if layer not in LAYERS:
+        raise ValueError(f"Unknown tile layer '{layer}', use one of {', '.join(LAYERS)}")
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise ValueError(f"No tile {z}/{x}/{y}")
+
+def colorize(values, mask):
+    # values from 0 to 1 through the color table, transparent where mask is False
+    rgba = COLOR_LUT[np.clip(values * 255, 0, 255).astype(np.uint8)]
+    rgba[~mask] = 0
+    return rgba
+
+def encode_png(rgba):
+    # an RGBA array (height, width, 4) as PNG bytes, straight from zlib
+    height, width, _ = rgba.shape
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, -1)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+            + chunk(b"IEND", b""))
+
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+def catalog_version(earthquakes_gdf, **settings):
+    # changes whenever an event is added, removed or updated (or the settings change)
+    columns = [name for name in ['id', 'updated', 'mag', 'depth_km'] if name in earthquakes_gdf.columns]
+    rows = pd.util.hash_pandas_object(earthquakes_gdf[columns], index=False).to_numpy()
+    digest = hashlib.sha1(rows.tobytes())
+    digest.update(repr(sorted(settings.items())).encode())
+    return digest.hexdigest()[:16]
+
+def prune_tile_cache(folder, keep, older_than=PRUNE_AFTER_SECONDS):
+    # tiles of older catalog versions, once no renderer has been started for them
+    # in older_than seconds (every renderer touches its version folder)
+    if not os.path.isdir(folder):
+        return
+    cutoff = time.time() - older_than
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            stale = name != keep and os.path.getmtime(path) < cutoff
+        except OSError:
+            continue
+        if stale:
+            shutil.rmtree(path, ignore_errors=True)
+
+class TileRenderer:
+    # renders and caches the tiles of one catalog
+
+    def __init__(self, earthquakes_gdf, max_radius_km=1500, gmpe=DEFAULT_GMPE, cache_folder=None, max_cached=512):
+        lon, lat = spatial_index.get_lonlat(earthquakes_gdf)
+        quakes = get_quake_arrays(earthquakes_gdf)
+        self.mag, self.depth = quakes['mag'], quakes['depth']
+        self.xyz = spatial_index.lonlat_to_unit_vectors(lon, lat)
+        self.max_radius_km = max_radius_km
+        # how far every quake reaches as a chord, unknown magnitudes reach nothing
+        radii = np.minimum(spatial_index.get_magnitude_based_radii(self.mag), max_radius_km)
+        self.reach = np.where(np.isnan(radii), -1.0, spatial_index.km_to_chord(np.nan_to_num(radii)))[:, None]
+        # sorted by x, so the quakes over a tile are one searchsorted away
+        u, v = lonlat_to_mercator(lon, lat)
+        self.order = np.argsort(u, kind='stable')
+        self.u, self.v = u[self.order], v[self.order]
+
+        self.gmpe = gmpe
+        self.version = catalog_version(earthquakes_gdf, max_radius_km=max_radius_km, gmpe=gmpe)
+        self.cache_folder = cache_folder
+        if cache_folder is not None:
+            version_folder = os.path.join(cache_folder, self.version)
+            os.makedirs(version_folder, exist_ok=True)
+            os.utime(version_folder)
+            prune_tile_cache(cache_folder, self.version)
+        self.max_cached = max_cached
+        self.cached = OrderedDict()
+        self.lock = threading.Lock()
+
+    def tile_path(self, layer, z, x, y):
+        return os.path.join(self.cache_folder, self.version, layer, str(z), str(x), f"{y}.png")
+
+    def tile(self, layer, z, x, y):
+        # PNG bytes of a tile, from memory, then disk, then rendered
+        check_tile(layer, z, x, y)
+        key = (layer, z, x, y)
+        with self.lock:
+            png = self.cached.get(key)
+            if png is not None:
+                self.cached.move_to_end(key)
+                return png
+
+        # rendering and disk happen outside the lock, two threads missing the
+        # same tile both render it and the last one to finish wins
+        path = self.tile_path(layer, z, x, y) if self.cache_folder is not None else None
+        png = self.read_tile(path) if path is not None else None
+        if png is None:
+            png = self.render(layer, z, x, y)
+            if path is not None:
+                self.write_tile(path, png)
+
+        with self.lock:
+            self.cached[key] = png
+            self.cached.move_to_end(key)
+            while len(self.cached) > self.max_cached:
+                self.cached.popitem(last=False)
+        return png
+
+    def read_tile(self, path):
+        # None if it isn't on disk (or was pruned by another worker meanwhile)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def write_tile(self, path, png):
+        # through a temp file of its own, so writers of the same tile don't truncate each other
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(png)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def render(self, layer, z, x, y):
+        if layer == 'density':
+            density = self.density(z, x, y)
+            mask = density >= 0.01
+            if not mask.any():
+                return EMPTY_TILE
+            return encode_png(colorize(np.log1p(density) / np.log1p(DENSITY_SATURATION), mask))
+
+        pga = self.hazard(z, x, y)
+        mask = pga >= HAZARD_MIN_PGA
+        if not mask.any():
+            return EMPTY_TILE
+        scaled = np.log(np.maximum(pga, HAZARD_MIN_PGA) / HAZARD_MIN_PGA) / np.log(HAZARD_MAX_PGA / HAZARD_MIN_PGA)
+        return encode_png(colorize(scaled, mask))
+
+    def density(self, z, x, y):
+        # smoothed quakes per pixel, quakes just outside the tile are counted
+        # too so neighbouring tiles line up
+        world = TILE_SIZE * 2 ** z
+        margin = int(np.ceil(4 * DENSITY_SIGMA))
+        lo, hi = np.searchsorted(self.u, [(x * TILE_SIZE - margin) / world, ((x + 1) * TILE_SIZE + margin) / world])
+        px = np.floor(self.u[lo:hi] * world - x * TILE_SIZE).astype(np.int64) + margin
+        py = np.floor(self.v[lo:hi] * world - y * TILE_SIZE).astype(np.int64) + margin
+
+        size = TILE_SIZE + 2 * margin
+        keep = (px >= 0) & (px < size) & (py >= 0) & (py < size)
+        counts = np.bincount(py[keep] * size + px[keep], minlength=size * size).reshape(size, size)
+        smooth = gaussian_filter(counts.astype(float), DENSITY_SIGMA, mode='constant')
+        return smooth[margin:-margin, margin:-margin]
+
+    def hazard(self, z, x, y, quake_chunk=2000):
+        # max median PGA at every pixel, worked out on the corners of a lattice
+        # (shared with the neighbouring tiles) and interpolated
+        world = TILE_SIZE * 2 ** z
+        steps = np.arange(0, TILE_SIZE + 1, HAZARD_STEP)
+        sample_u = (x * TILE_SIZE + steps) / world
+        sample_v = (y * TILE_SIZE + steps) / world
+        lon, lat = mercator_to_lonlat(*np.meshgrid(sample_u, sample_v))
+        sample_xyz = spatial_index.lonlat_to_unit_vectors(lon.ravel(), lat.ravel())
+        pga = np.zeros(len(sample_xyz))
+
+        # only quakes whose felt radius reaches the box around the samples
+        near = np.all((self.xyz >= sample_xyz.min(axis=0) - self.reach)
+                      & (self.xyz <= sample_xyz.max(axis=0) + self.reach), axis=1)
+        near = np.flatnonzero(near)
+        if len(near):
+            tree = cKDTree(sample_xyz)
+            for start in range(0, len(near), quake_chunk):
+                chunk = near[start:start + quake_chunk]
+                sample_idx, quake_idx, dist_km = spatial_index.query_felt_pairs(
+                    tree, sample_xyz, self.xyz[chunk], self.mag[chunk], max_radius_km=self.max_radius_km,
+                    metric='greatcircle', counter=None
+                )
+                quake_idx = chunk[quake_idx]
+                pair_pga = calculate_pga(self.mag[quake_idx], dist_km, self.depth[quake_idx], gmpe=self.gmpe)
+                np.maximum.at(pga, sample_idx, pair_pga)
+
+        return upsample(pga.reshape(len(steps), len(steps)), HAZARD_STEP)
+
+def upsample(corners, step):
+    # bilinear interpolation from lattice corners to the pixel centres between them
+    position = (np.arange((corners.shape[0] - 1) * step) + 0.5) / step
+    i = np.minimum(position.astype(np.int64), corners.shape[0] - 2)
+    f = position - i
+    rows = corners[i] * (1 - f)[:, None] + corners[i + 1] * f[:, None]
+    return rows[:, i] * (1 - f) + rows[:, i + 1] * f
+
+def precompute_tiles(renderer, max_zoom=3, layers=LAYERS):
+    # renders every tile up to max_zoom into the renderer's caches
+    # returns how many tiles that was
+    count = 0
+    for layer in layers:
+        for z in range(max_zoom + 1):
+            for x in range(2 ** z):
+                for y in range(2 ** z):
+                    renderer.tile(layer, z, x, y)
+                    count += 1
+    return count
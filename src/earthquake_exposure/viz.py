@@ -1,50 +1,123 @@
 import plotly.express as px
 import plotly.graph_objects as go
-import folium
+import numpy as np
 import pandas as pd
+import shapely
 import json
+import os
+from earthquake_exposure import instrument
 
-def generate_interactive_map(cities_gdf, eq_gdf, exposure_df):
+# folium is imported in the folium functions, the plotly map (and the API's
+# /map) doesn't need it
+
+# above this many points a layer is clustered (or drawn as a heatmap) instead
+# of one circle per point, the browser can't handle more than a few thousand
+MAX_MAP_MARKERS = 5000
+
+# above this many quakes the plotly map bins them into hexagons
+MAX_PLOT_QUAKES = 20000
+
+# styles every point of a GeoJSON layer from its properties in the browser,
+# so the HTML only has the data once and no per-marker script
+CIRCLE_FROM_PROPERTIES = """
+function (feature, layer) {
+    var p = feature.properties;
+    layer.setStyle({radius: p.radius, color: p.color, fillColor: p.color});
+    layer.bindPopup(p.popup, {maxWidth: 200});
+}
+"""
+
+# the same for FastMarkerCluster, rows are [lat, lon, radius, color, popup]
+CIRCLE_FROM_ROW = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+        {radius: row[2], color: row[3], fillColor: row[3], fill: true});
+    marker.bindPopup(row[4], {maxWidth: 200});
+    return marker;
+}
+"""
+
+def risk_color(pga):
+    return np.select([pga < 0.1, pga < 0.3], ['blue', 'orange'], 'red')
+
+def quake_markers(eq_gdf):
+    # one row per quake with lat, lon, radius, color, popup and weight (for heatmaps)
+    mag = eq_gdf['mag'].to_numpy(dtype=float)
+    if 'depth_km' in eq_gdf.columns:
+        depth = [f"Depth: {d} km<br>" for d in eq_gdf['depth_km']]
+    else:
+        depth = [""] * len(eq_gdf)
+    return pd.DataFrame({
+        'lat': eq_gdf.geometry.y.to_numpy(),
+        'lon': eq_gdf.geometry.x.to_numpy(),
+        'radius': mag,
+        'color': '#FF4B4B',
+        'popup': [f"<b>Mag:</b> {m}<br>{d}{p}" for m, d, p in zip(eq_gdf['mag'], depth, eq_gdf['place'])],
+        'weight': mag,
+    })
+
+def city_markers(cities_gdf, exposure_df):
+    # cities that are in the exposure table, joined once by name (first row wins)
+    scores = exposure_df.drop_duplicates('city_name')[['city_name', 'max_pga']]
+    cities = pd.DataFrame({
+        'name': cities_gdf['name'].to_numpy(),
+        'lat': cities_gdf.geometry.y.to_numpy(),
+        'lon': cities_gdf.geometry.x.to_numpy(),
+    }).merge(scores, left_on='name', right_on='city_name', how='inner')
+    score = cities['max_pga'].to_numpy(dtype=float)
+    return pd.DataFrame({
+        'lat': cities['lat'],
+        'lon': cities['lon'],
+        'radius': 5 + score * 50,
+        'color': risk_color(score),
+        'popup': [f"{name}: {pga:.4f}g PGA" for name, pga in zip(cities['name'], score)],
+        'weight': score,
+    })
+
+def add_marker_layer(m, markers, name, max_markers=MAX_MAP_MARKERS, large_mode='cluster'):
+    # circles from one GeoJSON layer, or above max_markers points a cluster
+    # (built in the browser) or a heatmap
+    if large_mode not in ('cluster', 'heatmap'):
+        raise ValueError(f"Unknown large_mode '{large_mode}', use 'cluster' or 'heatmap'")
+    import folium
+    from folium.plugins import FastMarkerCluster, HeatMap
+    from folium.utilities import JsCode
+    # 5 decimals is about a metre, no need to write out more
+    markers = markers.round({'lat': 5, 'lon': 5, 'radius': 2})
+    if len(markers) <= max_markers:
+        features = [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+             'properties': {'radius': radius, 'color': color, 'popup': popup}}
+            for lat, lon, radius, color, popup in markers[['lat', 'lon', 'radius', 'color', 'popup']].itertuples(index=False)
+        ]
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': features}, name=name,
+            marker=folium.CircleMarker(fill=True), on_each_feature=JsCode(CIRCLE_FROM_PROPERTIES)
+        ).add_to(m)
+    elif large_mode == 'cluster':
+        rows = markers[['lat', 'lon', 'radius', 'color', 'popup']]
+        FastMarkerCluster(rows.values.tolist(), callback=CIRCLE_FROM_ROW, name=name).add_to(m)
+    else:
+        rows = markers[['lat', 'lon', 'weight']]
+        HeatMap(rows.values.tolist(), name=name).add_to(m)
+
+@instrument.timed("viz.generate_interactive_map")
+def generate_interactive_map(cities_gdf, eq_gdf, exposure_df, max_markers=MAX_MAP_MARKERS, large_mode='cluster'):
     # makes a folium map with cities and earthquakes
+    # layers with more than max_markers points switch to large_mode ('cluster' or 'heatmap')
+    import folium
     center_lat = cities_gdf.geometry.y.mean()
     center_lon = cities_gdf.geometry.x.mean()
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=2, tiles='CartoDB positron')
-    
-    # add earthquake markers
-    for _, row in eq_gdf.iterrows():
-        depth_str = f"Depth: {row['depth_km']} km<br>" if 'depth_km' in row else ""
-        folium.CircleMarker(
-            location=[row.geometry.y, row.geometry.x],
-            radius=row['mag'],
-            color='#FF4B4B',
-            fill=True,
-            fill_color='#FF4B4B',
-            popup=folium.Popup(f"<b>Mag:</b> {row['mag']}<br>{depth_str}{row['place']}", max_width=200)
-        ).add_to(m)
+    # canvas draws thousands of circles a lot faster than one SVG element each
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=2, tiles='CartoDB positron', prefer_canvas=True)
 
-    # add city markers colored by risk
-    for _, row in cities_gdf.iterrows():
-        score_row = exposure_df[exposure_df['city_name'] == row['name']]
-        if not score_row.empty:
-            score = score_row.iloc[0]['max_pga']
-            
-            if score < 0.1:
-                color = 'blue'
-            elif score < 0.3:
-                color = 'orange'
-            else:
-                color = 'red'
-                
-            folium.CircleMarker(
-                location=[row.geometry.y, row.geometry.x],
-                radius=5 + (score * 50),
-                color=color,
-                fill=True,
-                popup=f"{row['name']}: {score:.4f}g PGA"
-            ).add_to(m)
-            
+    add_marker_layer(m, quake_markers(eq_gdf), 'Earthquakes', max_markers, large_mode)
+    # cities colored by risk
+    add_marker_layer(m, city_markers(cities_gdf, exposure_df), 'Cities', max_markers, large_mode)
+    folium.LayerControl().add_to(m)
     return m
 
+@instrument.timed("viz.generate_interactive_dashboard")
 def generate_interactive_dashboard(eq_gdf, exposure_df):
     # makes scatter plots for analysis
     fig1 = px.scatter(
@@ -75,62 +148,83 @@ def generate_interactive_dashboard(eq_gdf, exposure_df):
     
     return fig1, fig2
 
-def generate_plotly_map(cities_gdf, eq_gdf, exposure_df, boundaries_gdf=None):
-    # creates the main interactive map with plotly
-    cities_df = cities_gdf.copy()
-    cities_df = cities_df.merge(
-        exposure_df[['city_name', 'max_pga', 'num_earthquakes', 'max_magnitude', 'closest_quake_distance']], 
-        left_on='name', 
-        right_on='city_name', 
-        how='inner'
-    )
-    
-    # only show cities with some risk
-    cities_df = cities_df[cities_df['max_pga'] > 0].copy()
-    
-    cities_df['lat'] = cities_df.geometry.y
-    cities_df['lon'] = cities_df.geometry.x
-    
-    # hover text
-    country_col = 'country' if 'country' in cities_df.columns else 'adm0name'
-    country_name = cities_df[country_col] if country_col in cities_df.columns else "Unknown"
-    
-    cities_df['hover_text'] = (
-        "<b>" + cities_df['name'] + "</b> (" + country_name + ")<br>" +
-        "Population: " + cities_df['population'].apply(lambda x: f"{x:.0f}") + "<br>" +
-        "Max PGA: " + cities_df['max_pga'].round(4).astype(str) + "g<br>" +
-        "Nearby Quakes: " + cities_df['num_earthquakes'].astype(str)
+def format_rows(template, **columns):
+    # one string per row from a str.format template with the columns as fields,
+    # a single pass instead of adding up Series of strings
+    names = list(columns)
+    values = [np.asarray(column).tolist() for column in columns.values()]
+    return [template.format_map(dict(zip(names, row))) for row in zip(*values)]
+
+def boundary_tolerance(zoom):
+    # about one screen pixel in degrees at this zoom, finer detail isn't visible
+    return 360 / (256 * 2 ** zoom)
+
+def simplify_boundaries(boundaries_gdf, zoom):
+    # boundaries as a GeoJSON dict, simplified to the zoom level and with the
+    # coordinates rounded to a tenth of that so they print short
+    tolerance = boundary_tolerance(zoom)
+    decimals = int(np.ceil(-np.log10(tolerance / 10)))
+    geoms = shapely.simplify(boundaries_gdf.geometry.to_numpy(), tolerance, preserve_topology=True)
+    geoms = shapely.transform(geoms, lambda coords: np.round(coords, decimals))
+    features = [
+        {'type': 'Feature', 'id': name, 'properties': {'name': name}, 'geometry': json.loads(geometry)}
+        for name, geometry in zip(boundaries_gdf['name'].tolist(), shapely.to_geojson(geoms).tolist())
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+def hexbin_quakes(lon, lat, mag, size_deg=1.0):
+    # quakes binned into hexagons size_deg across (flat sides left/right)
+    # returns the centre, number of quakes and largest magnitude of every bin
+    # a hexagon lattice is two offset rectangular lattices, every point goes to
+    # the nearer of its two candidate centres
+    sx, sy = size_deg, size_deg * np.sqrt(3)
+    x1, y1 = np.round(lon / sx), np.round(lat / sy)
+    x2, y2 = np.floor(lon / sx) + 0.5, np.floor(lat / sy) + 0.5
+    d1 = (lon / sx - x1) ** 2 + 3 * (lat / sy - y1) ** 2
+    d2 = (lon / sx - x2) ** 2 + 3 * (lat / sy - y2) ** 2
+    first = d1 <= d2
+    bins = pd.DataFrame({
+        'lon': np.where(first, x1, x2) * sx,
+        'lat': np.where(first, y1, y2) * sy,
+        'mag': mag,
+    })
+    return bins.groupby(['lon', 'lat'], as_index=False).agg(count=('mag', 'size'), max_mag=('mag', 'max'))
+
+@instrument.timed("viz.generate_plotly_map")
+def generate_plotly_map(cities_gdf, eq_gdf, exposure_df, boundaries_gdf=None, max_quake_points=MAX_PLOT_QUAKES,
+                        hexbin_deg=1.0, zoom=2.5):
+    # creates the main interactive map with plotly (MapLibre traces, drawn with WebGL)
+    # above max_quake_points quakes are shown as hexagon bins of hexbin_deg
+    # boundaries are simplified to what is visible at zoom
+    cities = pd.DataFrame({
+        'name': cities_gdf['name'].to_numpy(),
+        'population': cities_gdf['population'].to_numpy(),
+        'lat': cities_gdf.geometry.y.to_numpy(),
+        'lon': cities_gdf.geometry.x.to_numpy(),
+    })
+    country_col = 'country' if 'country' in cities_gdf.columns else 'adm0name'
+    cities['country'] = cities_gdf[country_col].to_numpy() if country_col in cities_gdf.columns else "Unknown"
+    cities = cities.merge(
+        exposure_df[['city_name', 'max_pga', 'num_earthquakes']].drop_duplicates('city_name'),
+        left_on='name', right_on='city_name', how='inner'
     )
 
-    # earthquake data
-    eq_df = eq_gdf.copy()
-    eq_df['lat'] = eq_df.geometry.y
-    eq_df['lon'] = eq_df.geometry.x
-    
-    # convert time to date
-    if pd.api.types.is_numeric_dtype(eq_df['time']):
-        eq_df['date'] = pd.to_datetime(eq_df['time'], unit='ms').dt.strftime('%Y-%m-%d')
-    else:
-        eq_df['date'] = pd.to_datetime(eq_df['time']).dt.strftime('%Y-%m-%d')
-    
-    eq_df['hover_text'] = (
-        "<b>Magnitude " + eq_df['mag'].astype(str) + "</b><br>" +
-        eq_df['place'] + "<br>" +
-        "Date: " + eq_df['date'] + "<br>" +
-        "Depth: " + eq_df['depth_km'].astype(str) + " km"
+    # only show cities with some risk
+    cities = cities[cities['max_pga'] > 0]
+    cities_hover = format_rows(
+        "<b>{name}</b> ({country})<br>Population: {population:.0f}<br>Max PGA: {pga}g<br>Nearby Quakes: {quakes}",
+        name=cities['name'], country=cities['country'], population=cities['population'],
+        pga=cities['max_pga'].round(4), quakes=cities['num_earthquakes']
     )
 
     fig = go.Figure()
 
     # add country boundaries if we have them
     if boundaries_gdf is not None and not boundaries_gdf.empty:
-        geojson = json.loads(boundaries_gdf.to_json())
-        
-        fig.add_trace(go.Choroplethmapbox(
-            geojson=geojson,
+        fig.add_trace(go.Choroplethmap(
+            geojson=simplify_boundaries(boundaries_gdf, zoom),
             locations=boundaries_gdf['name'],
-            featureidkey="properties.name",
-            z=[1] * len(boundaries_gdf),
+            z=np.ones(len(boundaries_gdf)),
             colorscale=[[0, 'rgba(0,0,0,0)'], [1, 'rgba(0,0,0,0)']],
             marker_line_color='darkgrey',
             marker_line_width=1,
@@ -139,49 +233,83 @@ def generate_plotly_map(cities_gdf, eq_gdf, exposure_df, boundaries_gdf=None):
             name='Boundaries'
         ))
 
-    # add earthquakes
-    fig.add_trace(go.Scattermapbox(
-        lat=eq_df['lat'],
-        lon=eq_df['lon'],
-        mode='markers',
-        marker=go.scattermapbox.Marker(
-            size=eq_df['mag'] ** 2.5 / 2,
-            color=eq_df['mag'],
-            colorscale='YlOrRd',
-            cmin=5.0,
-            cmax=8.0,
-            opacity=0.7,
-            showscale=True,
-            colorbar=dict(title="Magnitude", x=0.02, y=0.5, len=0.5)
-        ),
-        text=eq_df['hover_text'], hoverinfo='text', name='Earthquakes'
-    ))
+    # add earthquakes, or their hexagon bins when there are too many
+    quake_lon = eq_gdf.geometry.x.to_numpy()
+    quake_lat = eq_gdf.geometry.y.to_numpy()
+    magnitude = eq_gdf['mag'].to_numpy(dtype=float)
+    magnitude_bar = dict(title="Magnitude", x=0.02, y=0.5, len=0.5)
+    if len(eq_gdf) > max_quake_points:
+        bins = hexbin_quakes(quake_lon, quake_lat, magnitude, hexbin_deg)
+        fig.add_trace(go.Scattermap(
+            lat=bins['lat'].to_numpy(dtype=np.float32),
+            lon=bins['lon'].to_numpy(dtype=np.float32),
+            mode='markers',
+            marker=go.scattermap.Marker(
+                size=(6 + 4 * np.log2(bins['count'])).to_numpy(dtype=np.float32),
+                color=bins['max_mag'].to_numpy(dtype=np.float32),
+                colorscale='YlOrRd', cmin=5.0, cmax=8.0, opacity=0.7, showscale=True, colorbar=magnitude_bar
+            ),
+            text=format_rows("<b>{count} earthquakes</b><br>Largest: M{mag}", count=bins['count'], mag=bins['max_mag']),
+            hoverinfo='text', name='Earthquakes (binned)'
+        ))
+    else:
+        # convert time to date
+        if pd.api.types.is_numeric_dtype(eq_gdf['time']):
+            dates = pd.to_datetime(eq_gdf['time'], unit='ms').dt.strftime('%Y-%m-%d')
+        else:
+            dates = pd.to_datetime(eq_gdf['time']).dt.strftime('%Y-%m-%d')
+        depth = eq_gdf['depth_km'] if 'depth_km' in eq_gdf.columns else np.full(len(eq_gdf), np.nan)
+        fig.add_trace(go.Scattermap(
+            lat=quake_lat.astype(np.float32),
+            lon=quake_lon.astype(np.float32),
+            mode='markers',
+            marker=go.scattermap.Marker(
+                size=(magnitude ** 2.5 / 2).astype(np.float32),
+                color=magnitude.astype(np.float32),
+                colorscale='YlOrRd', cmin=5.0, cmax=8.0, opacity=0.7, showscale=True, colorbar=magnitude_bar
+            ),
+            text=format_rows("<b>Magnitude {mag}</b><br>{place}<br>Date: {date}<br>Depth: {depth} km",
+                             mag=eq_gdf['mag'], place=eq_gdf['place'], date=dates, depth=depth),
+            hoverinfo='text', name='Earthquakes'
+        ))
 
     # add cities
-    fig.add_trace(go.Scattermapbox(
-        lat=cities_df['lat'],
-        lon=cities_df['lon'],
+    fig.add_trace(go.Scattermap(
+        lat=cities['lat'].to_numpy(dtype=np.float32),
+        lon=cities['lon'].to_numpy(dtype=np.float32),
         mode='markers',
-        marker=go.scattermapbox.Marker(
-            size=10, 
-            color=cities_df['max_pga'],
+        marker=go.scattermap.Marker(
+            size=10,
+            color=cities['max_pga'].to_numpy(dtype=np.float32),
             colorscale='Viridis_r',
             showscale=True,
             cmin=0,
             cmax=0.5,
             colorbar=dict(title="Max PGA (g)", x=0.98, len=0.5)
         ),
-        text=cities_df['hover_text'], hoverinfo='text', name='Cities at Risk'
+        text=cities_hover, hoverinfo='text', name='Cities at Risk'
     ))
 
     # set up the map
     fig.update_layout(
         title="Asian Cities Seismic Risk Analysis (Year 2025)",
-        mapbox_style="carto-positron",
-        mapbox=dict(center=dict(lat=30, lon=100), zoom=2.5),
+        map_style="carto-positron",
+        map=dict(center=dict(lat=30, lon=100), zoom=zoom),
         margin={"r":0,"t":50,"l":0,"b":0},
         height=800
     )
 
-    
     return fig
+
+@instrument.timed("viz.figure_to_json")
+def figure_to_json(fig):
+    # the figure as compact json bytes (no indent, no uids, no validation pass),
+    # for the API or a static page to hand to plotly.js as is
+    # plotly 6 also writes numeric arrays as base64 typed arrays, 5.x as plain lists
+    return fig.to_json(validate=False, pretty=False, remove_uids=True).encode()
+
+def write_figure_json(fig, path):
+    # written to a temp file first, so a server reading it never sees half a figure
+    with open(path + ".tmp", "wb") as f:
+        f.write(figure_to_json(fig))
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,134 @@
+import json
+import os
+import numpy as np
+import geopandas as gpd
+import pyarrow.parquet as pq
+from earthquake_exposure import acquire
+from benchmarks.mock_usgs import MockUSGSServer, make_synthetic_catalog
+
+PARAMS = {"format": "geojson", "starttime": "2025-01-01", "endtime": "2025-12-31",
+          "minmagnitude": 4.0, **acquire.ASIA_BBOX}
+
+def test_chunked_fetch_gets_every_event_once():
+    catalog = make_synthetic_catalog(500)
+    with MockUSGSServer(catalog, max_allowed=100, base_latency=0) as server:
+        features = acquire.fetch_earthquake_features(PARAMS, url=server.url, max_events=80)
+        n_queries = sum(1 for path, _ in server.requests if path.endswith("/query"))
+
+    ids = [f["id"] for f in features]
+    assert len(ids) == len(set(ids)) == 500
+    assert n_queries >= 500 // 80
+
+def test_busy_day_is_split_by_longitude():
+    catalog = make_synthetic_catalog(300, starttime="2025-03-28", endtime="2025-03-28T12:00")
+    with MockUSGSServer(catalog, max_allowed=100, base_latency=0) as server:
+        features = acquire.fetch_earthquake_features(PARAMS, url=server.url, max_events=100)
+        longitudes = {p.get("maxlongitude") for path, p in server.requests if path.endswith("/query")}
+
+    assert len(features) == 300
+    assert len(longitudes) > 1
+
+def test_splitting_stops_at_the_smallest_window(monkeypatch):
+    # every window reports too many events, planning still has to end
+    counts = []
+    monkeypatch.setattr(acquire, 'count_earthquakes', lambda session, params, url, timeout: counts.append(1) or 10**6)
+    params = {**PARAMS, "starttime": "2025-03-01T00:00:00", "endtime": "2025-03-01T00:10:00",
+              "minlongitude": 100.0, "maxlongitude": 100.02}
+
+    chunks = acquire.plan_chunks(None, params, max_events=100)
+
+    assert chunks and len(counts) < 1000
+    for chunk in chunks:
+        assert acquire.split_chunk(chunk) is None
+
+def test_get_earthquake_data_keeps_ids_and_depth():
+    catalog = make_synthetic_catalog(200)
+    with MockUSGSServer(catalog, base_latency=0) as server:
+        gdf = acquire.get_earthquake_data(start_date="2025-01-01", end_date="2025-12-31", min_mag=4.0, url=server.url)
+
+    assert len(gdf) == 200
+    assert gdf['id'].is_unique
+    np.testing.assert_array_equal(np.sort(gdf['depth_km']), np.sort(catalog['depth']))
+
+def test_decoder_matches_from_features():
+    with open(os.path.join(os.path.dirname(__file__), "data", "usgs_catalog.geojson"), "rb") as f:
+        content = f.read()
+    features = json.loads(content)["features"]
+    expected = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+
+    gdf = acquire.decode_geojson_features(content)
+
+    assert gdf.crs == "EPSG:4326"
+    assert gdf['id'].tolist() == [f["id"] for f in features]
+    assert gdf['time'].dtype == np.int64
+    assert gdf['time'].tolist() == expected['time'].tolist()
+    np.testing.assert_array_equal(gdf['mag'], expected['mag'])
+    np.testing.assert_array_equal(gdf['depth_km'], expected.geometry.z)
+    assert gdf.geometry.geom_equals(expected.geometry).all()
+    assert gdf['place'].tolist() == expected['place'].tolist()
+
+def test_decoder_handles_empty_response():
+    gdf = acquire.decode_geojson_features(b'{"type": "FeatureCollection", "features": []}')
+
+    assert gdf.empty
+    assert 'depth_km' in gdf.columns
+
+def make_places(n=50):
+    rng = np.random.default_rng(0)
+    return gpd.GeoDataFrame({
+        'name': [f'place_{i}' for i in range(n)],
+        'adm0name': rng.choice(['Japan', 'Nepal', 'France'], n),
+        'pop_max': rng.integers(50000, 5000000, n),
+    }, geometry=gpd.points_from_xy(rng.uniform(25, 180, n), rng.uniform(-10, 80, n)), crs='EPSG:4326')
+
+def test_city_cache_is_geoparquet_with_pushdown(tmp_path, monkeypatch):
+    monkeypatch.setattr(acquire, 'CACHE_FOLDER', str(tmp_path))
+    downloads = []
+    monkeypatch.setattr(gpd, 'read_file', lambda url: downloads.append(url) or make_places())
+
+    first = acquire.load_asian_cities(min_population=1000000)
+    second = acquire.load_asian_cities(min_population=1000000)
+    everything = acquire.get_cities_data()
+
+    assert len(downloads) == 1
+    assert os.path.exists(tmp_path / "ne_10m_populated_places.parquet")
+    assert second['name'].tolist() == first['name'].tolist()
+    assert second.crs == "EPSG:4326"
+    assert (second['population'] >= 1000000).all()
+    assert set(everything['ADM0NAME']) == {'Japan', 'Nepal'}
+    assert len(everything) > len(second)
+    # the cache has every country, the filter is only applied when reading it
+    assert set(acquire.get_cities_data(countries=None)['ADM0NAME']) == {'Japan', 'Nepal', 'France'}
+    assert len(downloads) == 1
+
+def test_cache_metadata_is_written_by_pyarrow(tmp_path):
+    # the fingerprint can't depend on geopandas writing PANDAS_ATTRS
+    path = str(tmp_path / "places.parquet")
+    acquire.write_geoparquet_cache(make_places(), path, "abc")
+
+    metadata = pq.read_schema(path).metadata
+    assert b"PANDAS_ATTRS" not in metadata
+    assert acquire.read_cache_attrs(path)['cache_fingerprint'] == "abc"
+    assert gpd.read_parquet(path).crs.to_epsg() == 4326
+
+def test_stale_cache_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(acquire, 'CACHE_FOLDER', str(tmp_path))
+    downloads = []
+    monkeypatch.setattr(gpd, 'read_file', lambda url: downloads.append(url) or make_places())
+    acquire.get_cities_data()
+
+    monkeypatch.setattr(acquire, 'CACHE_VERSION', acquire.CACHE_VERSION + 1)
+    acquire.get_cities_data()
+    acquire.get_cities_data()
+
+    assert len(downloads) == 2
+
+def test_legacy_geojson_cache_is_converted(tmp_path, monkeypatch):
+    monkeypatch.setattr(acquire, 'CACHE_FOLDER', str(tmp_path))
+    places = make_places().rename(columns={'pop_max': 'POP_MAX', 'name': 'NAME'})
+    places.to_file(tmp_path / "ne_10m_populated_places.json", driver="GeoJSON")
+
+    cities = acquire.load_asian_cities()
+
+    assert os.path.exists(tmp_path / "ne_10m_populated_places.parquet")
+    assert len(cities) == ((places['POP_MAX'] >= 250000) & places['adm0name'].isin(acquire.ASIAN_COUNTRIES)).sum()
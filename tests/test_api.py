@@ -0,0 +1,200 @@
+import asyncio
+import json
+import geopandas as gpd
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from earthquake_exposure import api
+from earthquake_exposure.exposure import compute_exposure_table
+
+def make_quakes(mags):
+    n = len(mags)
+    return gpd.GeoDataFrame({
+        'id': [f'us{i}' for i in range(n)],
+        'mag': mags,
+        'place': [f'place {i}' for i in range(n)],
+        'time': list(range(n)),
+        'updated': list(range(n)),
+        'depth_km': [10.0] * n,
+    }, geometry=gpd.points_from_xy([100.0 + i for i in range(n)], [20.0] * n), crs='EPSG:4326')
+
+def make_cities():
+    return gpd.GeoDataFrame({
+        'name': ['Mandalay', 'Naypyidaw', 'Tokyo', 'Osaka'],
+        'country': ['Myanmar', 'Myanmar', 'Japan', 'Japan'],
+        'population': [1300000, 930000, 35000000, 11000000],
+    }, geometry=gpd.points_from_xy([96.08, 96.13, 139.75, 135.5], [21.97, 19.75, 35.69, 34.7]), crs='EPSG:4326')
+
+def make_exposure():
+    quakes = gpd.GeoDataFrame({
+        'id': ['us7000pn9s', 'us6000abcd'], 'mag': [7.7, 6.0], 'place': ['Mandalay', 'Off Honshu'],
+        'time': [1743142852715, 1750000000000], 'depth_km': [10.0, 30.0],
+    }, geometry=gpd.points_from_xy([95.925, 139.9], [22.011, 35.4]), crs='EPSG:4326')
+    return compute_exposure_table(make_cities(), quakes, metric='greatcircle')
+
+@pytest.fixture
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(api, 'quake_cache', api.QuakeCache())
+    monkeypatch.setattr(api, 'exposure_index', api.ExposureIndex())
+    monkeypatch.setattr(api, 'compute_exposure', lambda changes=None: make_exposure())
+    monkeypatch.setattr(api, 'map_figure', {})
+    monkeypatch.setattr(api, 'tile_renderer', None)
+    monkeypatch.setattr(api, 'TILE_PRECOMPUTE_ZOOM', -1)
+
+def test_latest_quakes_served_from_cache(monkeypatch, fresh_state):
+    syncs = []
+    monkeypatch.setattr(api, 'sync_quakes', lambda: syncs.append(1) or {'upserted_ids': ['us0'], 'deleted_ids': []})
+    monkeypatch.setattr(api, 'fetch_latest_quakes', lambda: make_quakes([4.6, 5.2, 6.1]))
+    asyncio.run(api.refresh_catalog())
+    client = TestClient(api.app)
+
+    first = client.get("/latest_quakes", params={"min_mag": 5.0})
+    second = client.get("/latest_quakes", params={"min_mag": 4.5})
+
+    assert len(syncs) == 1
+    assert first.json()['count'] == 2
+    assert first.json()['quakes'][0] == {"place": "place 1", "magnitude": 5.2, "depth_km": 10.0, "lat": 20.0, "lon": 101.0}
+    assert second.json()['count'] == 3
+    assert first.headers['etag'] != second.headers['etag']
+
+def test_first_refresh_with_no_quakes(monkeypatch, fresh_state):
+    monkeypatch.setattr(api, 'sync_quakes', lambda: None)
+    monkeypatch.setattr(api, 'fetch_latest_quakes', lambda: gpd.GeoDataFrame())
+    asyncio.run(api.refresh_catalog())
+
+    assert TestClient(api.app).get("/latest_quakes").json() == {"count": 0, "quakes": []}
+
+def test_missing_numbers_are_null():
+    cache = api.QuakeCache()
+    quakes = make_quakes([5.5, 6.0])
+    quakes.loc[0, 'depth_km'] = np.nan
+    cache.update(quakes)
+
+    body = json.loads(cache.render(5.0))
+    assert body['quakes'][0]['depth_km'] is None
+    assert body['quakes'][1]['depth_km'] == 10.0
+
+def test_etag_not_modified(fresh_state):
+    api.quake_cache.update(make_quakes([5.5, 6.0]))
+    client = TestClient(api.app)
+
+    etag = client.get("/latest_quakes").headers['etag']
+    cached = client.get("/latest_quakes", headers={"If-None-Match": etag})
+
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    # a revised event changes the version
+    api.quake_cache.update(make_quakes([5.5, 6.2]))
+    changed = client.get("/latest_quakes", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers['etag'] != etag
+
+def test_failed_or_empty_sync_does_no_work(monkeypatch, fresh_state):
+    monkeypatch.setattr(api, 'sync_quakes', lambda: {'upserted_ids': ['us0'], 'deleted_ids': []})
+    monkeypatch.setattr(api, 'fetch_latest_quakes', lambda: make_quakes([5.5]))
+    asyncio.run(api.refresh_catalog())
+
+    def should_not_run(*args):
+        raise AssertionError("nothing changed, nothing to recompute")
+    monkeypatch.setattr(api, 'fetch_latest_quakes', should_not_run)
+    monkeypatch.setattr(api, 'compute_exposure', should_not_run)
+    monkeypatch.setattr(api, 'sync_quakes', lambda: None)
+    asyncio.run(api.refresh_catalog())
+    monkeypatch.setattr(api, 'sync_quakes', lambda: {'upserted_ids': [], 'deleted_ids': []})
+    asyncio.run(api.refresh_catalog())
+
+    assert api.quake_cache.select(5.0)['count'] == 1
+
+def test_background_refresh_on_startup(monkeypatch, fresh_state):
+    monkeypatch.setattr(api, 'sync_quakes', lambda: {'upserted_ids': ['us0'], 'deleted_ids': []})
+    monkeypatch.setattr(api, 'fetch_latest_quakes', lambda: make_quakes([5.5, 7.0]))
+
+    with TestClient(api.app) as client:
+        for _ in range(50):
+            if api.exposure_index.table is not None:
+                break
+            asyncio.run(asyncio.sleep(0.02))
+        body = client.get("/latest_quakes").json()
+
+    assert body['count'] == 2
+
+def test_city_endpoints(fresh_state):
+    client = TestClient(api.app)
+    assert client.get("/top").status_code == 503
+
+    api.exposure_index.update(make_exposure())
+
+    mandalay = client.get("/cities/mandalay/risk").json()['cities'][0]
+    assert mandalay['risk_category'] == 'CRITICAL'
+    assert mandalay['top_contributing_quakes'][0]['id'] == 'us7000pn9s'
+    assert client.get("/cities/Atlantis/risk").status_code == 404
+
+    japan = client.get("/cities", params={"country": "Japan"}).json()['cities']
+    assert [c['city_name'] for c in japan] == ['Tokyo', 'Osaka']
+    assert 'top_contributing_quakes' not in japan[0]
+
+    strong = client.get("/cities", params={"country": "myanmar", "min_pga": 0.1}).json()
+    assert [c['city_name'] for c in strong['cities']] == ['Mandalay']
+    assert client.get("/cities", params={"category": "critical"}).json()['count'] == 1
+
+    top = client.get("/top", params={"n": 2}).json()['cities']
+    assert [c['city_name'] for c in top] == ['Mandalay', 'Tokyo']
+
+def test_unknown_filters_and_bad_limits(fresh_state):
+    client = TestClient(api.app)
+    api.exposure_index.update(make_exposure())
+
+    assert client.get("/cities", params={"country": "Atlantis", "min_pga": 0.1}).json() == {"count": 0, "cities": []}
+    assert client.get("/cities", params={"category": "BOGUS", "min_pga": 0}).json()['count'] == 0
+    assert client.get("/cities", params={"limit": -1}).status_code == 422
+    assert client.get("/cities", params={"limit": 0}).status_code == 422
+    assert client.get("/top", params={"n": 0}).status_code == 422
+
+def test_refresh_swaps_a_whole_snapshot(fresh_state):
+    api.exposure_index.update(make_exposure())
+    before = api.require_exposure()
+    smaller = make_exposure().iloc[[0]]
+    api.exposure_index.update(smaller)
+
+    # a request that took the old snapshot keeps a consistent one
+    assert len(before.records) == len(make_exposure())
+    for name in before.by_name:
+        assert [r['city_name'].lower() for r in before.city(name)] == [name]
+    assert api.require_exposure().table['city_name'].tolist() == smaller['city_name'].tolist()
+    assert api.exposure_index.snapshot is not before
+
+def test_map_rendered_once_per_refresh(monkeypatch, fresh_state):
+    renders = []
+    monkeypatch.setattr(api, 'get_cities', make_cities)
+    monkeypatch.setattr(api, 'get_boundaries', lambda: None)
+    monkeypatch.setattr(api, 'query_catalog', lambda *args, **kwargs: renders.append(1) or make_quakes([5.5, 7.0]))
+    monkeypatch.setattr(api, 'sync_quakes', lambda: {'upserted_ids': ['us0'], 'deleted_ids': []})
+    monkeypatch.setattr(api, 'fetch_latest_quakes', lambda: make_quakes([5.5]))
+    client = TestClient(api.app)
+    assert client.get("/map").status_code == 503
+
+    asyncio.run(api.refresh_catalog())
+    first = client.get("/map").json()
+    client.get("/map")
+    asyncio.run(api.refresh_catalog())
+    client.get("/map")
+
+    assert len(renders) == 2
+    assert [trace['name'] for trace in first['data']] == ['Earthquakes', 'Cities at Risk']
+
+def test_tiles_endpoint(monkeypatch, tmp_path, fresh_state):
+    monkeypatch.setattr(api, 'TILE_CACHE', str(tmp_path))
+    monkeypatch.setattr(api, 'window_quakes', lambda: make_quakes([5.5, 7.0]))
+    client = TestClient(api.app)
+    assert client.get("/tiles/hazard/0/0/0.png").status_code == 503
+
+    api.quake_cache.update(make_quakes([5.5, 7.0]))
+    tile = client.get("/tiles/hazard/0/0/0.png")
+    cached = client.get("/tiles/hazard/0/0/0.png", headers={"If-None-Match": tile.headers['etag']})
+
+    assert tile.headers['content-type'] == "image/png"
+    assert tile.content.startswith(b"\x89PNG")
+    assert cached.status_code == 304
+    assert client.get("/tiles/hazard/1/2/0.png").status_code == 404
+    assert client.get("/tiles/rainfall/0/0/0.png").status_code == 404
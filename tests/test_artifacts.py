@@ -0,0 +1,59 @@
+import numpy as np
+import geopandas as gpd
+from earthquake_exposure.artifacts import build_city_artifacts, load_city_artifacts
+from earthquake_exposure import api
+from earthquake_exposure.impact import CityImpactIndex
+
+def make_cities(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return gpd.GeoDataFrame({
+        'name': [f'city_{i}' for i in range(n)],
+        'country': rng.choice(['Japan', 'Russia', 'Fiji'], n),
+        'population': rng.integers(250000, 5000000, n),
+    }, geometry=gpd.points_from_xy(rng.uniform(-180, 180, n), rng.uniform(-85, 85, n)), crs='EPSG:4326')
+
+def test_round_trip_and_mmap(tmp_path):
+    cities = make_cities()
+    build_city_artifacts(cities, str(tmp_path))
+    artifacts = load_city_artifacts(str(tmp_path))
+
+    assert isinstance(artifacts.arrays['unit_xyz'], np.memmap)
+    frame = artifacts.to_frame()
+    assert frame['name'].tolist() == cities['name'].tolist()
+    assert frame['population'].tolist() == cities['population'].tolist()
+    assert frame.geometry.geom_equals_exact(cities.geometry, 1e-12).all()
+    assert load_city_artifacts(str(tmp_path / "missing")) is None
+
+def test_impact_index_from_artifacts(tmp_path):
+    cities = make_cities()
+    build_city_artifacts(cities, str(tmp_path))
+
+    mapped = CityImpactIndex.from_artifacts(load_city_artifacts(str(tmp_path)))
+    built = CityImpactIndex.from_frame(cities)
+
+    a = mapped.affected_cities(139.7, 35.7, 7.5, 10.0)
+    b = built.affected_cities(139.7, 35.7, 7.5, 10.0)
+    assert a['city_name'].tolist() == b['city_name'].tolist()
+    np.testing.assert_allclose(a['pga'], b['pga'])
+
+def test_changed_cities_rebuild(tmp_path, monkeypatch):
+    cities = make_cities()
+    build_city_artifacts(cities, str(tmp_path))
+    assert load_city_artifacts(str(tmp_path), cities) is not None
+
+    moved = cities.copy()
+    lon = cities.geometry.x.to_numpy().copy()
+    lon[0] += 0.5
+    moved.geometry = gpd.points_from_xy(lon, cities.geometry.y, crs=cities.crs)
+    assert load_city_artifacts(str(tmp_path), moved) is None
+    assert load_city_artifacts(str(tmp_path), cities.iloc[:-1]) is None
+
+    # the API notices and rebuilds instead of serving the old positions
+    monkeypatch.setattr(api, 'CITY_ARTIFACTS', str(tmp_path))
+    monkeypatch.setattr(api, 'load_asian_cities', lambda: moved)
+    api.get_city_artifacts.cache_clear()
+    try:
+        artifacts = api.get_city_artifacts()
+        assert artifacts.to_frame().geometry.geom_equals_exact(moved.geometry, 1e-12).all()
+    finally:
+        api.get_city_artifacts.cache_clear()
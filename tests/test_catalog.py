@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+import pytest
+import pandas as pd
+from earthquake_exposure.catalog import sync_catalog, query_catalog, iter_catalog_chunks
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+@pytest.fixture
+def usgs_stub():
+    # stand-in for the USGS FDSN service: the full recording on the first call,
+    # the recorded revisions once the client asks with updatedafter
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            name = "usgs_updates.geojson" if "updatedafter" in params else "usgs_catalog.geojson"
+            with open(os.path.join(DATA_DIR, name), "rb") as f:
+                body = f.read()
+
+            if url.path.endswith("/count"):
+                body = json.dumps({"count": json.loads(body)["metadata"]["count"], "maxAllowed": 20000}).encode()
+            else:
+                requests_seen.append(params)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/fdsnws/event/1/query", requests_seen
+    server.shutdown()
+
+def test_first_sync_loads_everything(tmp_path, usgs_stub):
+    url, seen = usgs_stub
+    db = str(tmp_path / "catalog.sqlite")
+
+    result = sync_catalog(db, starttime="2025-01-01", url=url)
+    quakes = query_catalog(db)
+
+    assert "updatedafter" not in seen[0]
+    assert result['fetched'] == 5
+    assert len(quakes) == 5
+    assert quakes['time'].is_monotonic_increasing
+    assert quakes.crs == "EPSG:4326"
+    assert quakes.loc[quakes['id'] == 'us7000pn9s', 'mag'].iloc[0] == 7.7
+
+def test_incremental_sync_upserts_and_deletes(tmp_path, usgs_stub):
+    url, seen = usgs_stub
+    db = str(tmp_path / "catalog.sqlite")
+    first = sync_catalog(db, starttime="2025-01-01", url=url)
+
+    second = sync_catalog(db, url=url)
+    quakes = query_catalog(db).set_index('id')
+
+    # second call only asks for what changed since the newest update we saw
+    assert seen[1]['updatedafter'] == "2025-10-09T08:53:20.000"
+    assert seen[1]['starttime'] == "2025-01-01"
+    assert second['deleted_ids'] == ['us6000qw60']
+    assert second['high_water'] > first['high_water']
+    assert 'us6000qw60' not in quakes.index
+    assert 'us6000rk2z' in quakes.index
+    assert quakes.loc['us7000qfa3', 'mag'] == 5.5
+    assert quakes.loc['us7000qfa3', 'depth_km'] == 12.5
+    assert len(quakes) == 5
+
+def test_changed_settings_resync(tmp_path, usgs_stub):
+    url, seen = usgs_stub
+    db = str(tmp_path / "catalog.sqlite")
+    sync_catalog(db, starttime="2025-01-01", min_mag=5.0, url=url)
+
+    # a later start and a higher magnitude are inside what is stored, still incremental
+    narrower = sync_catalog(db, starttime="2025-06-01", min_mag=6.0, url=url)
+    assert not narrower['resynced']
+    assert 'updatedafter' in seen[1]
+    assert seen[1]['starttime'] == "2025-01-01"
+    assert seen[1]['minmagnitude'] == "5.0"
+
+    # a lower magnitude isn't, the whole window is fetched again with it
+    lower = sync_catalog(db, min_mag=4.5, url=url)
+    assert lower['resynced']
+    assert 'updatedafter' not in seen[2]
+    assert seen[2]['minmagnitude'] == "4.5"
+    assert seen[2]['starttime'] == "2025-01-01"
+    assert len(query_catalog(db)) == 5
+
+    # nor is a box reaching outside the stored one, and the new box sticks for the next sync
+    box = {'minlatitude': 0, 'maxlatitude': 50, 'minlongitude': 10, 'maxlongitude': 150}
+    moved = sync_catalog(db, bbox=box, url=url)
+    assert moved['resynced']
+    assert 'updatedafter' not in seen[3]
+    assert seen[3]['minlongitude'] == "10"
+    sync_catalog(db, url=url)
+    assert 'updatedafter' in seen[4]
+    assert seen[4]['minlongitude'] == "10"
+    assert seen[4]['minmagnitude'] == "4.5"
+
+def test_local_queries(tmp_path, usgs_stub):
+    url, _ = usgs_stub
+    db = str(tmp_path / "catalog.sqlite")
+    sync_catalog(db, starttime="2025-01-01", url=url)
+
+    march = query_catalog(db, starttime="2025-03-01", endtime="2025-03-31")
+    big = query_catalog(db, min_mag=6.0)
+    taiwan = query_catalog(db, bbox={'minlatitude': 21, 'maxlatitude': 26, 'minlongitude': 119, 'maxlongitude': 123})
+
+    assert set(march['id']) == {'us7000pn9s', 'us7000pnaf'}
+    assert set(big['id']) == {'us7000pn9s', 'us7000pnaf'}
+    assert set(taiwan['id']) == {'us6000qw60', 'us7000q1bd'}
+
+def test_sync_failure_keeps_catalog(tmp_path):
+    db = str(tmp_path / "catalog.sqlite")
+
+    assert sync_catalog(db, starttime="2025-01-01", url="http://127.0.0.1:9/nothing", timeout=1, max_retries=0) is None
+    assert query_catalog(db).empty
+
+def test_iter_catalog_chunks_in_time_order(tmp_path, usgs_stub):
+    url, _ = usgs_stub
+    db = str(tmp_path / "catalog.sqlite")
+    sync_catalog(db, starttime="2025-01-01", url=url)
+
+    chunks = list(iter_catalog_chunks(db, chunk_size=2))
+    times = [t for chunk in chunks for t in chunk['time']]
+
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert times == sorted(times)
+    assert set(pd.concat(chunks)['id']) == set(query_catalog(db)['id'])
@@ -0,0 +1,81 @@
+import json
+import sys
+import pandas as pd
+import pytest
+from earthquake_exposure import acquire, cli
+from earthquake_exposure.results import read_exposure_parquet
+from tests.test_api import make_cities, make_quakes
+
+@pytest.fixture
+def downloads(monkeypatch):
+    # counts the downloads instead of going to USGS / Natural Earth
+    calls = {'quakes': 0, 'cities': 0}
+
+    def get_earthquake_data(**kwargs):
+        calls['quakes'] += 1
+        return make_quakes([6.5, 7.0, 5.5])
+
+    def load_asian_cities(min_population=250000):
+        calls['cities'] += 1
+        cities = make_cities()
+        return cities[cities['population'] >= min_population].copy()
+
+    monkeypatch.setattr(acquire, 'get_earthquake_data', get_earthquake_data)
+    monkeypatch.setattr(acquire, 'load_asian_cities', load_asian_cities)
+    return calls
+
+def run(tmp_path, *extra):
+    return cli.main(['run', '--output-dir', str(tmp_path / 'out'), '--cache-dir', str(tmp_path / 'cache'), *extra])
+
+def test_run_writes_results_and_summary(tmp_path, downloads, capsys):
+    assert run(tmp_path) == 0
+
+    cities, quakes = read_exposure_parquet(tmp_path / 'out' / 'seismic_risk_results')
+    assert len(cities) == 4
+    assert quakes['event_id'].isin(['us0', 'us1', 'us2']).all()
+    summary = (tmp_path / 'out' / 'summary_statistics.txt').read_text()
+    assert "Total Cities Analyzed: 4" in summary
+    assert "Total Earthquakes: 3" in summary
+    assert "exposure: computed" in capsys.readouterr().out
+
+def test_rerun_only_recomputes_downstream(tmp_path, downloads, capsys):
+    run(tmp_path)
+    capsys.readouterr()
+
+    run(tmp_path, '--gmpe', 'ba2008')
+    out = capsys.readouterr().out
+    assert downloads == {'quakes': 1, 'cities': 1}
+    assert "quakes_metric: cached" in out and "cities_metric: cached" in out
+    assert "exposure: computed" in out
+
+    run(tmp_path, '--gmpe', 'ba2008')
+    assert "exposure: cached" in capsys.readouterr().out
+
+    # fewer cities only refetches the cities and what depends on them
+    run(tmp_path, '--gmpe', 'ba2008', '--min-population', '5000000')
+    out = capsys.readouterr().out
+    assert downloads == {'quakes': 1, 'cities': 2}
+    assert "quakes_metric: cached" in out and "cities_metric: computed" in out
+    assert len(read_exposure_parquet(tmp_path / 'out' / 'seismic_risk_results')[0]) == 2
+
+def test_csv_output(tmp_path, downloads):
+    assert run(tmp_path, '--format', 'csv') == 0
+    results = pd.read_csv(tmp_path / 'out' / 'seismic_risk_results.csv')
+    assert len(results) == 4
+    assert results['max_pga'].is_monotonic_decreasing
+
+def test_config_file_and_report(tmp_path, downloads):
+    config = tmp_path / 'run.json'
+    config.write_text(json.dumps({'gmpe': 'youngs1997', 'max_radius_km': 500}))
+    assert run(tmp_path, '--config', str(config), '--report', str(tmp_path / 'report.json')) == 0
+
+    report = json.loads((tmp_path / 'report.json').read_text())
+    assert 'exposure.compute_exposure_table' in [s['stage'] for s in report['stages']]
+
+    config.write_text(json.dumps({'gmpe': 'youngs1997', 'radius': 500}))
+    assert run(tmp_path, '--config', str(config)) == 2
+
+def test_compute_only_run_does_not_import_viz(tmp_path, downloads, monkeypatch):
+    monkeypatch.delitem(sys.modules, 'earthquake_exposure.viz', raising=False)
+    run(tmp_path)
+    assert 'earthquake_exposure.viz' not in sys.modules
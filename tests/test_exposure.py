@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+from earthquake_exposure import metrics, spatial_index
+from earthquake_exposure import catalog
+from earthquake_exposure.exposure import compute_exposure_table, compute_exposure_streaming, ExposureAccumulator, ExposureState
+from earthquake_exposure.preprocess import project_to_metric
+
+def make_test_data(n_cities=60, n_quakes=200, seed=0):
+    # random cities and quakes in a 3000km box, already in metres
+    rng = np.random.default_rng(seed)
+    cities = gpd.GeoDataFrame({
+        'name': [f'city_{i}' for i in range(n_cities)],
+        'country': rng.choice(['Japan', 'Nepal', 'Iran'], n_cities),
+        'population': rng.integers(250000, 5000000, n_cities),
+    }, geometry=gpd.points_from_xy(rng.uniform(0, 3e6, n_cities), rng.uniform(0, 3e6, n_cities)), crs='EPSG:4087')
+    quakes = gpd.GeoDataFrame({
+        'id': [f'us{i:04d}' for i in range(n_quakes)],
+        'mag': rng.uniform(5.0, 7.8, n_quakes).round(1),
+        'place': [f'place {i}' for i in range(n_quakes)],
+        'time': rng.integers(1735689600000, 1767225600000, n_quakes),
+        'depth_km': rng.choice([10.0, 35.0, 120.0, 400.0], n_quakes),
+    }, geometry=gpd.points_from_xy(rng.uniform(0, 3e6, n_quakes), rng.uniform(0, 3e6, n_quakes)), crs='EPSG:4087')
+    return cities, quakes
+
+def per_city_profiles(cities, quakes):
+    # the original notebook loop
+    tree, coords = spatial_index.build_kdtree(quakes)
+    rows = []
+    for _, city in cities.iterrows():
+        nearby = spatial_index.find_earthquakes_with_dynamic_radius(city.geometry, tree, coords, quakes)
+        rows.append(metrics.calculate_city_risk_profile(city, nearby))
+    return pd.DataFrame(rows)
+
+def test_batch_matches_per_city_loop():
+    cities, quakes = make_test_data()
+    expected = per_city_profiles(cities, quakes)
+    result = compute_exposure_table(cities, quakes)
+
+    assert list(result.columns) == list(expected.columns)
+    assert (result['num_earthquakes'] > 0).any()
+    for col in ['city_name', 'risk_category', 'risk_description', 'num_earthquakes', 'num_shallow_quakes']:
+        assert result[col].tolist() == expected[col].tolist()
+    for col in ['max_pga', 'max_magnitude', 'closest_quake_distance']:
+        np.testing.assert_allclose(result[col], expected[col], rtol=1e-9)
+
+    for got, want in zip(result['top_contributing_quakes'], expected['top_contributing_quakes']):
+        assert [q['time'] for q in got] == [q['time'] for q in want]
+        assert [q['pga'] for q in got] == pytest.approx([q['pga'] for q in want])
+
+def test_batch_keeps_event_ids():
+    cities, quakes = make_test_data()
+    result = compute_exposure_table(cities, quakes)
+    ids = [q['id'] for qs in result['top_contributing_quakes'] for q in qs]
+
+    assert ids and all(i.startswith('us') for i in ids)
+
+def test_batch_without_quakes():
+    cities, quakes = make_test_data()
+    result = compute_exposure_table(cities, quakes.iloc[:0])
+
+    assert (result['risk_category'] == 'MINIMAL').all()
+    assert (result['risk_description'] == 'No significant shaking predicted').all()
+    assert np.isinf(result['closest_quake_distance']).all()
+
+def test_assign_risk_categories():
+    categories, _ = metrics.assign_risk_categories([0.0, 0.02, 0.099, 0.3, 0.5, 2.4])
+
+    assert categories.tolist() == ['MINIMAL', 'LOW', 'LOW', 'HIGH', 'CRITICAL', 'CRITICAL']
+
+def make_lonlat_data(lon_range, lat_range, seed=1):
+    rng = np.random.default_rng(seed)
+    cities = gpd.GeoDataFrame({
+        'name': [f'city_{i}' for i in range(80)],
+        'country': 'Indonesia',
+        'population': 500000,
+    }, geometry=gpd.points_from_xy(rng.uniform(*lon_range, 80), rng.uniform(*lat_range, 80)), crs='EPSG:4326')
+    quakes = gpd.GeoDataFrame({
+        'mag': rng.uniform(5.0, 7.0, 150).round(1),
+        'time': np.arange(150),
+        'depth_km': 10.0,
+    }, geometry=gpd.points_from_xy(rng.uniform(*lon_range, 150), rng.uniform(*lat_range, 150)), crs='EPSG:4326')
+    return cities, quakes
+
+def test_greatcircle_matches_planar_near_equator():
+    cities, quakes = make_lonlat_data((100, 115), (-3, 3))
+    planar = compute_exposure_table(project_to_metric(cities), project_to_metric(quakes))
+    sphere = compute_exposure_table(cities, quakes, metric='greatcircle')
+
+    hit = (planar['num_earthquakes'] > 0) & (sphere['num_earthquakes'] > 0)
+    assert hit.sum() > 20
+    np.testing.assert_allclose(sphere['closest_quake_distance'][hit], planar['closest_quake_distance'][hit], rtol=0.01)
+    np.testing.assert_allclose(sphere['max_pga'][hit], planar['max_pga'][hit], rtol=0.02)
+
+def test_greatcircle_across_antimeridian():
+    cities = gpd.GeoDataFrame({'name': ['east'], 'country': 'Russia', 'population': 300000},
+                              geometry=gpd.points_from_xy([179.9], [65.0]), crs='EPSG:4326')
+    quakes = gpd.GeoDataFrame({'mag': [6.0], 'time': [0], 'depth_km': [10.0]},
+                              geometry=gpd.points_from_xy([-179.9], [65.0]), crs='EPSG:4326')
+
+    result = compute_exposure_table(cities, quakes, metric='greatcircle')
+
+    # 0.2 degrees of longitude at 65N is about 9.4 km
+    assert result['num_earthquakes'].iloc[0] == 1
+    assert result['closest_quake_distance'].iloc[0] == pytest.approx(9.4, abs=0.1)
+
+def test_streaming_matches_batch():
+    cities, quakes = make_test_data(n_quakes=400)
+    quakes = quakes.sort_values('time').reset_index(drop=True)
+    expected = compute_exposure_table(cities, quakes)
+
+    batches = (quakes.iloc[i:i + 70] for i in range(0, len(quakes), 70))
+    result = compute_exposure_streaming(cities, batches)
+
+    pd.testing.assert_frame_equal(result.drop(columns='top_contributing_quakes'),
+                                  expected.drop(columns='top_contributing_quakes'))
+    assert result['top_contributing_quakes'].tolist() == expected['top_contributing_quakes'].tolist()
+
+def test_streaming_from_parquet_row_groups(tmp_path):
+    cities, quakes = make_test_data(n_quakes=300)
+    cities = cities.set_crs('EPSG:4087', allow_override=True)
+    path = str(tmp_path / 'quakes.parquet')
+    catalog.write_catalog_parquet(quakes, path, row_group_size=64)
+
+    accumulator = ExposureAccumulator(cities)
+    for batch in catalog.iter_parquet_chunks(path):
+        assert len(batch) <= 64
+        accumulator.add(batch)
+    result = accumulator.result()
+    expected = compute_exposure_table(cities, quakes)
+
+    assert accumulator.num_batches == 5
+    assert result['num_earthquakes'].tolist() == expected['num_earthquakes'].tolist()
+    np.testing.assert_allclose(result['max_pga'], expected['max_pga'], rtol=1e-6)
+
+def assert_same_exposure(result, expected):
+    for col in ['city_name', 'risk_category', 'risk_description', 'num_earthquakes', 'num_shallow_quakes']:
+        assert result[col].tolist() == expected[col].tolist()
+    for col in ['max_pga', 'max_magnitude', 'closest_quake_distance']:
+        np.testing.assert_allclose(result[col], expected[col], rtol=1e-9)
+    for got, want in zip(result['top_contributing_quakes'], expected['top_contributing_quakes']):
+        assert [q['id'] for q in got] == [q['id'] for q in want]
+
+def test_incremental_state_matches_full_recompute(tmp_path):
+    cities, quakes = make_test_data(n_quakes=300)
+    quakes = quakes.sort_values('time').reset_index(drop=True)
+
+    state = ExposureState(cities)
+    state.apply_new_events(quakes.iloc[:200])
+
+    # revise a few old events (bigger, moved), delete some, then add the rest
+    revised = quakes.iloc[[3, 50, 120]].copy()
+    revised['mag'] = 7.5
+    revised.geometry = revised.geometry.translate(2e5, 0)
+    deleted = quakes['id'].iloc[[10, 60]].tolist()
+    state.apply_new_events(revised, deleted_ids=deleted)
+    affected = state.apply_new_events(quakes.iloc[200:])
+
+    final = quakes.set_index('id')
+    final.update(revised.set_index('id')[['mag']])
+    final.loc[revised['id'], 'geometry'] = revised.geometry.to_numpy()
+    final = final.drop(index=deleted).reset_index()
+
+    assert 0 < len(affected) <= len(cities)
+    assert_same_exposure(state.result(), compute_exposure_table(cities, final))
+
+    # saved and loaded back gives the same table
+    state.save(tmp_path / "state.parquet")
+    loaded = ExposureState.load(tmp_path / "state.parquet", cities)
+    assert_same_exposure(loaded.result(), state.result())
+
+def test_incremental_state_status_and_expiry():
+    cities, quakes = make_test_data()
+    quakes = quakes.sort_values('time').reset_index(drop=True)
+    state = ExposureState(cities, min_mag=5.0)
+    state.apply_new_events(quakes)
+
+    # a deleted status or a downgrade below min_mag both take the event out
+    changed = quakes.iloc[:2].copy()
+    changed['status'] = ['deleted', 'reviewed']
+    changed['mag'] = [6.0, 4.0]
+    state.apply_new_events(changed)
+    cutoff = quakes['time'].iloc[100]
+    state.expire(cutoff)
+
+    expected = compute_exposure_table(cities, quakes.iloc[100:])
+    assert_same_exposure(state.result(), expected)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from earthquake_exposure import gmpe, metrics
+from earthquake_exposure.exposure import compute_exposure_table
+from earthquake_exposure.impact import CityImpactIndex
+from tests.test_exposure import make_test_data
+
+MAGS = np.array([5.0, 6.0, 7.0, 7.0, 8.0])
+DISTS = np.array([10.0, 20.0, 10.0, 100.0, 150.0])
+DEPTHS = np.array([10.0, 10.0, 10.0, 60.0, 30.0])
+
+def test_default_is_the_original_formula():
+    np.testing.assert_allclose(gmpe.calculate_pga(MAGS, DISTS, DEPTHS), metrics.calculate_pga_gmpe(MAGS, DISTS, DEPTHS))
+
+@pytest.mark.parametrize("name", list(gmpe.GMPES))
+def test_models_are_sane_and_float32(name):
+    pga = gmpe.calculate_pga(MAGS, DISTS, DEPTHS, gmpe=name)
+    pga32 = gmpe.calculate_pga(MAGS, DISTS, DEPTHS, gmpe=name, dtype=np.float32)
+    tau, phi = gmpe.get_sigma(MAGS, gmpe=name)
+
+    assert np.all((pga > 0) & (pga < 3))
+    assert pga32.dtype == np.float32
+    np.testing.assert_allclose(pga32, pga, rtol=1e-4)
+    # shaking grows with magnitude and falls off with distance
+    assert pga[2] > pga[0] and pga[2] > pga[3]
+    assert np.all(tau > 0) and np.all(phi > tau)
+
+def test_site_terms():
+    # BA08 is defined so the reference rock (760 m/s) has no amplification
+    rock = gmpe.calculate_pga(MAGS, DISTS, DEPTHS, gmpe='ba2008')
+    np.testing.assert_allclose(gmpe.calculate_pga(MAGS, DISTS, DEPTHS, vs30=760.0, gmpe='ba2008'), rock)
+    assert np.all(gmpe.calculate_pga(MAGS, DISTS, DEPTHS, vs30=250.0, gmpe='ba2008') > rock)
+    assert np.all(gmpe.calculate_pga(MAGS, DISTS, DEPTHS, vs30=250.0, gmpe='youngs1997') >
+                  gmpe.calculate_pga(MAGS, DISTS, DEPTHS, gmpe='youngs1997'))
+
+def test_unknown_model():
+    with pytest.raises(ValueError):
+        gmpe.calculate_pga(MAGS, DISTS, DEPTHS, gmpe='nope')
+
+def test_exposure_and_impact_use_the_chosen_model():
+    cities, quakes = make_test_data()
+    cities['vs30'] = np.linspace(200, 900, len(cities))
+    cities, quakes = cities.to_crs('EPSG:4326'), quakes.to_crs('EPSG:4326')
+
+    table = compute_exposure_table(cities, quakes, metric='greatcircle', gmpe='ba2008')
+    index = CityImpactIndex.from_frame(cities, gmpe='ba2008')
+    affected = index.affected_cities_batch(quakes.geometry.x, quakes.geometry.y, quakes['mag'], quakes['depth_km'])
+    per_city = affected.groupby('city_name')['pga'].max()
+
+    hit = table[table['num_earthquakes'] > 0].set_index('city_name')['max_pga']
+    np.testing.assert_allclose(per_city.loc[hit.index], hit, rtol=1e-9)
+    default = compute_exposure_table(cities, quakes, metric='greatcircle').set_index('city_name')['max_pga']
+    assert not np.allclose(hit, default.loc[hit.index])
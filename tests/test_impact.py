@@ -0,0 +1,60 @@
+import numpy as np
+import geopandas as gpd
+import pytest
+from fastapi.testclient import TestClient
+from earthquake_exposure import api, metrics
+from earthquake_exposure.impact import CityImpactIndex
+from earthquake_exposure.preprocess import project_to_metric
+
+def make_cities():
+    return gpd.GeoDataFrame({
+        'name': ['Mandalay', 'Naypyidaw', 'Yangon', 'Tokyo'],
+        'country': ['Myanmar', 'Myanmar', 'Myanmar', 'Japan'],
+        'population': [1300000, 930000, 4800000, 35000000],
+    }, geometry=gpd.points_from_xy([96.08, 96.13, 96.17, 139.75], [21.97, 19.75, 16.78, 35.69]), crs='EPSG:4326')
+
+def test_single_event_impact():
+    index = CityImpactIndex.from_frame(make_cities())
+
+    # the 2025 Mandalay mainshock
+    affected = index.affected_cities(95.925, 22.011, 7.7, 10.0)
+
+    assert affected['city_name'].tolist() == ['Mandalay', 'Naypyidaw', 'Yangon']
+    assert affected['risk_category'].iloc[0] == 'CRITICAL'
+    assert affected['pga'].iloc[0] == pytest.approx(
+        metrics.calculate_pga_gmpe(7.7, affected['distance_km'].iloc[0], 10.0))
+
+def test_small_event_only_hits_nearby_cities():
+    index = CityImpactIndex.from_frame(make_cities())
+
+    assert index.affected_cities(96.1, 21.9, 5.0)['city_name'].tolist() == ['Mandalay']
+    assert index.affected_cities(120.0, 0.0, 6.0).empty
+
+def test_planar_index_agrees_with_greatcircle():
+    cities = make_cities()
+    sphere = CityImpactIndex.from_frame(cities).affected_cities(95.925, 22.011, 7.7)
+    planar = CityImpactIndex.from_frame(project_to_metric(cities), metric='planar').affected_cities(95.925, 22.011, 7.7)
+
+    # the plane stretches east-west distances by 1/cos(lat), about 8% at 22N
+    assert planar['city_name'].tolist() == sphere['city_name'].tolist()
+    np.testing.assert_allclose(planar['distance_km'], sphere['distance_km'], rtol=0.08)
+
+def test_batch_of_events():
+    index = CityImpactIndex.from_frame(make_cities())
+    result = index.affected_cities_batch([95.925, 139.8], [22.011, 35.6], [7.7, 6.0], event_id=['a', 'b'])
+
+    assert set(result.loc[result['event_id'] == 'b', 'city_name']) == {'Tokyo'}
+    assert len(result[result['event_id'] == 'a']) == 3
+
+def test_impact_endpoint(monkeypatch):
+    monkeypatch.setattr(api, 'get_cities', make_cities)
+    api.get_city_index.cache_clear()
+    client = TestClient(api.app)
+
+    response = client.get("/impact", params={"lat": 22.011, "lon": 95.925, "mag": 7.7, "min_pga": 0.1})
+    api.get_city_index.cache_clear()
+
+    body = response.json()
+    assert response.status_code == 200
+    assert body['cities'][0]['city'] == 'Mandalay'
+    assert all(c['pga'] >= 0.1 for c in body['cities'])
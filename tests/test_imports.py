@@ -0,0 +1,24 @@
+import os
+import pytest
+from benchmarks.bench_imports import check_budgets, check_startup, import_times
+
+def test_no_heavy_libraries_at_import():
+    assert check_budgets(repeat=1, times=False) == []
+
+def test_startup_against_a_bare_interpreter():
+    assert check_startup(repeat=2) == []
+
+# the tighter budgets relative to pandas, for machines quiet enough to hold them
+@pytest.mark.skipif(os.environ.get("EARTHQUAKE_IMPORT_BUDGETS") != "1", reason="set EARTHQUAKE_IMPORT_BUDGETS=1")
+def test_startup_within_budget():
+    assert check_budgets(repeat=2) == []
+
+def test_package_submodules_load_on_first_use():
+    times = import_times('earthquake_exposure')
+    assert not any(name.startswith('earthquake_exposure.') for name in times)
+
+    import earthquake_exposure
+    assert earthquake_exposure.gmpe.DEFAULT_GMPE == 'cb2008'
+    assert 'gmpe' in dir(earthquake_exposure)
+    with pytest.raises(AttributeError):
+        earthquake_exposure.nothing_here
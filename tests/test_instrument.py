@@ -0,0 +1,61 @@
+import pytest
+from fastapi.testclient import TestClient
+from earthquake_exposure import api, instrument, spatial_index
+from earthquake_exposure.exposure import compute_exposure_table
+from tests.test_api import make_cities, make_quakes
+
+@pytest.fixture
+def enabled():
+    instrument.reset()
+    instrument.enable()
+    yield
+    instrument.disable()
+    instrument.reset()
+
+def test_disabled_records_nothing():
+    instrument.disable()
+    instrument.reset()
+    compute_exposure_table(make_cities(), make_quakes([6.0, 7.0]), metric='greatcircle')
+    assert instrument.report()['stages'] == []
+    assert instrument.report()['counters'] == {}
+
+def test_stages_and_counters(enabled):
+    compute_exposure_table(make_cities(), make_quakes([6.0, 7.0]), metric='greatcircle')
+    report = instrument.report()
+
+    stages = {s['stage']: s for s in report['stages']}
+    assert stages['exposure.compute_exposure_table']['calls'] == 1
+    assert stages['spatial_index.find_city_quake_pairs']['seconds'] <= stages['exposure.compute_exposure_table']['seconds']
+    # per-row helpers are not stages
+    assert not any(name.startswith(('metrics.', 'gmpe.')) for name in stages)
+    assert report['counters']['pairs_kept'] > 0
+    assert 'pairs_candidate' not in report['counters']
+
+def test_impact_pairs_are_counted_apart(enabled):
+    from earthquake_exposure.impact import CityImpactIndex
+    index = CityImpactIndex.from_frame(make_cities(), metric='greatcircle')
+    index.affected_cities_batch([139.7], [35.7], [7.0])
+
+    counters = instrument.report()['counters']
+    assert counters['impact_pairs_kept'] > 0
+    assert 'pairs_kept' not in counters
+
+def test_legacy_loop_counts_the_felt_radius_filter(enabled):
+    cities = make_cities().to_crs('EPSG:4087')
+    quakes = make_quakes([5.0, 7.5]).to_crs('EPSG:4087')
+    tree, coords = spatial_index.build_kdtree(quakes)
+    for point in cities.geometry:
+        spatial_index.find_earthquakes_with_dynamic_radius(point, tree, coords, quakes)
+
+    counters = instrument.report()['counters']
+    assert counters['pairs_kept'] < counters['pairs_candidate']
+
+def test_metrics_endpoint(enabled):
+    client = TestClient(api.app)
+    client.get("/")
+    client.get("/cities/tokyo/risk")
+
+    text = client.get("/metrics").text
+    assert 'earthquake_exposure_stage_calls_total{stage="http GET /"} 1' in text
+    assert 'stage="http GET /cities/{name}/risk"' in text
+    assert "earthquake_exposure_max_rss_bytes" in text
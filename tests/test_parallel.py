@@ -0,0 +1,31 @@
+import numpy as np
+from earthquake_exposure.exposure import compute_exposure_table
+from earthquake_exposure.parallel import compute_exposure_parallel, run_scenarios
+from earthquake_exposure.spatial_index import partition_cities
+from tests.test_exposure import make_test_data, assert_same_exposure
+
+def test_parallel_matches_batch():
+    cities, quakes = make_test_data(n_cities=200, n_quakes=400)
+
+    result = compute_exposure_parallel(cities, quakes, max_workers=2, n_blocks=7)
+
+    assert_same_exposure(result, compute_exposure_table(cities, quakes))
+    assert result['top_contributing_quakes'].map(len).sum() > 0
+    assert {q['place'] for qs in result['top_contributing_quakes'] for q in qs} <= set(quakes['place'])
+
+def test_parallel_scenarios_greatcircle():
+    cities, quakes = make_test_data(n_cities=100, n_quakes=300)
+    cities, quakes = cities.to_crs('EPSG:4326'), quakes.to_crs('EPSG:4326')
+    scenarios = [{'max_radius_km': 300}, {'min_mag': 6.5}]
+
+    near, big = run_scenarios(cities, quakes, scenarios, metric='greatcircle', max_workers=2, n_blocks=4)
+
+    assert_same_exposure(near, compute_exposure_table(cities, quakes, max_radius_km=300, metric='greatcircle'))
+    assert_same_exposure(big, compute_exposure_table(cities, quakes[quakes['mag'] >= 6.5], metric='greatcircle'))
+
+def test_partition_covers_every_city_once():
+    xy = np.random.default_rng(1).uniform(0, 100, (1000, 2))
+    blocks = partition_cities(xy, 9)
+
+    assert len(blocks) == 9
+    assert sorted(np.concatenate(blocks).tolist()) == list(range(1000))
@@ -0,0 +1,57 @@
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import box
+from earthquake_exposure import gmpe, spatial_index
+from earthquake_exposure.population import (
+    make_synthetic_population_grid, compute_cell_pga, compute_population_exposure, exposed_column
+)
+from tests.test_rupture import make_mandalay
+
+def test_synthetic_grid_keeps_population():
+    cities, _ = make_mandalay()
+    cells = make_synthetic_population_grid(cities, cell_deg=0.05)
+
+    assert cells[['lon', 'lat']].duplicated().sum() == 0
+    np.testing.assert_allclose(cells['population'].sum(), cities['population'].sum())
+
+def test_cell_pga_matches_brute_force():
+    cities, quakes = make_mandalay()
+    cells = make_synthetic_population_grid(cities, cell_deg=0.1)
+
+    tiled = compute_cell_pga(cells, quakes, tile_size=50, quake_chunk=1)
+
+    cell_xyz = spatial_index.lonlat_to_unit_vectors(cells['lon'], cells['lat'])
+    eq_xyz = spatial_index.lonlat_to_unit_vectors(quakes.geometry.x, quakes.geometry.y)
+    dist = spatial_index.chord_to_km(np.linalg.norm(cell_xyz[:, None] - eq_xyz[None], axis=2))
+    radius = spatial_index.get_magnitude_based_radii(quakes['mag'].to_numpy())
+    pga = gmpe.calculate_pga(quakes['mag'].to_numpy()[None], dist, quakes['depth_km'].to_numpy()[None])
+    expected = np.where(dist <= radius, pga, 0).max(axis=1)
+    np.testing.assert_allclose(tiled, expected, rtol=1e-9)
+
+def test_people_per_city_and_country():
+    cities, quakes = make_mandalay()
+    cells = make_synthetic_population_grid(cities, cell_deg=0.05)
+
+    city_table, country_table = compute_population_exposure(cells, cities, quakes, city_radius_km=40)
+    city_table = city_table.set_index('city_name')
+    mandalay = city_table.loc['Mandalay']
+
+    # counts are cumulative: everyone above HIGH is also above LOW
+    columns = [exposed_column(c) for c in ['LOW', 'MODERATE', 'HIGH', 'CRITICAL']]
+    assert np.all(np.diff(city_table[columns].to_numpy(), axis=1) <= 1e-6)
+    assert mandalay[exposed_column('CRITICAL')] > 0.5 * mandalay['population']
+    assert city_table.loc['Bangkok', exposed_column('LOW')] == 0
+    assert set(country_table['country']) == {'Myanmar', 'Thailand'}
+    np.testing.assert_allclose(country_table['population'].sum(), cells['population'].sum())
+
+def test_city_polygons():
+    cities, quakes = make_mandalay()
+    cells = make_synthetic_population_grid(cities, cell_deg=0.05)
+    areas = gpd.GeoDataFrame({'name': ['Greater Mandalay'], 'country': ['Myanmar']},
+                             geometry=[box(95.5, 21.5, 96.5, 22.5)], crs='EPSG:4326')
+
+    city_table, _ = compute_population_exposure(cells, cities, quakes, city_areas=areas)
+
+    assert city_table['city_name'].tolist() == ['Greater Mandalay']
+    inside = cells['lon'].between(95.5, 96.5) & cells['lat'].between(21.5, 22.5)
+    np.testing.assert_allclose(city_table['population'].iloc[0], cells.loc[inside, 'population'].sum(), rtol=1e-6)
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from earthquake_exposure.results import read_exposure_parquet, to_exposure_table, write_exposure_parquet
+from tests.test_api import make_exposure
+
+def test_round_trip_keeps_event_ids(tmp_path):
+    exposure = make_exposure()
+    write_exposure_parquet(exposure, tmp_path)
+    cities, quakes = read_exposure_parquet(tmp_path)
+
+    assert cities['max_pga'].dtype == np.float32
+    assert cities['country'].dtype == 'category'
+    assert quakes['event_id'].dtype == 'category'
+    assert set(quakes['event_id']) <= {'us7000pn9s', 'us6000abcd'}
+
+    back = to_exposure_table(cities, quakes).set_index('city_name')
+    for _, row in exposure.iterrows():
+        other = back.loc[row['city_name']]
+        assert other['max_pga'] == pytest.approx(row['max_pga'], rel=1e-6)
+        assert [q['id'] for q in other['top_contributing_quakes']] == [q['id'] for q in row['top_contributing_quakes']]
+        assert [q['pga'] for q in other['top_contributing_quakes']] == \
+            pytest.approx([q['pga'] for q in row['top_contributing_quakes']], rel=1e-6)
+
+def test_read_one_country_or_category(tmp_path):
+    exposure = make_exposure()
+    write_exposure_parquet(exposure, tmp_path)
+
+    cities, quakes = read_exposure_parquet(tmp_path, country='Japan')
+    assert sorted(cities['city_name']) == ['Osaka', 'Tokyo']
+    assert set(quakes['city_id']) <= set(cities['city_id'])
+    assert len(quakes) == exposure[exposure['country'] == 'Japan']['top_contributing_quakes'].map(len).sum()
+
+    category = exposure['risk_category'].iloc[0]
+    cities, _ = read_exposure_parquet(tmp_path, category=category, contributions=False)
+    assert sorted(cities['city_name']) == sorted(exposure[exposure['risk_category'] == category]['city_name'])
+
+    cities, quakes = read_exposure_parquet(tmp_path, country='Atlantis')
+    assert cities.empty and quakes.empty
+
+def test_more_than_127_quakes_per_city(tmp_path):
+    exposure = make_exposure()
+    exposure['top_contributing_quakes'] = [quakes * 200 for quakes in exposure['top_contributing_quakes']]
+    write_exposure_parquet(exposure, tmp_path)
+    _, quakes = read_exposure_parquet(tmp_path)
+
+    most = exposure['top_contributing_quakes'].map(len).max()
+    assert most > 127
+    assert quakes['rank'].max() == most - 1
+    assert (quakes['rank'] >= 0).all()
+
+def test_missing_strings_stay_null(tmp_path):
+    exposure = make_exposure()
+    exposure['top_contributing_quakes'] = [
+        [{**quake, 'place': None if i % 2 else float('nan')} for i, quake in enumerate(quakes)]
+        for quakes in exposure['top_contributing_quakes']
+    ]
+    write_exposure_parquet(exposure, tmp_path)
+    _, quakes = read_exposure_parquet(tmp_path)
+
+    assert len(quakes) > 0
+    assert quakes['place'].isna().all()
+    assert not quakes['place'].astype(object).isin(['None', 'nan']).any()
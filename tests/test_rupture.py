@@ -0,0 +1,69 @@
+import numpy as np
+import geopandas as gpd
+from earthquake_exposure import rupture, spatial_index
+from earthquake_exposure.exposure import compute_exposure_table
+from tests.test_exposure import make_test_data, assert_same_exposure
+
+def make_mandalay():
+    # the M7.7 of March 2025 ruptured roughly north-south along the Sagaing fault
+    quakes = gpd.GeoDataFrame({
+        'id': ['us7000pn9s', 'small'], 'mag': [7.7, 5.2], 'place': ['Mandalay', 'nearby'],
+        'time': [1743142852715, 1743150000000], 'depth_km': [10.0, 10.0],
+    }, geometry=gpd.points_from_xy([95.925, 96.5], [22.011, 23.5]), crs='EPSG:4326')
+    cities = gpd.GeoDataFrame({
+        'name': ['Mandalay', 'Naypyidaw', 'Yangon', 'Bangkok'],
+        'country': ['Myanmar', 'Myanmar', 'Myanmar', 'Thailand'],
+        'population': [1300000, 930000, 5600000, 10500000],
+    }, geometry=gpd.points_from_xy([96.08, 96.13, 96.16, 100.5], [21.97, 19.75, 16.87, 13.75]), crs='EPSG:4326')
+    return cities, quakes
+
+def test_point_segment_distance():
+    d = rupture.point_segment_distance(np.array([0.0, 5.0, 13.0, 0.0]), np.array([3.0, 0.0, 0.0, 0.0]),
+                                       -10.0, 0.0, 10.0, 0.0)
+    np.testing.assert_allclose(d, [3.0, 0.0, 3.0, 0.0])
+
+def test_rupture_brings_shaking_closer():
+    cities, quakes = make_mandalay()
+    point = compute_exposure_table(cities, quakes, metric='greatcircle').set_index('city_name')
+    finite = compute_exposure_table(cities, quakes, metric='greatcircle', finite_fault=True).set_index('city_name')
+    traced = compute_exposure_table(cities, quakes, metric='greatcircle', finite_fault=True,
+                                    fault_traces={'us7000pn9s': [(96.0, 23.0), (96.05, 21.0), (96.2, 19.5)]})
+    traced = traced.set_index('city_name')
+    quakes['strike'] = [0.0, np.nan]
+    striked = compute_exposure_table(cities, quakes, metric='greatcircle', finite_fault=True).set_index('city_name')
+
+    # Naypyidaw is ~250 km from the epicentre but right on the traced fault
+    assert point.loc['Naypyidaw', 'closest_quake_distance'] > 200
+    assert finite.loc['Naypyidaw', 'closest_quake_distance'] < point.loc['Naypyidaw', 'closest_quake_distance']
+    assert finite.loc['Naypyidaw', 'closest_quake_distance'] <= striked.loc['Naypyidaw', 'closest_quake_distance']
+    assert striked.loc['Naypyidaw', 'closest_quake_distance'] < point.loc['Naypyidaw', 'closest_quake_distance']
+    assert traced.loc['Naypyidaw', 'closest_quake_distance'] < 10
+    assert traced.loc['Naypyidaw', 'max_pga'] > 10 * point.loc['Naypyidaw', 'max_pga']
+    # the small quake is still a point
+    assert finite.loc['Mandalay', 'num_earthquakes'] == point.loc['Mandalay', 'num_earthquakes']
+
+def test_no_large_quakes_is_the_point_path():
+    cities, quakes = make_test_data()
+    quakes['mag'] = np.minimum(quakes['mag'], 6.4)
+
+    assert_same_exposure(compute_exposure_table(cities, quakes, finite_fault=True), compute_exposure_table(cities, quakes))
+
+def test_planar_ruptures_use_the_planar_distances():
+    cities, quakes = make_mandalay()
+    cities, quakes = cities.to_crs('EPSG:4087'), quakes.to_crs('EPSG:4087')
+    city_idx, quake_idx, dist_km, _ = rupture.find_rupture_pairs(cities, quakes, metric='planar')
+    point_city, point_quake, point_km = spatial_index.find_city_quake_pairs(cities, quakes, metric='planar')
+
+    # without a strike or trace the rupture distance is the (planar) epicentral one minus half its length
+    half = rupture.rupture_length_km(7.7) / 2
+    big = quake_idx == 0
+    epicentral = dict(zip(point_city[point_quake == 0].tolist(), point_km[point_quake == 0]))
+    assert big.sum() == len(epicentral)
+    for city, dist in zip(city_idx[big].tolist(), dist_km[big]):
+        assert np.isclose(dist, max(epicentral[city] - half, 0.0))
+    # and the small quake is the point path unchanged
+    np.testing.assert_allclose(np.sort(dist_km[~big]), np.sort(point_km[point_quake == 1]))
+
+    traced = compute_exposure_table(cities, quakes, finite_fault=True,
+                                    fault_traces={'us7000pn9s': [(96.0, 23.0), (96.05, 21.0), (96.2, 19.5)]})
+    assert traced.set_index('city_name').loc['Naypyidaw', 'closest_quake_distance'] < 10
@@ -0,0 +1,35 @@
+import math
+import numpy as np
+import geopandas as gpd
+from earthquake_exposure import gmpe
+from earthquake_exposure.simulation import simulate_exceedance, exceedance_columns
+from tests.test_exposure import make_test_data
+
+def test_single_pair_matches_lognormal():
+    cities = gpd.GeoDataFrame({'name': ['A'], 'country': ['X'], 'population': [1]},
+                              geometry=gpd.points_from_xy([0.0], [0.0]), crs='EPSG:4087')
+    quakes = gpd.GeoDataFrame({'mag': [6.5], 'depth_km': [10.0]},
+                              geometry=gpd.points_from_xy([30000.0], [0.0]), crs='EPSG:4087')
+    thresholds = [0.1, 0.3, 1.0]
+
+    result = simulate_exceedance(cities, quakes, thresholds=thresholds, n_sims=20000, seed=1)
+
+    median = gmpe.calculate_pga(6.5, 30.0, 10.0)
+    tau, phi = gmpe.get_sigma(6.5)
+    sigma = math.hypot(float(tau), float(phi))
+    for t, column in zip(thresholds, exceedance_columns(thresholds)):
+        expected = 0.5 * math.erfc((math.log(t) - math.log(median)) / (sigma * math.sqrt(2)))
+        assert abs(result[column].iloc[0] - expected) < 0.015
+
+def test_chunking_does_not_change_results():
+    cities, quakes = make_test_data()
+
+    whole = simulate_exceedance(cities, quakes, n_sims=200, sims_per_block=50, seed=3)
+    chunked = simulate_exceedance(cities, quakes, n_sims=200, sims_per_block=50, chunk_size=37, seed=3)
+
+    columns = exceedance_columns([0.02, 0.1, 0.3, 0.5])
+    np.testing.assert_array_equal(whole[columns].to_numpy(), chunked[columns].to_numpy())
+    # exceedance can only go down as the threshold goes up, and cities without quakes never exceed
+    probs = whole[columns].to_numpy()
+    assert np.all(np.diff(probs, axis=1) <= 0)
+    assert probs[:, 0].max() > 0
@@ -0,0 +1,74 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from earthquake_exposure import tiles
+from earthquake_exposure.gmpe import calculate_pga
+from tests.test_api import make_quakes
+
+def test_mercator_round_trip():
+    lon, lat = np.array([-179.0, 0.0, 96.08, 139.75]), np.array([-60.0, 0.0, 21.97, 35.69])
+    back_lon, back_lat = tiles.mercator_to_lonlat(*tiles.lonlat_to_mercator(lon, lat))
+    assert np.allclose(back_lon, lon) and np.allclose(back_lat, lat)
+
+def test_hazard_peaks_at_the_quake():
+    renderer = tiles.TileRenderer(make_quakes([7.0]))
+    z = 8
+    u, v = tiles.lonlat_to_mercator(100.0, 20.0)
+    x, y = int(u * 2 ** z), int(v * 2 ** z)
+    hazard = renderer.hazard(z, x, y)
+
+    # the pixel over the quake gets about the median PGA right above it
+    row, col = int(v * 2 ** z * 256) - y * 256, int(u * 2 ** z * 256) - x * 256
+    epicentre = calculate_pga(np.array([7.0]), np.array([0.0]), np.array([10.0]))[0]
+    assert hazard[row, col] == pytest.approx(epicentre, rel=0.1)
+    assert hazard.max() <= epicentre
+
+def test_density_counts_every_quake_once():
+    quakes = make_quakes([5.5] * 10)
+    renderer = tiles.TileRenderer(quakes)
+    total = sum(renderer.density(1, x, y).sum() for x in range(2) for y in range(2))
+    assert total == pytest.approx(10, rel=0.01)
+
+def test_tiles_are_png_and_cached_on_disk(tmp_path):
+    renderer = tiles.TileRenderer(make_quakes([5.5, 7.0]), cache_folder=str(tmp_path))
+
+    png = renderer.tile('hazard', 4, 12, 7)
+    assert png.startswith(b"\x89PNG") and png != tiles.EMPTY_TILE
+    assert renderer.tile('density', 3, 0, 0) == tiles.EMPTY_TILE
+    assert tiles.precompute_tiles(renderer, max_zoom=1) == 10
+    assert os.path.exists(renderer.tile_path('density', 1, 1, 0))
+
+    # the same catalog reads its tiles back, a changed one starts a new cache
+    again = tiles.TileRenderer(make_quakes([5.5, 7.0]), cache_folder=str(tmp_path))
+    assert again.version == renderer.version
+    assert again.tile('hazard', 4, 12, 7) == png
+    changed = tiles.TileRenderer(make_quakes([5.5, 7.5]), cache_folder=str(tmp_path))
+    changed.tile('hazard', 4, 12, 7)
+    # the old version may still be served by another worker, it goes once it is stale
+    assert sorted(os.listdir(tmp_path)) == sorted([renderer.version, changed.version])
+    old = time.time() - tiles.PRUNE_AFTER_SECONDS - 1
+    os.utime(os.path.join(str(tmp_path), renderer.version), (old, old))
+    tiles.TileRenderer(make_quakes([5.5, 7.5]), cache_folder=str(tmp_path))
+    assert os.listdir(tmp_path) == [changed.version]
+
+def test_tiles_from_many_threads(tmp_path):
+    renderer = tiles.TileRenderer(make_quakes([5.5, 7.0]), cache_folder=str(tmp_path), max_cached=3)
+    keys = [('density', 2, x, y) for x in range(4) for y in range(4)] * 4
+    expected = {key: tiles.TileRenderer(make_quakes([5.5, 7.0])).tile(*key) for key in set(keys)}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        pngs = list(pool.map(lambda key: renderer.tile(*key), keys))
+
+    assert pngs == [expected[key] for key in keys]
+    assert len(renderer.cached) <= 3
+    leftovers = [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith(".tmp")]
+    assert leftovers == []
+
+def test_unknown_tiles():
+    renderer = tiles.TileRenderer(make_quakes([5.5]))
+    with pytest.raises(ValueError):
+        renderer.tile('rainfall', 0, 0, 0)
+    with pytest.raises(ValueError):
+        renderer.tile('hazard', 2, 4, 0)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from benchmarks.bench_map import make_points
+from earthquake_exposure import viz
+
+def test_city_markers_join_exposure_once():
+    cities, _, exposure = make_points(20)
+    exposure = exposure.iloc[:5]
+
+    markers = viz.city_markers(cities, exposure)
+
+    assert len(markers) == 5
+    assert markers['popup'].iloc[0].startswith("city_0: ")
+    assert set(markers['color']) <= {'blue', 'orange', 'red'}
+
+def test_small_map_is_one_geojson_layer():
+    cities, quakes, exposure = make_points(200)
+
+    html = viz.generate_interactive_map(cities, quakes, exposure).get_root().render()
+
+    assert html.count("L.circleMarker(") < 10
+    assert "markerClusterGroup" not in html
+
+@pytest.mark.parametrize("mode, expected", [("cluster", "markerClusterGroup"), ("heatmap", "L.heatLayer")])
+def test_large_map_switches_mode(mode, expected):
+    cities, quakes, exposure = make_points(200)
+
+    html = viz.generate_interactive_map(cities, quakes, exposure, max_markers=50,
+                                        large_mode=mode).get_root().render()
+
+    assert expected in html
+
+def test_unknown_large_mode():
+    cities, quakes, exposure = make_points(10)
+    with pytest.raises(ValueError):
+        viz.generate_interactive_map(cities, quakes, exposure, large_mode='dots')
+
+def test_hexbin_keeps_every_quake():
+    _, quakes, _ = make_points(2000)
+    lon, lat = quakes.geometry.x.to_numpy(), quakes.geometry.y.to_numpy()
+
+    bins = viz.hexbin_quakes(lon, lat, quakes['mag'].to_numpy(), size_deg=2.0)
+
+    assert bins['count'].sum() == len(quakes)
+    assert bins['max_mag'].max() == quakes['mag'].max()
+    # every quake is within one hexagon radius of some centre
+    dist = np.hypot(lon[:, None] - bins['lon'].to_numpy(), lat[:, None] - bins['lat'].to_numpy()).min(axis=1)
+    assert dist.max() <= 2.0 / np.sqrt(3) + 1e-9
+
+def test_plotly_map_bins_large_catalogs():
+    cities, quakes, exposure = make_points(400)
+
+    small = viz.generate_plotly_map(cities, quakes, exposure)
+    large = viz.generate_plotly_map(cities, quakes, exposure, max_quake_points=100)
+
+    assert small.data[0].name == 'Earthquakes'
+    assert large.data[0].name == 'Earthquakes (binned)'
+    assert len(large.data[0].lat) < len(quakes)
+    assert small.data[1].text[0].startswith("<b>city_")